@@ -1,12 +1,14 @@
 import os
+import time
+import uuid
 import logging
 from datetime import datetime
-from flask import Flask, session
+from flask import Flask, session, g, request
 from flask_login import LoginManager
 from dotenv import load_dotenv
 
 # Import SQLAlchemy instantie
-from database import db
+from database import db, build_engine_options
 
 # Load environment variables from .env file
 load_dotenv()
@@ -28,24 +30,8 @@ standard_formatter = logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-# Aangepaste JSON formatter klasse
-class JsonFormatter(logging.Formatter):
-    def format(self, record):
-        log_data = {
-            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
-            'level': record.levelname,
-            'logger': record.name,
-            'message': record.getMessage(),
-            'path': record.pathname,
-            'line': record.lineno,
-            'function': record.funcName
-        }
-        
-        if record.exc_info:
-            log_data['exception'] = str(record.exc_info[1])
-            
-        return json.dumps(log_data)
-
+# JSON formatter (zie log_formatter.py; gebruikt orjson als dat beschikbaar is)
+from log_formatter import JsonFormatter, RequestContextFilter
 json_formatter = JsonFormatter()
 
 # Console handler voor ontwikkeling
@@ -84,6 +70,17 @@ error_handler.setLevel(logging.ERROR)
 error_handler.setFormatter(standard_formatter)
 logger.addHandler(error_handler)
 
+# Schrijf logs via een wachtrij op een achtergrondthread, zodat formatteren en
+# bestands-I/O niet op de request-thread gebeuren (uitschakelen met LOG_ASYNC=false)
+# Request-id, werkruimte en latency aan records hangen op de thread van het request
+request_context_filter = RequestContextFilter()
+if os.environ.get("LOG_ASYNC", "true").lower() != "false":
+    from log_pipeline import setup_queue_logging
+    queue_handler = setup_queue_logging(logger, [console_handler, file_handler, json_handler, error_handler])
+    queue_handler.addFilter(request_context_filter)
+else:
+    json_handler.addFilter(request_context_filter)
+
 # Log de MS Graph API configuratiegegevens (alleen voor debug)
 logging.info(f"MS_GRAPH_CLIENT_ID: {'Ingesteld' if os.environ.get('MS_GRAPH_CLIENT_ID') else 'Niet ingesteld'}")
 logging.info(f"MS_GRAPH_CLIENT_SECRET: {'Ingesteld' if os.environ.get('MS_GRAPH_CLIENT_SECRET') else 'Niet ingesteld'}")
@@ -108,14 +105,19 @@ app.secret_key = session_secret
 # Configure database
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# Poolinstellingen via DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT en DB_POOL_RECYCLE
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 # Initialize database with the app
 db.init_app(app)
 
+# Optioneel: server-side sessies, zodat de cookie alleen een sessie-id bevat
+# SESSION_BACKEND: 'cookie' (standaard), 'database' of 'sqlite'
+session_backend = os.environ.get("SESSION_BACKEND", "cookie").lower()
+if session_backend != "cookie":
+    from server_session import init_server_session
+    init_server_session(app, session_backend, db)
+
 # Initialize Flask-Login
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
@@ -125,13 +127,27 @@ login_manager.login_message_category = 'info'
 @login_manager.user_loader
 def load_user(user_id):
     from models import User
-    return User.query.get(int(user_id))
+    from sqlalchemy.orm import joinedload
+    # Laad de permissies in dezelfde query, zodat permissiecontroles geen extra query doen
+    return User.query.options(joinedload(User.permissions)).filter_by(id=int(user_id)).first()
+
+# Request-id en starttijd voor de gestructureerde logs (request_id en latency_ms)
+@app.before_request
+def assign_request_id():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.request_started = time.perf_counter()
 
 # Context processor toevoegen om huidige jaar beschikbaar te maken in alle templates
 @app.context_processor
 def inject_year():
     return {'current_year': datetime.now().year}
 
+# Permissiecontrole in templates, via dezelfde request-snapshot als de decorators
+@app.context_processor
+def inject_permissions():
+    from utils import check_permission
+    return {'has_permission': check_permission}
+
 def init_sample_data():
     """Function to add sample data to the database if none exists"""
     # Import here to avoid circular imports
@@ -269,6 +285,20 @@ def initialize_app():
         # Create all tables
         db.create_all()
         
+        # Indexen die een bestaande tabel nodig hebben (na create_all)
+        try:
+            from migrate_database import (
+                migrate_customer_search_indexes, migrate_whmcs_sync_state, migrate_whmcs_unique_indexes,
+                migrate_email_outbox, migrate_server_sessions
+            )
+            migrate_customer_search_indexes()
+            migrate_whmcs_sync_state()
+            migrate_whmcs_unique_indexes()
+            migrate_email_outbox()
+            migrate_server_sessions()
+        except Exception as e:
+            app.logger.error(f"Fout bij aanmaken van zoekindexen: {str(e)}")
+        
         # Create default admin user
         create_default_admin()
         
@@ -276,5 +306,13 @@ def initialize_app():
         from whmcs_routes import whmcs_bp
         app.register_blueprint(whmcs_bp)
         
+        # WHMCS-synchronisatie op de achtergrond (handmatig en automatisch)
+        from whmcs_sync_runner import whmcs_sync_runner
+        whmcs_sync_runner.start(app)
+        
+        # Wachtrij voor uitgaande e-mail
+        from email_outbox import email_outbox
+        email_outbox.start(app)
+        
         # Tijdelijk uitgeschakeld om opstart te versnellen
         # init_sample_data()
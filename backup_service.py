@@ -13,7 +13,7 @@ import tempfile
 import zipfile
 import uuid
 import traceback
-from sqlalchemy import create_engine, inspect, MetaData, Table, select, text
+from sqlalchemy import inspect, MetaData, Table, select, text
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.utils import secure_filename
 
@@ -397,15 +397,16 @@ class BackupService:
                 with open(backup_path, 'r') as f:
                     data = json.load(f)
                 
-                # Metadata initialiseren
-                metadata = MetaData()
-                metadata.reflect(bind=self.db.engine)
-                
-                # Transactie voor atomaire operatie
+                # Transactie voor atomaire operatie; gebruik één verbinding uit de
+                # gedeelde pool van de app voor zowel reflectie als herstel
                 connection = self.db.engine.connect()
                 trans = connection.begin()
                 
                 try:
+                    # Metadata initialiseren
+                    metadata = MetaData()
+                    metadata.reflect(bind=connection)
+                    
                     for table_name, rows in data.items():
                         if selected_tables and table_name not in selected_tables:
                             continue
@@ -0,0 +1,204 @@
+"""
+Server-side opslag voor resultaten van bulk uploads.
+
+De resultaten van een bulk upload (herkende facturen, te controleren bestanden,
+fouten) kunnen groot worden. In plaats van ze in de sessiecookie te bewaren,
+slaan we ze per job op als JSON-bestand en bewaren we alleen het job-id in de
+sessie. Verlopen resultaten worden automatisch opgeruimd.
+"""
+import os
+import re
+import json
+import math
+import time
+import uuid
+import logging
+import tempfile
+import threading
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Secties van een bulk upload resultaat
+RESULT_SECTIONS = ('saved_files', 'recognized_invoices', 'new_customers', 'manual_review', 'errors')
+
+# Job-id's zijn uuid4 hex strings; alles anders weigeren we (voorkomt path traversal)
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def empty_results():
+    """Geef een leeg resultaatobject terug met alle secties"""
+    return {section: [] for section in RESULT_SECTIONS}
+
+
+class BulkUploadResultStore:
+    """
+    Bewaart bulk upload resultaten op schijf, geïndexeerd op job-id.
+
+    Elk resultaat wordt in een eigen bestand opgeslagen zodat alle gunicorn
+    workers het kunnen lezen. Bestanden ouder dan de TTL worden verwijderd.
+    """
+
+    def __init__(self, storage_dir=None, ttl_seconds=None, sweep_interval=300):
+        """
+        Initialiseer de result store
+
+        Args:
+            storage_dir: Map voor de resultaatbestanden (standaard BULK_UPLOAD_RESULTS_DIR)
+            ttl_seconds: Bewaartermijn in seconden (standaard BULK_UPLOAD_RESULTS_TTL of 24 uur)
+            sweep_interval: Minimale tijd in seconden tussen twee opruimrondes
+        """
+        self.storage_dir = storage_dir or os.environ.get(
+            "BULK_UPLOAD_RESULTS_DIR", os.path.join("instance", "bulk_upload_results")
+        )
+        self.ttl_seconds = ttl_seconds or int(os.environ.get("BULK_UPLOAD_RESULTS_TTL", 24 * 3600))
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0
+        self._lock = threading.Lock()
+
+    def _path_for(self, job_id):
+        """Bepaal het bestandspad voor een job-id, of None bij een ongeldig id"""
+        if not job_id or not _JOB_ID_PATTERN.match(job_id):
+            return None
+        return os.path.join(self.storage_dir, f"{job_id}.json")
+
+    def save(self, results, owner_id=None):
+        """
+        Sla een resultaat op en geef het nieuwe job-id terug
+
+        Args:
+            results: Dict met de resultaatsecties
+            owner_id: ID van de gebruiker die de upload deed
+
+        Returns:
+            str: Het job-id
+        """
+        os.makedirs(self.storage_dir, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        payload = {
+            'job_id': job_id,
+            'owner_id': owner_id,
+            'created_at': time.time(),
+            'results': {section: results.get(section, []) for section in RESULT_SECTIONS}
+        }
+
+        # Eerst naar een tijdelijk bestand schrijven en dan atomair hernoemen,
+        # zodat een andere worker nooit een half geschreven bestand leest
+        fd, temp_path = tempfile.mkstemp(dir=self.storage_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, default=str)
+            os.replace(temp_path, self._path_for(job_id))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self.sweep_expired()
+        return job_id
+
+    def load(self, job_id, owner_id=None):
+        """
+        Laad een volledig resultaat
+
+        Args:
+            job_id: Het job-id
+            owner_id: Indien opgegeven moet het resultaat van deze gebruiker zijn
+
+        Returns:
+            dict of None: De resultaatsecties, of None als niet gevonden/verlopen
+        """
+        path = self._path_for(job_id)
+        if not path or not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Kan bulk upload resultaat {job_id} niet lezen: {str(e)}")
+            return None
+
+        if time.time() - payload.get('created_at', 0) > self.ttl_seconds:
+            self.delete(job_id)
+            return None
+
+        if owner_id is not None and payload.get('owner_id') != owner_id:
+            logger.warning(f"Gebruiker {owner_id} probeerde bulk upload resultaat {job_id} van een andere gebruiker te openen")
+            return None
+
+        results = empty_results()
+        results.update(payload.get('results', {}))
+        return results
+
+    def delete(self, job_id):
+        """Verwijder een opgeslagen resultaat"""
+        path = self._path_for(job_id)
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Kan bulk upload resultaat {job_id} niet verwijderen: {str(e)}")
+
+    def sweep_expired(self, force=False):
+        """
+        Verwijder verlopen resultaatbestanden
+
+        Args:
+            force: Negeer het minimale interval tussen opruimrondes
+
+        Returns:
+            int: Aantal verwijderde bestanden
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < self.sweep_interval:
+                return 0
+            self._last_sweep = now
+
+        if not os.path.exists(self.storage_dir):
+            return 0
+
+        removed = 0
+        for file_name in os.listdir(self.storage_dir):
+            file_path = os.path.join(self.storage_dir, file_name)
+            try:
+                if now - os.path.getmtime(file_path) > self.ttl_seconds:
+                    os.remove(file_path)
+                    removed += 1
+            except OSError:
+                # Bestand is mogelijk al door een andere worker verwijderd
+                continue
+
+        if removed:
+            logger.info(f"{removed} verlopen bulk upload resultaten opgeruimd")
+        return removed
+
+
+def paginate_section(items, page, per_page):
+    """
+    Pagineer een lijst met resultaten
+
+    Args:
+        items: De volledige lijst
+        page: Paginanummer (1-based)
+        per_page: Aantal items per pagina
+
+    Returns:
+        dict: items, page, per_page, total en pages
+    """
+    total = len(items)
+    pages = max(1, math.ceil(total / per_page))
+    page = min(max(1, page), pages)
+    start = (page - 1) * per_page
+    return {
+        'items': items[start:start + per_page],
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': pages
+    }
+
+
+# Singleton instantie
+bulk_upload_store = BulkUploadResultStore()
@@ -2,8 +2,12 @@
 Database configuratie module om de SQLAlchemy instantie te centraliseren
 en circulaire importen tussen app.py en models.py te voorkomen.
 """
+import os
+import time
 import logging
+import threading
 from sqlalchemy import inspect
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 
 # Configureer logging
@@ -12,6 +16,106 @@ logger = logging.getLogger(__name__)
 # Maak een SQLAlchemy instantie die later aan de app wordt gekoppeld
 db = SQLAlchemy()
 
+
+class PoolMetrics:
+    """Thread-safe tellers voor het wachten op verbindingen uit de pool (per proces)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+    
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait / attempts * 1000, 3) if attempts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3)
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool die meet hoe lang een checkout op een vrije verbinding wacht"""
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+def build_engine_options(database_uri=None):
+    """
+    Stel de engine/pool opties samen op basis van omgevingsvariabelen.
+    
+    Per gunicorn worker kunnen maximaal DB_POOL_SIZE + DB_MAX_OVERFLOW verbindingen
+    open staan; houd workers x dat aantal onder max_connections van PostgreSQL.
+    """
+    options = {
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 300)),
+        "pool_pre_ping": True,
+    }
+    
+    # SQLite (bijv. lokaal testen) gebruikt geen QueuePool-instellingen
+    if database_uri and database_uri.startswith("sqlite"):
+        return options
+    
+    options.update({
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+    })
+    return options
+
+
+def get_pool_stats(engine):
+    """
+    Verzamel statistieken van de verbindingspool van deze worker
+    
+    Returns:
+        dict: Pool grootte, uitgecheckte verbindingen, overflow en wachttijden
+    """
+    pool = engine.pool
+    stats = {
+        'pid': os.getpid(),
+        'pool_class': type(pool).__name__,
+        'status': pool.status(),
+    }
+    
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'pool_size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'pool_timeout': pool.timeout(),
+        })
+    
+    stats.update(pool_metrics.snapshot())
+    return stats
+
 def refresh_table_metadata(engine, table_name):
     """
     Vernieuw de metadata voor een specifieke tabel.
@@ -0,0 +1,311 @@
+"""
+Wachtrij (outbox) voor uitgaande e-mail.
+
+Routes die een e-mail versturen (uitnodigingen, ...) hoeven niet meer te
+wachten op een SMTP-login of een Microsoft Graph-verzoek. Het volledig
+opgemaakte bericht wordt in de tabel email_outbox gezet en een achtergrond-
+thread per proces verstuurt het via een kleine pool van verzendthreads:
+
+- Berichten worden met SELECT ... FOR UPDATE SKIP LOCKED opgepakt, zodat
+  meerdere gunicorn-workers de wachtrij samen kunnen afwerken zonder een
+  bericht dubbel te versturen.
+- Een mislukte verzending wordt opnieuw geprobeerd met oplopende wachttijd
+  (EMAIL_OUTBOX_RETRY_SECONDS, verdubbeld per poging, maximaal een uur) tot
+  EMAIL_OUTBOX_MAX_ATTEMPTS pogingen; daarna krijgt het bericht status 'failed'.
+- Berichten die te lang op 'sending' blijven staan (het proces is gestopt
+  tijdens het versturen) worden na EMAIL_OUTBOX_STALE_SECONDS opnieuw opgepakt.
+- Verzonden berichten worden na EMAIL_OUTBOX_RETENTION_DAYS opgeruimd.
+
+Bijlagen worden als pad opgeslagen; de bestanden moeten blijven bestaan tot
+het bericht verzonden is.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, func
+from database import db
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Aantal berichten dat per proces tegelijk verstuurd wordt
+EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS', 4))
+
+# Hoe vaak de wachtrij gecontroleerd wordt als er niets in dit proces is toegevoegd
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', 5))
+
+# Herhaalpogingen: maximum en wachttijd na de eerste mislukte poging
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_RETRY_SECONDS = int(os.environ.get('EMAIL_OUTBOX_RETRY_SECONDS', 60))
+EMAIL_OUTBOX_MAX_RETRY_SECONDS = 3600
+
+# Na deze tijd wordt een bericht dat op 'sending' staat opnieuw opgepakt
+EMAIL_OUTBOX_STALE_SECONDS = int(os.environ.get('EMAIL_OUTBOX_STALE_SECONDS', 600))
+
+# Bewaartermijn van verzonden berichten
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get('EMAIL_OUTBOX_RETENTION_DAYS', 30))
+
+# Hoe vaak verzonden berichten opgeruimd worden
+CLEANUP_INTERVAL_SECONDS = 3600
+
+
+class EmailOutboxWorker:
+    """Verstuurt berichten uit de e-mailwachtrij op de achtergrond"""
+
+    def __init__(self, workers=None, poll_seconds=None):
+        """
+        Args:
+            workers: Aantal verzendthreads (standaard EMAIL_OUTBOX_WORKERS)
+            poll_seconds: Seconden tussen twee controles (standaard EMAIL_OUTBOX_POLL_SECONDS)
+        """
+        self.workers = max(1, workers or EMAIL_OUTBOX_WORKERS)
+        self.poll_seconds = poll_seconds or EMAIL_OUTBOX_POLL_SECONDS
+        self._app = None
+        self._thread = None
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stats = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    def start(self, app):
+        """
+        Start de achtergrondthread (opnieuw, als die na een fork niet meer bestaat)
+
+        Args:
+            app: Flask applicatie
+        """
+        with self._lock:
+            self._app = app
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='email-outbox')
+            self._in_flight = 0
+            self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+            self._thread.start()
+        logger.info(f"E-mailwachtrij gestart met {self.workers} verzendthreads")
+
+    def enqueue(self, recipient, subject, body_html, cc=None, attachments=None, workspace_id=None, kind=None):
+        """
+        Zet een bericht in de wachtrij (en commit)
+
+        Args:
+            recipient: E-mailadres van de ontvanger
+            subject: Onderwerp
+            body_html: HTML inhoud
+            cc: Carbon copy ontvangers (string of lijst, optioneel)
+            attachments: Lijst van bijlagen, elk een dict met 'path' en 'filename' (optioneel)
+            workspace_id: Werkruimte waarvan de e-mailinstellingen gebruikt worden (None = systeem)
+            kind: Soort bericht, bijv. de naam van het template (optioneel)
+
+        Returns:
+            EmailOutbox: Het opgeslagen bericht
+        """
+        from flask import current_app
+        from models import EmailOutbox
+
+        if isinstance(cc, str):
+            cc = [cc]
+        message = EmailOutbox(
+            workspace_id=workspace_id,
+            kind=kind,
+            recipient=recipient,
+            cc=json.dumps(cc) if cc else None,
+            subject=subject,
+            body_html=body_html,
+            attachments=json.dumps(attachments) if attachments else None,
+            status='pending',
+            attempts=0,
+            max_attempts=EMAIL_OUTBOX_MAX_ATTEMPTS,
+            next_attempt_at=datetime.now()
+        )
+        db.session.add(message)
+        db.session.commit()
+
+        self.start(current_app._get_current_object())
+        self._wakeup.set()
+        logger.info(f"E-mail '{kind or subject}' naar {recipient} in de wachtrij gezet (id {message.id})")
+        return message
+
+    def get_stats(self):
+        """
+        Geef de toestand van de wachtrij (alle processen) en de tellers van dit proces
+
+        Returns:
+            dict: Aantal berichten per status, oudste wachtende bericht, laatste fouten en procestellers
+        """
+        from models import EmailOutbox
+
+        counts = dict(db.session.query(EmailOutbox.status, func.count()).group_by(EmailOutbox.status).all())
+        oldest_pending = db.session.query(func.min(EmailOutbox.created_at)).filter(
+            EmailOutbox.status.in_(('pending', 'sending'))
+        ).scalar()
+        recent_failures = EmailOutbox.query.filter(
+            EmailOutbox.last_error.isnot(None), EmailOutbox.status != 'sent'
+        ).order_by(EmailOutbox.updated_at.desc().nullslast()).limit(10).all()
+
+        with self._lock:
+            process = dict(self._stats, in_flight=self._in_flight)
+        return {
+            'pid': os.getpid(),
+            'counts': {status: counts.get(status, 0) for status in ('pending', 'sending', 'sent', 'failed')},
+            'oldest_pending': oldest_pending.strftime('%Y-%m-%d %H:%M:%S') if oldest_pending else None,
+            'recent_failures': [
+                {
+                    'id': message.id,
+                    'kind': message.kind,
+                    'recipient': message.recipient,
+                    'status': message.status,
+                    'attempts': message.attempts,
+                    'last_error': message.last_error
+                }
+                for message in recent_failures
+            ],
+            'process': process
+        }
+
+    def _run(self):
+        next_cleanup = time.monotonic()
+        while True:
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+            with self._app.app_context():
+                try:
+                    # Blijven ophalen zolang er berichten klaarstaan en er plaats is in de pool
+                    while True:
+                        with self._lock:
+                            capacity = self.workers * 2 - self._in_flight
+                        if capacity <= 0:
+                            break
+                        message_ids = self._claim(capacity)
+                        if not message_ids:
+                            break
+                        for message_id in message_ids:
+                            with self._lock:
+                                self._in_flight += 1
+                            self._executor.submit(self._deliver, message_id)
+
+                    if time.monotonic() >= next_cleanup:
+                        next_cleanup = time.monotonic() + CLEANUP_INTERVAL_SECONDS
+                        self._cleanup()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Fout in de e-mailwachtrij: {str(e)}")
+
+    def _claim(self, limit):
+        """
+        Pak berichten op die verstuurd moeten worden en zet ze op 'sending'
+
+        Returns:
+            list: ID's van de opgepakte berichten
+        """
+        from models import EmailOutbox
+
+        now = datetime.now()
+        stale = now - timedelta(seconds=EMAIL_OUTBOX_STALE_SECONDS)
+        messages = (
+            EmailOutbox.query
+            .filter(or_(
+                and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+                and_(EmailOutbox.status == 'sending', EmailOutbox.locked_at < stale)
+            ))
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for message in messages:
+            message.status = 'sending'
+            message.locked_at = now
+            message.attempts += 1
+        db.session.commit()
+        return [message.id for message in messages]
+
+    def _deliver(self, message_id):
+        """Verstuur één bericht en leg het resultaat vast (draait in de pool)"""
+        from models import EmailOutbox
+
+        try:
+            with self._app.app_context():
+                message = db.session.get(EmailOutbox, message_id)
+                if message is None or message.status != 'sending':
+                    return
+
+                error = None
+                try:
+                    sent = self._service_for(message.workspace_id).send_email(
+                        message.recipient,
+                        message.subject,
+                        message.body_html,
+                        json.loads(message.cc) if message.cc else None,
+                        json.loads(message.attachments) if message.attachments else None
+                    )
+                    if not sent:
+                        error = 'De e-mailprovider kon het bericht niet versturen (zie logboek)'
+                except Exception as e:
+                    error = str(e)
+
+                self._record_result(message, error)
+        except Exception as e:
+            logger.error(f"Fout bij verwerken van e-mail {message_id} uit de wachtrij: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            # Er is weer plaats in de pool
+            self._wakeup.set()
+
+    def _service_for(self, workspace_id):
+        """EmailService met de instellingen van de werkruimte, of de systeeminstellingen"""
+        from email_service import EmailService
+        from settings_cache import settings_cache
+
+        settings = settings_cache.email_settings(workspace_id) if workspace_id else None
+        return EmailService(settings)
+
+    def _record_result(self, message, error):
+        now = datetime.now()
+        message.locked_at = None
+        if error is None:
+            message.status = 'sent'
+            message.sent_at = now
+            message.last_error = None
+            outcome = 'sent'
+            logger.info(f"E-mail {message.id} naar {message.recipient} verzonden (poging {message.attempts})")
+        elif message.attempts >= message.max_attempts:
+            message.status = 'failed'
+            message.last_error = error
+            outcome = 'failed'
+            logger.error(f"E-mail {message.id} naar {message.recipient} definitief mislukt na {message.attempts} pogingen: {error}")
+        else:
+            delay = min(EMAIL_OUTBOX_RETRY_SECONDS * 2 ** (message.attempts - 1), EMAIL_OUTBOX_MAX_RETRY_SECONDS)
+            message.status = 'pending'
+            message.next_attempt_at = now + timedelta(seconds=delay)
+            message.last_error = error
+            outcome = 'retried'
+            logger.warning(f"E-mail {message.id} naar {message.recipient} mislukt (poging {message.attempts}), "
+                           f"nieuwe poging over {delay} seconden: {error}")
+        db.session.commit()
+
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def _cleanup(self):
+        """Verwijder verzonden berichten die ouder zijn dan de bewaartermijn"""
+        from models import EmailOutbox
+
+        threshold = datetime.now() - timedelta(days=EMAIL_OUTBOX_RETENTION_DAYS)
+        removed = EmailOutbox.query.filter(
+            EmailOutbox.status == 'sent', EmailOutbox.sent_at < threshold
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if removed:
+            logger.info(f"{removed} verzonden e-mails uit de wachtrij verwijderd")
+
+
+# Singleton instantie
+email_outbox = EmailOutboxWorker()
@@ -6,14 +6,14 @@ Implementeert Microsoft Authentication Library (MSAL) voor authenticatie met Mic
 import os
 import json
 import logging
-import msal
 import requests
-import smtplib
-import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 from flask import url_for, current_app
+from msal_token_cache import token_cache
+from http_client import http_client
+from smtp_pool import smtp_pool
 
 # Logger configuratie
 logger = logging.getLogger(__name__)
@@ -43,8 +43,6 @@ class MSGraphProvider(EmailProvider):
         from app import app
         
         self.logger = logging.getLogger(__name__)
-        self._client_app = None
-        self._token = None
         
         # Standaardwaarden instellen
         self.client_id = None
@@ -93,7 +91,7 @@ class MSGraphProvider(EmailProvider):
             
     def _load_from_system_settings(self, app):
         """Laad instellingen uit omgevingsvariabelen en als fallback uit systeem instellingen"""
-        from models import EmailSettings
+        from settings_cache import settings_cache
         
         # Eerst proberen uit omgevingsvariabelen te laden
         self._load_from_environment()
@@ -103,8 +101,8 @@ class MSGraphProvider(EmailProvider):
             self.logger.info("Niet alle instellingen gevonden in omgevingsvariabelen, probeer instellingen uit database")
             with app.app_context():
                 try:
-                    # Systeem-instellingen ophalen (workspace_id=None)
-                    system_settings = EmailSettings.query.filter_by(workspace_id=None).first()
+                    # Systeem-instellingen ophalen (workspace_id=None), via de instellingencache
+                    system_settings = settings_cache.email_settings(None)
                     if system_settings and system_settings.use_ms_graph:
                         self._load_from_settings(system_settings)
                 except Exception as e:
@@ -140,14 +138,6 @@ class MSGraphProvider(EmailProvider):
             self.logger.error("Microsoft Graph API niet correct geconfigureerd")
             return None
         
-        if not self._client_app:
-            # MSAL confidential client initialiseren
-            self._client_app = msal.ConfidentialClientApplication(
-                client_id=self.client_id,
-                authority=self.authority,
-                client_credential=self.client_secret
-            )
-        
         # Controleer of alle benodigde velden zijn ingevuld
         if not self.client_id or not self.client_secret or not self.tenant_id:
             self.logger.error(f"Missende MS Graph instellingen: client_id={'aanwezig' if self.client_id else 'ontbreekt'}, "
@@ -159,15 +149,14 @@ class MSGraphProvider(EmailProvider):
         scopes = ["https://graph.microsoft.com/.default"]
         
         try:
-            # Log meer details voor debugging
-            self.logger.info(f"Verkrijgen van token voor tenant_id: {self.tenant_id}, client_id: {self.client_id[:5]}...")
-            
-            # Client credentials flow gebruiken (app-only authenticatie)
-            result = self._client_app.acquire_token_for_client(scopes=scopes)
+            # Client credentials flow gebruiken (app-only authenticatie); de gedeelde
+            # token cache hergebruikt tokens tot kort voor het verlopen
+            result = token_cache.acquire_token(self.tenant_id, self.client_id, self.client_secret, scopes)
             
             if "access_token" in result:
-                token_part = result["access_token"][:10] if result["access_token"] else "leeg"
-                self.logger.info(f"Microsoft Graph API toegangstoken succesvol verkregen: {token_part}...")
+                if result.get("token_source") != "cache":
+                    token_part = result["access_token"][:10] if result["access_token"] else "leeg"
+                    self.logger.info(f"Microsoft Graph API toegangstoken verkregen voor tenant_id {self.tenant_id}: {token_part}...")
                 return result["access_token"]
             else:
                 self.logger.error(f"Fout bij verkrijgen token: {result.get('error')}")
@@ -272,7 +261,7 @@ class MSGraphProvider(EmailProvider):
         try:
             # POST aanvraag naar Microsoft Graph API
             self.logger.info(f"Versturen naar endpoint: {endpoint}")
-            response = requests.post(endpoint, headers=headers, json=email_payload, verify=True)
+            response = http_client.request('msgraph', 'POST', endpoint, headers=headers, json=email_payload, verify=True)
             
             if response.status_code == 202:  # 202 Accepted betekent succes
                 self.logger.info(f"E-mail succesvol verzonden naar {recipient} via Microsoft Graph API")
@@ -458,7 +447,7 @@ class SMTPProvider(EmailProvider):
             
     def _load_from_system_settings(self, app):
         """Laad instellingen uit omgevingsvariabelen en als fallback uit systeem instellingen"""
-        from models import EmailSettings
+        from settings_cache import settings_cache
         
         # Eerst proberen uit omgevingsvariabelen te laden
         self._load_from_environment()
@@ -468,8 +457,8 @@ class SMTPProvider(EmailProvider):
             self.logger.info("Niet alle SMTP instellingen gevonden in omgevingsvariabelen, probeer instellingen uit database")
             with app.app_context():
                 try:
-                    # Systeem-instellingen ophalen (workspace_id=None)
-                    system_settings = EmailSettings.query.filter_by(workspace_id=None).first()
+                    # Systeem-instellingen ophalen (workspace_id=None), via de instellingencache
+                    system_settings = settings_cache.email_settings(None)
                     if system_settings and not system_settings.use_ms_graph:
                         self._load_from_settings(system_settings)
                 except Exception as e:
@@ -595,20 +584,20 @@ class SMTPProvider(EmailProvider):
                 self.logger.error(f"Fout bij toevoegen bijlage {attachment['filename']}: {str(e)}")
     
     def _send_via_smtp(self, msg, recipients):
-        """Verstuur het bericht via de SMTP server"""
-        if self.use_ssl:
-            # Voor SSL verbinding (meestal poort 465)
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(self.server, self.port, context=context) as server:
-                server.login(self.username, self.password)
-                server.sendmail(self.from_email, recipients, msg.as_string())
-        else:
-            # Voor niet-SSL verbinding (meestal poort 25 of 587)
-            with smtplib.SMTP(self.server, self.port) as server:
-                if self.use_tls:
-                    server.starttls()  # Upgrade naar TLS indien nodig
-                server.login(self.username, self.password)
-                server.sendmail(self.from_email, recipients, msg.as_string())
+        """Verstuur het bericht via de SMTP server (over een gedeelde, ingelogde verbinding)"""
+        smtp_pool.send(
+            {
+                'server': self.server,
+                'port': self.port,
+                'username': self.username,
+                'password': self.password,
+                'use_ssl': self.use_ssl,
+                'use_tls': self.use_tls
+            },
+            self.from_email,
+            recipients,
+            msg.as_string()
+        )
 
 class EmailService:
     """
@@ -616,16 +605,18 @@ class EmailService:
     Bepaalt automatisch welke provider te gebruiken op basis van instellingen.
     """
     
-    def __init__(self, email_settings=None):
+    def __init__(self, email_settings=None, use_outbox=False):
         """
         Initialiseer de EmailService
         
         Args:
             email_settings: EmailSettings model voor een specifieke workspace (optioneel)
                            Als None, worden de systeem-instellingen gebruikt
+            use_outbox: Berichten in de e-mailwachtrij zetten in plaats van direct te versturen
         """
         self.logger = logging.getLogger(__name__)
         self.email_settings = email_settings
+        self.use_outbox = use_outbox
         
         # Providers initialiseren
         self.ms_graph_provider = MSGraphProvider(email_settings)
@@ -645,7 +636,7 @@ class EmailService:
                 # Default naar MS Graph als geen van beide geconfigureerd zijn
                 self.use_ms_graph = True
     
-    def send_email(self, recipient, subject, body_html, cc=None, attachments=None):
+    def send_email(self, recipient, subject, body_html, cc=None, attachments=None, kind=None):
         """
         Verstuur een e-mail via de geselecteerde provider
         
@@ -655,14 +646,43 @@ class EmailService:
             body_html: HTML inhoud van de e-mail
             cc: Carbon copy ontvangers (optioneel), string of lijst
             attachments: Lijst van bijlagen (optioneel), elk een dict met 'path' en 'filename'
+            kind: Soort bericht voor de e-mailwachtrij (optioneel)
         
         Returns:
-            bool: True als verzending succesvol was, anders False
+            bool: True als verzending succesvol was (of het bericht in de wachtrij staat), anders False
         """
+        if self.use_outbox:
+            return self._queue_email(recipient, subject, body_html, cc, attachments, kind)
         if self.use_ms_graph:
             return self.ms_graph_provider.send(recipient, subject, body_html, cc, attachments)
         else:
             return self.smtp_provider.send(recipient, subject, body_html, cc, attachments)
+
+    def _queue_email(self, recipient, subject, body_html, cc=None, attachments=None, kind=None):
+        """
+        Zet een e-mail in de e-mailwachtrij; de achtergrondworker verstuurt hem
+        met de instellingen van dezelfde workspace
+        
+        Returns:
+            bool: True als het bericht in de wachtrij staat, anders False
+        """
+        from database import db
+        from email_outbox import email_outbox
+        
+        workspace_id = self.email_settings.workspace_id if self.email_settings else None
+        try:
+            email_outbox.enqueue(
+                recipient, subject, body_html,
+                cc=cc,
+                attachments=attachments,
+                workspace_id=workspace_id,
+                kind=kind
+            )
+            return True
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"Fout bij in de wachtrij zetten van e-mail naar {recipient}: {str(e)}")
+            return False
             
     def send_template_email(self, recipient, template_name, template_params, cc=None, attachments=None):
         """
@@ -678,43 +698,24 @@ class EmailService:
         Returns:
             bool: True als verzending succesvol was, anders False
         """
-        from models import EmailTemplate
+        from email_template_cache import email_template_cache
         from app import app
         
         with app.app_context():
-            # Zoek het template in de database
             try:
-                # Zoek eerst workspace-specifiek template indien email_settings een workspace heeft
-                if self.email_settings and self.email_settings.workspace_id:
-                    template = EmailTemplate.query.filter_by(
-                        workspace_id=self.email_settings.workspace_id,
-                        name=template_name
-                    ).first()
-                else:
-                    template = None
-                    
-                # Als geen workspace-specifiek template, zoek naar een systeem template
-                if not template:
-                    template = EmailTemplate.query.filter_by(
-                        workspace_id=None,
-                        name=template_name
-                    ).first()
-                    
-                if not template:
+                # Workspace-specifiek template indien email_settings een workspace heeft, anders het
+                # systeem template; opzoeken en compileren gaat via de templatecache
+                workspace_id = self.email_settings.workspace_id if self.email_settings else None
+                rendered = email_template_cache.render(workspace_id, template_name, template_params)
+                
+                if not rendered:
                     self.logger.error(f"E-mail template '{template_name}' niet gevonden")
                     return False
                 
-                # Vul template in met parameters
-                import jinja2
-                env = jinja2.Environment()
-                subject_template = env.from_string(template.subject)
-                body_template = env.from_string(template.body_html)
-                
-                subject = subject_template.render(**template_params)
-                body_html = body_template.render(**template_params)
+                subject, body_html = rendered
                 
                 # Verstuur de e-mail
-                return self.send_email(recipient, subject, body_html, cc, attachments)
+                return self.send_email(recipient, subject, body_html, cc, attachments, kind=template_name)
                 
             except Exception as e:
                 self.logger.error(f"Fout bij versturen template e-mail: {str(e)}")
@@ -801,7 +802,7 @@ class EmailService:
                 </html>
                 """
                 
-                return self.send_email(recipient_email, subject, body_html)
+                return self.send_email(recipient_email, subject, body_html, kind='workspace_invitation')
     
     def send_user_invitation(self, recipient_email, workspace_name, activation_token, inviter_name=None):
         """
@@ -898,7 +899,7 @@ class EmailService:
                 </html>
                 """
                 
-                return self.send_email(recipient_email, subject, body_html)
+                return self.send_email(recipient_email, subject, body_html, kind='user_invitation')
 
 # Helper klasse met statische methoden
 class EmailServiceHelper:
@@ -915,13 +916,13 @@ class EmailServiceHelper:
         Returns:
             EmailService: Nieuwe instantie met workspace-specifieke instellingen
         """
-        from models import EmailSettings
+        from settings_cache import settings_cache
         from app import app
         
         with app.app_context():
             try:
-                # Zoek workspace-specifieke instellingen
-                settings = EmailSettings.query.filter_by(workspace_id=workspace_id).first()
+                # Zoek workspace-specifieke instellingen (via de instellingencache)
+                settings = settings_cache.email_settings(workspace_id)
                 return EmailService(settings)
             except Exception as e:
                 logging.error(f"Fout bij maken van EmailService voor workspace {workspace_id}: {str(e)}")
@@ -42,13 +42,13 @@ class EmailServiceOAuth:
     def _initialize_provider(self):
         """Initialiseer de juiste OAuth provider op basis van instellingen"""
         try:
-            from models import EmailSettings
+            from settings_cache import settings_cache
             
             # Laad instellingen voor deze workspace indien opgegeven
             email_settings = None
             if self.workspace_id:
                 # Gebruik instellingen van deze specifieke workspace
-                email_settings = EmailSettings.query.filter_by(workspace_id=self.workspace_id).first()
+                email_settings = settings_cache.email_settings(self.workspace_id)
                 logger.debug(f"Workspace-specifieke e-mailinstellingen geladen voor workspace_id={self.workspace_id}")
             
             # Initialiseer Microsoft 365 OAuth provider
@@ -0,0 +1,97 @@
+"""
+Cache van gecompileerde e-mailtemplates.
+
+send_template_email compileerde onderwerp en inhoud van een template bij
+elke verzending opnieuw in een nieuwe jinja2-omgeving. Deze module compileert
+elk template één keer in een gedeelde, gesandboxte omgeving en bewaart het
+resultaat per proces in een LRU-cache, met (template-ID, updated_at) als
+sleutel: een gewijzigd template krijgt zo vanzelf een nieuwe sleutel.
+
+Welk template bij een werkruimte hoort (eigen template of het
+systeemtemplate) wordt opgezocht via settings_cache.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from jinja2.sandbox import SandboxedEnvironment
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Maximaal aantal gecompileerde templates per proces
+EMAIL_TEMPLATE_CACHE_SIZE = int(os.environ.get('EMAIL_TEMPLATE_CACHE_SIZE', 128))
+
+
+class EmailTemplateCache:
+    """LRU-cache van gecompileerde (onderwerp, inhoud)-paren per template"""
+
+    def __init__(self, maxsize=None):
+        """
+        Args:
+            maxsize: Maximaal aantal templates in de cache (standaard EMAIL_TEMPLATE_CACHE_SIZE)
+        """
+        self.maxsize = maxsize or EMAIL_TEMPLATE_CACHE_SIZE
+        # Templates mogen geen interne Python-attributen aanspreken
+        self.environment = SandboxedEnvironment()
+        self._compiled = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def render(self, workspace_id, name, params):
+        """
+        Zoek een template op en vul het in
+
+        Args:
+            workspace_id: Workspace ID, of None voor alleen het systeemtemplate
+            name: Naam van het template
+            params: Dict met parameters voor het template
+
+        Returns:
+            tuple: (onderwerp, HTML inhoud), of None als het template niet bestaat
+        """
+        from settings_cache import settings_cache
+
+        template = settings_cache.email_template(workspace_id, name)
+        if template is None:
+            return None
+        subject_template, body_template = self._get_compiled(template)
+        return subject_template.render(**params), body_template.render(**params)
+
+    def _get_compiled(self, template):
+        key = (template.id, template.updated_at)
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                self._stats['hits'] += 1
+                return compiled
+            self._stats['misses'] += 1
+
+        # Buiten de lock compileren; een dubbele compilatie bij gelijktijdige verzending kan geen kwaad
+        compiled = (
+            self.environment.from_string(template.subject or ''),
+            self.environment.from_string(template.body_html or '')
+        )
+        with self._lock:
+            self._compiled[key] = compiled
+            self._compiled.move_to_end(key)
+            while len(self._compiled) > self.maxsize:
+                self._compiled.popitem(last=False)
+                self._stats['evictions'] += 1
+        logger.debug(f"E-mailtemplate '{template.name}' (id {template.id}) gecompileerd")
+        return compiled
+
+    def clear(self):
+        """Verwijder alle gecompileerde templates"""
+        with self._lock:
+            self._compiled.clear()
+
+    def get_stats(self):
+        """Geef het aantal hits, misses, verwijderde en bewaarde templates terug"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._compiled))
+
+
+# Singleton instantie
+email_template_cache = EmailTemplateCache()
@@ -0,0 +1,166 @@
+"""
+Gedeelde HTTP-sessies voor externe integraties (WHMCS, Mollie, Microsoft Graph).
+
+Iedere integratie krijgt per proces één requests.Session met een eigen
+verbindingspool, zodat TCP- en TLS-verbindingen hergebruikt worden (keep-alive)
+in plaats van per API-aanroep opnieuw opgezet. Daarbovenop:
+
+- Automatisch opnieuw proberen met oplopende wachttijd bij 429 en 5xx.
+  POST-verzoeken worden alleen herhaald als de integratie dat veilig vindt
+  (WHMCS gebruikt alleen lees-acties) of bij 429, waarbij de server het
+  verzoek zeker niet verwerkt heeft.
+- Een standaard timeout voor verzoeken die er zelf geen opgeven.
+- Tellers per integratie (aantal verzoeken, fouten, latentie) voor het
+  logdashboard.
+"""
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Statuscodes waarbij een verzoek opnieuw geprobeerd wordt
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Standaard timeout (verbinden, lezen) in seconden
+DEFAULT_TIMEOUT = (
+    float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10)),
+    float(os.environ.get("HTTP_READ_TIMEOUT", 30))
+)
+
+
+class _IntegrationRetry(Retry):
+    """Retry die niet-idempotente verzoeken wel herhaalt bij 429 (Too Many Requests)"""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class HttpClientPool:
+    """Beheert één requests.Session per integratie"""
+
+    def __init__(self, pool_maxsize=None, retries=None, backoff_factor=None):
+        """
+        Args:
+            pool_maxsize: Maximaal aantal open verbindingen per host (standaard HTTP_POOL_MAXSIZE of 10)
+            retries: Maximaal aantal herhalingen (standaard HTTP_RETRIES of 3)
+            backoff_factor: Basis van de oplopende wachttijd (standaard HTTP_RETRY_BACKOFF of 0.5)
+        """
+        self.pool_maxsize = pool_maxsize or int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+        self.retries = retries if retries is not None else int(os.environ.get("HTTP_RETRIES", 3))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.environ.get("HTTP_RETRY_BACKOFF", 0.5))
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _create_session(self, retry_post):
+        allowed_methods = None if retry_post else Retry.DEFAULT_ALLOWED_METHODS
+        retry = _IntegrationRetry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=allowed_methods,
+            # De laatste respons teruggeven zodat de aanroeper de status zelf afhandelt
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def session(self, integration, retry_post=False):
+        """
+        Geef de gedeelde sessie van een integratie (wordt bij eerste gebruik aangemaakt)
+
+        Args:
+            integration: Naam van de integratie (bijv. 'whmcs')
+            retry_post: Of POST-verzoeken ook bij 5xx herhaald mogen worden
+
+        Returns:
+            requests.Session
+        """
+        with self._lock:
+            session = self._sessions.get(integration)
+            if session is None:
+                session = self._create_session(retry_post)
+                self._sessions[integration] = session
+                self._stats[integration] = {
+                    'requests': 0,
+                    'errors': 0,
+                    'client_errors': 0,
+                    'server_errors': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0
+                }
+            return session
+
+    def request(self, integration, method, url, retry_post=False, **kwargs):
+        """
+        Voer een verzoek uit via de sessie van een integratie
+
+        Args:
+            integration: Naam van de integratie
+            method: HTTP-methode
+            url: Volledige URL
+            retry_post: Of POST-verzoeken ook bij 5xx herhaald mogen worden
+            **kwargs: Doorgegeven aan requests.Session.request
+
+        Returns:
+            requests.Response
+
+        Raises:
+            requests.RequestException: Bij verbindingsfouten na alle herhalingen
+        """
+        session = self.session(integration, retry_post=retry_post)
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+
+        started = time.perf_counter()
+        response = None
+        try:
+            response = session.request(method, url, **kwargs)
+            return response
+        finally:
+            self._record(integration, (time.perf_counter() - started) * 1000, response)
+
+    def _record(self, integration, elapsed_ms, response):
+        with self._lock:
+            stats = self._stats[integration]
+            stats['requests'] += 1
+            stats['total_ms'] += elapsed_ms
+            if elapsed_ms > stats['max_ms']:
+                stats['max_ms'] = elapsed_ms
+            if response is None:
+                stats['errors'] += 1
+            elif response.status_code >= 500:
+                stats['server_errors'] += 1
+            elif response.status_code >= 400:
+                stats['client_errors'] += 1
+
+    def get_stats(self):
+        """
+        Geef de tellers per integratie van dit proces terug
+
+        Returns:
+            dict: Integratie -> requests, errors, client_errors, server_errors, avg_ms en max_ms
+        """
+        with self._lock:
+            result = {}
+            for integration, stats in self._stats.items():
+                stats = dict(stats)
+                total_ms = stats.pop('total_ms')
+                stats['avg_ms'] = round(total_ms / stats['requests'], 1) if stats['requests'] else 0
+                stats['max_ms'] = round(stats['max_ms'], 1)
+                result[integration] = stats
+            return result
+
+
+# Singleton instantie
+http_client = HttpClientPool()
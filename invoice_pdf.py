@@ -0,0 +1,462 @@
+"""
+PDF-generatie voor facturen met een cache op schijf.
+
+Facturen worden met WeasyPrint gerenderd op basis van
+templates/invoice_template.html. Het resultaat wordt bewaard onder een sleutel
+die afhangt van de factuur (id + updated_at), de klantgegevens op de factuur
+en de inhoud van het template. Zolang die niet wijzigen wordt een herhaalde
+download of e-mailbijlage uit de cache geserveerd in plaats van opnieuw
+gerenderd. De cache is begrensd in grootte; de minst recent gebruikte PDF's
+worden als eerste verwijderd.
+
+Voor een export van veel facturen tegelijk (bijv. een kwartaal voor de
+boekhouder) rendert iter_batch de ontbrekende PDF's parallel in een
+procespool; iter_zip streamt ze als ZIP zonder het archief in het geheugen
+op te bouwen.
+"""
+import os
+import time
+import atexit
+import hashlib
+import logging
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, date
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Template dat voor facturen gebruikt wordt
+INVOICE_TEMPLATE = 'invoice_template.html'
+
+# Blokgrootte bij het kopiëren van PDF's naar een ZIP-stream
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+def _write_atomic(directory, path, data):
+    """Schrijf bytes atomair weg zodat andere workers nooit een half bestand lezen"""
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _html_to_pdf(html, base_url, path):
+    """
+    Zet HTML om naar een PDF in de cache. Draait in een proces van de pool,
+    dus zonder Flask app context; alleen de (CPU-intensieve) WeasyPrint-stap.
+
+    Returns:
+        str: Pad naar het geschreven PDF-bestand
+    """
+    from weasyprint import HTML
+
+    pdf_bytes = HTML(string=html, base_url=base_url).write_pdf()
+    _write_atomic(os.path.dirname(path), path, pdf_bytes)
+    return path
+
+
+class _ZipStream:
+    """Niet-doorzoekbaar schrijfdoel voor zipfile; de geschreven bytes worden per blok opgehaald"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class InvoicePdfRenderer:
+    """Rendert factuur-PDF's en bewaart ze in een LRU-cache op schijf"""
+
+    def __init__(self, cache_dir=None, max_cache_bytes=None):
+        """
+        Initialiseer de renderer
+
+        Args:
+            cache_dir: Map voor de gecachete PDF's (standaard INVOICE_PDF_CACHE_DIR)
+            max_cache_bytes: Maximale grootte van de cache (standaard INVOICE_PDF_CACHE_MAX_MB of 200 MB)
+        """
+        self.cache_dir = cache_dir or os.environ.get(
+            "INVOICE_PDF_CACHE_DIR", os.path.join("instance", "pdf_cache")
+        )
+        self.max_cache_bytes = max_cache_bytes or int(os.environ.get("INVOICE_PDF_CACHE_MAX_MB", 200)) * 1024 * 1024
+        self.warmup_enabled = os.environ.get("INVOICE_PDF_WARMUP", "false").lower() == "true"
+        self.batch_workers = int(os.environ.get("INVOICE_PDF_WORKERS", min(4, os.cpu_count() or 1)))
+        self._pool = None
+        self._template_hash = None
+        self._template_mtime = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'renders': 0, 'evictions': 0}
+
+    def _template_path(self, app):
+        return os.path.join(app.root_path, app.template_folder, INVOICE_TEMPLATE)
+
+    def template_hash(self, app):
+        """Hash van de inhoud van het factuurtemplate (herberekend als het bestand wijzigt)"""
+        path = self._template_path(app)
+        mtime = os.path.getmtime(path)
+        if self._template_hash is None or mtime != self._template_mtime:
+            with open(path, 'rb') as f:
+                self._template_hash = hashlib.sha256(f.read()).hexdigest()
+            self._template_mtime = mtime
+        return self._template_hash
+
+    def cache_key(self, invoice, customer, app):
+        """
+        Bepaal de cachesleutel voor een factuur
+
+        Args:
+            invoice: Invoice model
+            customer: Customer model
+            app: Flask app (voor het template)
+
+        Returns:
+            str: Hex sleutel
+        """
+        parts = [
+            str(invoice.id),
+            str(invoice.updated_at or invoice.created_at),
+            str(customer.id),
+            str(customer.updated_at or customer.created_at),
+            self.template_hash(app)
+        ]
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def _cached_path(self, invoice, customer, app):
+        """Geef (pad, True) bij een cache hit, anders (pad waar de PDF moet komen, False)"""
+        path = self._cache_path(self.cache_key(invoice, customer, app))
+        if not os.path.exists(path):
+            return path, False
+        try:
+            # Tijdstempel bijwerken voor de LRU-volgorde
+            os.utime(path, None)
+        except OSError:
+            pass
+        with self._lock:
+            self._stats['hits'] += 1
+        return path, True
+
+    @staticmethod
+    def _invoice_data(invoice):
+        invoice_data = invoice.to_dict()
+        invoice_data['due_date'] = getattr(invoice, 'due_date', None)
+        return invoice_data
+
+    def render_html(self, invoice_data, customer_data):
+        """
+        Render het factuurtemplate naar HTML
+
+        Args:
+            invoice_data: Dict met factuurgegevens (Invoice.to_dict())
+            customer_data: Dict met klantgegevens (Customer.to_dict())
+
+        Returns:
+            str: HTML
+        """
+        from flask import render_template
+        from utils import format_currency
+
+        invoice_date = invoice_data.get('date')
+        if isinstance(invoice_date, str):
+            invoice_date = datetime.strptime(invoice_date, '%Y-%m-%d').date()
+        due_date = invoice_data.get('due_date')
+        if not due_date and isinstance(invoice_date, date):
+            due_date = invoice_date + timedelta(days=30)
+
+        return render_template(
+            INVOICE_TEMPLATE,
+            invoice=invoice_data,
+            customer=customer_data,
+            due_date=due_date.strftime('%Y-%m-%d') if isinstance(due_date, date) else due_date,
+            format_currency=format_currency,
+            now=datetime.now()
+        )
+
+    def render_pdf_bytes(self, invoice_data, customer_data):
+        """
+        Render een factuur naar PDF zonder cache
+
+        Returns:
+            bytes: PDF-inhoud
+        """
+        from flask import current_app
+        # WeasyPrint pas hier importeren: het laden duurt relatief lang
+        from weasyprint import HTML
+
+        html = self.render_html(invoice_data, customer_data)
+        with self._lock:
+            self._stats['renders'] += 1
+        return HTML(string=html, base_url=current_app.root_path).write_pdf()
+
+    def get_pdf_path(self, invoice, customer):
+        """
+        Geef het pad naar de PDF van een factuur, uit de cache of vers gerenderd
+
+        Args:
+            invoice: Invoice model
+            customer: Customer model
+
+        Returns:
+            str: Pad naar het PDF-bestand in de cache
+        """
+        from flask import current_app
+
+        path, cached = self._cached_path(invoice, customer, current_app)
+        if cached:
+            return path
+
+        pdf_bytes = self.render_pdf_bytes(self._invoice_data(invoice), customer.to_dict())
+        _write_atomic(self.cache_dir, path, pdf_bytes)
+
+        self.evict()
+        return path
+
+    def _get_pool(self):
+        """Procespool voor het renderen, pas bij de eerste batch gestart"""
+        with self._lock:
+            if self._pool is None:
+                # 'spawn' in plaats van fork: de gunicorn worker heeft al threads
+                # (o.a. de loglistener) die bij een fork in een lock kunnen hangen
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.batch_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                atexit.register(self._pool.shutdown, wait=False, cancel_futures=True)
+            return self._pool
+
+    def _reset_pool(self, pool):
+        """Vergeet een kapotte pool zodat de volgende batch een nieuwe start"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def iter_batch(self, items):
+        """
+        Geef de PDF's van meerdere facturen, de ontbrekende parallel gerenderd.
+
+        Gecachete PDF's komen eerst; de rest volgt in de volgorde waarin ze
+        klaar zijn. De templates worden in dit proces (met app context)
+        gerenderd, de omzetting naar PDF in de procespool. Er staan nooit meer
+        dan twee keer zoveel facturen uit als er workers zijn, zodat de HTML
+        van een grote batch niet in één keer in het geheugen staat.
+
+        Args:
+            items: Lijst met (Invoice, Customer) tuples
+
+        Yields:
+            tuple: (invoice, pad) of (invoice, None) als renderen mislukte
+        """
+        from flask import current_app
+
+        app = current_app._get_current_object()
+        todo = []
+        for invoice, customer in items:
+            path, cached = self._cached_path(invoice, customer, app)
+            if cached:
+                yield invoice, path
+            else:
+                todo.append((invoice, customer, path))
+
+        if not todo:
+            return
+
+        pool = self._get_pool()
+        max_in_flight = self.batch_workers * 2
+        todo_iter = iter(todo)
+        pending = {}
+        try:
+            while True:
+                while len(pending) < max_in_flight:
+                    item = next(todo_iter, None)
+                    if item is None:
+                        break
+                    invoice, customer, path = item
+                    html = self.render_html(self._invoice_data(invoice), customer.to_dict())
+                    pending[pool.submit(_html_to_pdf, html, app.root_path, path)] = invoice
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    invoice = pending.pop(future)
+                    try:
+                        path = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"Renderen van PDF voor factuur {invoice.invoice_number} mislukt: {str(e)}")
+                        yield invoice, None
+                        continue
+                    with self._lock:
+                        self._stats['renders'] += 1
+                    yield invoice, path
+        except BrokenProcessPool:
+            # Een worker is onverwacht gestopt; de volgende batch start een nieuwe pool
+            self._reset_pool(pool)
+            raise
+        finally:
+            # Bij een afgebroken download geen werk meer doen voor deze batch
+            for future in pending:
+                future.cancel()
+            self.evict()
+
+    def iter_zip(self, items):
+        """
+        Stream de PDF's van meerdere facturen als ZIP-archief.
+
+        Iedere PDF wordt in blokken uit de cache gekopieerd en direct
+        doorgegeven; het archief staat nooit in zijn geheel in het geheugen.
+        Facturen waarvan de PDF niet gerenderd kon worden staan in fouten.txt.
+
+        Args:
+            items: Lijst met (Invoice, Customer) tuples
+
+        Yields:
+            bytes: Opeenvolgende stukken van het ZIP-bestand
+        """
+        stream = _ZipStream()
+        names = set()
+        failed = []
+
+        # PDF's zijn al gecomprimeerd; opnieuw comprimeren kost alleen CPU
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for invoice, path in self.iter_batch(items):
+                if path is None:
+                    failed.append(invoice.invoice_number)
+                    continue
+
+                name = f"Factuur-{invoice.invoice_number}.pdf"
+                counter = 1
+                while name in names:
+                    counter += 1
+                    name = f"Factuur-{invoice.invoice_number}-{counter}.pdf"
+
+                try:
+                    source = open(path, 'rb')
+                except OSError as e:
+                    # Mogelijk net uit de cache verwijderd door een andere worker
+                    logger.warning(f"PDF voor factuur {invoice.invoice_number} niet meer beschikbaar: {str(e)}")
+                    failed.append(invoice.invoice_number)
+                    continue
+                names.add(name)
+
+                with source:
+                    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                    info.file_size = os.fstat(source.fileno()).st_size
+                    with archive.open(info, 'w') as target:
+                        while True:
+                            chunk = source.read(ZIP_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            target.write(chunk)
+                            yield stream.pop()
+
+            if failed:
+                archive.writestr(
+                    'fouten.txt',
+                    "PDF kon niet gemaakt worden voor de volgende facturen:\n" + "\n".join(failed) + "\n"
+                )
+
+        yield stream.pop()
+
+    def evict(self):
+        """
+        Verwijder de minst recent gebruikte PDF's tot de cache onder de limiet zit
+
+        Returns:
+            int: Aantal verwijderde bestanden
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.pdf'):
+                continue
+            file_path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_path))
+            total_size += stat.st_size
+
+        removed = 0
+        for _, size, file_path in sorted(entries):
+            if total_size <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(file_path)
+                total_size -= size
+                removed += 1
+            except OSError:
+                # Mogelijk al door een andere worker verwijderd
+                continue
+
+        if removed:
+            with self._lock:
+                self._stats['evictions'] += removed
+            logger.info(f"{removed} PDF's uit de factuurcache verwijderd")
+        return removed
+
+    def warm_up(self, invoice_id):
+        """
+        Render de PDF van een (nieuwe) factuur alvast op de achtergrond,
+        als INVOICE_PDF_WARMUP is ingeschakeld.
+
+        Args:
+            invoice_id: ID van de factuur
+        """
+        if not self.warmup_enabled:
+            return
+
+        from flask import current_app
+        app = current_app._get_current_object()
+
+        def render():
+            from models import Invoice, Customer
+            with app.app_context():
+                try:
+                    invoice = Invoice.query.get(invoice_id)
+                    customer = Customer.query.get(invoice.customer_id) if invoice else None
+                    if invoice and customer:
+                        self.get_pdf_path(invoice, customer)
+                except Exception as e:
+                    logger.warning(f"Voorverwarmen van PDF voor factuur {invoice_id} mislukt: {str(e)}")
+
+        threading.Thread(target=render, name='invoice-pdf-warmup', daemon=True).start()
+
+    def get_stats(self):
+        """Geef tellers van cache hits, renders en verwijderingen terug"""
+        with self._lock:
+            return dict(self._stats)
+
+
+# Singleton instantie
+invoice_pdf_renderer = InvoicePdfRenderer()
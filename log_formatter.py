@@ -0,0 +1,223 @@
+"""
+Gestructureerde (JSON) logformatter voor logs/app.json.log.
+
+Per record wordt zo weinig mogelijk opnieuw berekend: de hostnaam wordt één
+keer opgevraagd, het tijdstempel wordt per seconde gecachet en als orjson
+beschikbaar is wordt die gebruikt in plaats van de standaard json-module
+(instelbaar met LOG_JSON_BACKEND: auto, orjson of json). Zonder orjson wordt
+de JSON-regel rechtstreeks opgebouwd, met gecachete JSON-strings voor velden
+die steeds terugkomen (level, logger, pad, functie).
+
+Optioneel worden request_id, workspace_id en latency_ms toegevoegd. Die
+worden door RequestContextFilter op de thread van het request aan het record
+gehangen, zodat ze ook bij asynchrone logging (log_pipeline) kloppen.
+
+Benchmark tegen de vorige formatter: python log_formatter.py [aantal records]
+"""
+import os
+import json
+import time
+import socket
+import logging
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optionele velden die (via extra= of RequestContextFilter) aan een record kunnen hangen
+EXTRA_FIELDS = ('request_id', 'workspace_id', 'latency_ms')
+
+# C-implementatie van de stringcodering van de json-module (zelfde uitvoer als json.dumps)
+_encode_string = json.encoder.encode_basestring_ascii
+
+# Maximaal aantal gecachete JSON-strings per formatter
+ENCODED_CACHE_SIZE = 2048
+
+
+def _select_backend(name=None):
+    """Kies de JSON-encoder: orjson indien beschikbaar, anders de standaard json-module"""
+    name = (name or os.environ.get("LOG_JSON_BACKEND", "auto")).lower()
+    if name in ('auto', 'orjson') and orjson is not None:
+        return 'orjson', lambda data: orjson.dumps(data, default=str).decode('utf-8')
+    # Eén encoder hergebruiken; json.dumps met extra argumenten bouwt er per aanroep een nieuwe
+    encoder = json.JSONEncoder(default=str, separators=(',', ':'))
+    return 'json', encoder.encode
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatteert een logrecord als één JSON-regel"""
+
+    def __init__(self, backend=None):
+        """
+        Args:
+            backend: 'auto', 'orjson' of 'json' (standaard LOG_JSON_BACKEND)
+        """
+        super().__init__()
+        self.backend, self._dumps = _select_backend(backend)
+        self.hostname = socket.gethostname()
+        self._cached_prefix = (None, None)   # (seconde, 'YYYY-MM-DDTHH:MM:SS')
+        self._encoded = {}   # Waarde -> JSON-string, voor velden die steeds terugkomen
+        self._hostname_json = _encode_string(self.hostname)
+
+    def _timestamp(self, created):
+        """ISO 8601 tijdstempel in lokale tijd; het deel tot op de seconde wordt gecachet"""
+        second = int(created)
+        cached_second, prefix = self._cached_prefix
+        if second != cached_second:
+            # Seconde en voorvoegsel samen als één tuple toewijzen, zodat andere
+            # threads nooit een voorvoegsel van een andere seconde zien
+            prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second))
+            self._cached_prefix = (second, prefix)
+        return f"{prefix}.{int((created - second) * 1000000):06d}"
+
+    def _encode_cached(self, value):
+        encoded = self._encoded.get(value)
+        if encoded is None:
+            if len(self._encoded) >= ENCODED_CACHE_SIZE:
+                self._encoded.clear()
+            encoded = self._encoded[value] = _encode_string(value)
+        return encoded
+
+    def format(self, record):
+        if self.backend == 'json':
+            return self._format_json(record)
+
+        log_data = {
+            'timestamp': self._timestamp(record.created),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'path': record.pathname,
+            'line': record.lineno,
+            'function': record.funcName,
+            'hostname': self.hostname,
+            'pid': record.process
+        }
+
+        attributes = record.__dict__
+        for field in EXTRA_FIELDS:
+            value = attributes.get(field)
+            if value is not None:
+                log_data[field] = value
+
+        if record.exc_info:
+            log_data['exception'] = str(record.exc_info[1])
+
+        return self._dumps(log_data)
+
+    def _format_json(self, record):
+        """Zelfde uitvoer als format() met de json-module, zonder tussenliggende dict"""
+        encode = self._encode_cached
+        parts = [
+            '{"timestamp":"', self._timestamp(record.created),
+            '","level":', encode(record.levelname),
+            ',"logger":', encode(record.name),
+            ',"message":', _encode_string(record.getMessage()),
+            ',"path":', encode(record.pathname),
+            ',"line":', str(record.lineno),
+            ',"function":', encode(record.funcName) if record.funcName is not None else 'null',
+            ',"hostname":', self._hostname_json,
+            ',"pid":', str(record.process) if record.process is not None else 'null'
+        ]
+
+        attributes = record.__dict__
+        for field in EXTRA_FIELDS:
+            value = attributes.get(field)
+            if value is not None:
+                parts.append(f',"{field}":')
+                parts.append(_encode_string(value) if isinstance(value, str) else self._dumps(value))
+
+        if record.exc_info:
+            parts.append(',"exception":')
+            parts.append(_encode_string(str(record.exc_info[1])))
+
+        parts.append('}')
+        return ''.join(parts)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Voegt request_id, workspace_id en latency_ms toe aan records die tijdens
+    een request worden gelogd. Gebruikt alleen wat al in flask.g staat, zodat
+    loggen nooit zelf een databasequery veroorzaakt.
+    """
+
+    def filter(self, record):
+        from flask import g, has_request_context
+
+        if not has_request_context():
+            return True
+
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = g.get('request_id')
+        if getattr(record, 'workspace_id', None) is None:
+            # Flask-Login bewaart de geladen gebruiker in g._login_user
+            user = g.get('_login_user')
+            record.workspace_id = getattr(user, 'workspace_id', None)
+        if getattr(record, 'latency_ms', None) is None:
+            started = g.get('request_started')
+            if started is not None:
+                record.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        return True
+
+
+class _LegacyJsonFormatter(logging.Formatter):
+    """De vorige formatter uit app.py, alleen voor de benchmark"""
+
+    def format(self, record):
+        log_data = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'path': record.pathname,
+            'line': record.lineno,
+            'function': record.funcName
+        }
+
+        if record.exc_info:
+            log_data['exception'] = str(record.exc_info[1])
+
+        return json.dumps(log_data)
+
+
+def benchmark(count=100000):
+    """
+    Meet het aantal geformatteerde records per seconde
+
+    Args:
+        count: Aantal records per formatter
+
+    Returns:
+        dict: Naam van de formatter -> records per seconde
+    """
+    record = logging.LogRecord(
+        'routes', logging.INFO, __file__, 42,
+        "Factuur %s verwerkt voor klant %s", ('INV-2024-0001', 'Example Company BVBA'), None,
+        func='process_invoice'
+    )
+    record.request_id = '3f2a9c1d0b7e4a65'
+    record.workspace_id = 1
+
+    formatters = {'huidig (json)': _LegacyJsonFormatter(), 'nieuw (json)': JsonFormatter(backend='json')}
+    if orjson is not None:
+        formatters['nieuw (orjson)'] = JsonFormatter(backend='orjson')
+
+    results = {}
+    for name, formatter in formatters.items():
+        start = time.perf_counter()
+        for i in range(count):
+            record.created = 1700000000 + i / 1000
+            formatter.format(record)
+        results[name] = count / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for name, rate in benchmark(count).items():
+        print(f"{name:<16} {rate:>12,.0f} records/s")
@@ -0,0 +1,257 @@
+"""
+Incrementele index over de logbestanden.
+
+De statistieken op het logdashboard werden bij iedere aanvraag berekend door
+app.log en error.log volledig te herlezen. Deze index onthoudt per bestand de
+inode en de byte-offset tot waar gelezen is, en leest bij een volgende aanvraag
+alleen de nieuw toegevoegde regels. Daarbij worden tellers per logniveau en per
+dag bijgehouden, plus de laatste foutregels.
+
+De toestand staat in een JSON-bestand (LOG_INDEX_PATH) zodat alle gunicorn
+workers dezelfde index delen; een bestandslock voorkomt dat twee workers
+tegelijk dezelfde regels inlezen.
+"""
+import os
+import re
+import json
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Niet beschikbaar op Windows
+    fcntl = None
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Logniveaus die geteld worden (zelfde herkenning als voorheen: " NIVEAU " in de regel)
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# Regels die beginnen met een tijdstempel in het standaard logformaat
+_TIMESTAMP_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2}) \d{2}:\d{2}:\d{2},\d{3} - ')
+
+# Maximaal aantal bytes dat per aanroep per bestand wordt ingelezen
+MAX_INGEST_BYTES = 16 * 1024 * 1024
+
+
+def _empty_entry():
+    return {
+        'inode': None,
+        'offset': 0,
+        'levels': {level: 0 for level in LOG_LEVELS},
+        'days': {},
+        'recent': []
+    }
+
+
+class LogIndex:
+    """
+    Persistente index met tellers per logbestand.
+
+    Tellers per niveau gelden voor de inhoud van het huidige bestand en worden
+    bij rotatie opnieuw opgebouwd; de tellers per dag en de recente regels
+    blijven over rotaties heen behouden.
+    """
+
+    def __init__(self, logs_dir='logs', state_path=None, recent_limit=50, keep_days=30):
+        """
+        Initialiseer de log index
+
+        Args:
+            logs_dir: Map met de logbestanden
+            state_path: Pad van het indexbestand (standaard LOG_INDEX_PATH)
+            recent_limit: Aantal laatste gedateerde regels dat per bestand bewaard wordt
+            keep_days: Aantal dagen dat tellers per dag bewaard blijven
+        """
+        self.logs_dir = logs_dir
+        self.state_path = state_path or os.environ.get(
+            "LOG_INDEX_PATH", os.path.join("instance", "log_index.json")
+        )
+        self.recent_limit = recent_limit
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Log index is onleesbaar en wordt opnieuw opgebouwd: {str(e)}")
+            return {}
+
+    def _save_state(self, state):
+        directory = os.path.dirname(self.state_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _ingest_lines(self, entry, data):
+        """Verwerk een blok volledige regels in de tellers van een bestand"""
+        levels = entry['levels']
+        days = entry['days']
+        recent = entry['recent']
+        for raw_line in data.splitlines():
+            line = raw_line.decode('utf-8', errors='replace')
+            for level in LOG_LEVELS:
+                if f" {level} " in line:
+                    levels[level] += 1
+            match = _TIMESTAMP_PATTERN.match(line)
+            if match:
+                day = match.group(1)
+                days[day] = days.get(day, 0) + 1
+                recent.append([line[:23], line.strip()])
+        if len(recent) > self.recent_limit:
+            del recent[:-self.recent_limit]
+
+    def _read_from(self, path, offset):
+        """
+        Lees de volledige regels vanaf een offset
+
+        Returns:
+            tuple: (gelezen bytes, nieuwe offset)
+        """
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(MAX_INGEST_BYTES)
+        last_newline = data.rfind(b'\n')
+        if last_newline < 0:
+            return b'', offset
+        data = data[:last_newline + 1]
+        return data, offset + len(data)
+
+    def _update_entry(self, log_file, entry):
+        """Lees de nieuwe regels van één logbestand in"""
+        path = os.path.join(self.logs_dir, log_file)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return entry
+
+        if entry['inode'] != stat.st_ino or entry['offset'] > stat.st_size:
+            # Bestand is geroteerd of ingekort. Lees eerst de rest van het oude
+            # bestand (nu log_file.1) zodat er geen regels verloren gaan.
+            rotated_path = f"{path}.1"
+            if entry['inode'] is not None and os.path.exists(rotated_path) \
+                    and os.stat(rotated_path).st_ino == entry['inode']:
+                data, _ = self._read_from(rotated_path, entry['offset'])
+                self._ingest_lines(entry, data)
+            entry['inode'] = stat.st_ino
+            entry['offset'] = 0
+            entry['levels'] = {level: 0 for level in LOG_LEVELS}
+
+        # Blijf lezen tot we bij zijn (in blokken van MAX_INGEST_BYTES)
+        while entry['offset'] < stat.st_size:
+            data, new_offset = self._read_from(path, entry['offset'])
+            if new_offset == entry['offset']:
+                break
+            self._ingest_lines(entry, data)
+            entry['offset'] = new_offset
+
+        # Oude dagtellers opruimen
+        cutoff = (datetime.now() - timedelta(days=self.keep_days)).strftime('%Y-%m-%d')
+        for day in [day for day in entry['days'] if day < cutoff]:
+            del entry['days'][day]
+        return entry
+
+    def refresh(self, *log_files):
+        """
+        Werk de index bij voor de opgegeven bestanden en geef hun tellers terug
+
+        Args:
+            *log_files: Bestandsnamen binnen logs_dir (bijv. 'app.log')
+
+        Returns:
+            dict: Bestandsnaam -> index entry (inode, offset, levels, days, recent)
+        """
+        with self._lock:
+            lock_file = None
+            try:
+                if fcntl is not None:
+                    os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+                    lock_file = open(f"{self.state_path}.lock", 'w')
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                state = self._load_state()
+                changed = False
+                for log_file in log_files:
+                    entry = state.get(log_file) or _empty_entry()
+                    before = (entry['inode'], entry['offset'])
+                    state[log_file] = self._update_entry(log_file, entry)
+                    changed = changed or before != (entry['inode'], entry['offset'])
+
+                if changed:
+                    self._save_state(state)
+                return {log_file: state[log_file] for log_file in log_files}
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def _entry(self, log_file, entries):
+        """Entry uit een eerder refresh()-resultaat, of anders opnieuw bijgewerkt"""
+        if entries is not None and log_file in entries:
+            return entries[log_file]
+        return self.refresh(log_file)[log_file]
+
+    def level_count(self, log_file, level, entries=None):
+        """
+        Aantal regels met het opgegeven niveau in het huidige logbestand
+
+        Args:
+            log_file: Bestandsnaam
+            level: Logniveau (bijv. 'ERROR')
+            entries: Resultaat van refresh() om te hergebruiken (optioneel)
+        """
+        return self._entry(log_file, entries)['levels'].get(level, 0)
+
+    def recent_lines(self, log_file, since, limit=10, entries=None):
+        """
+        Laatste gedateerde regels vanaf een tijdstip
+
+        Args:
+            log_file: Bestandsnaam
+            since: datetime ondergrens
+            limit: Maximaal aantal regels
+            entries: Resultaat van refresh() om te hergebruiken (optioneel)
+
+        Returns:
+            list: De regels (oudste eerst)
+        """
+        since_str = since.strftime('%Y-%m-%d %H:%M:%S,%f')[:23]
+        recent = self._entry(log_file, entries)['recent']
+        return [line for timestamp, line in recent if timestamp >= since_str][-limit:]
+
+    def daily_counts(self, log_file, days, entries=None):
+        """
+        Aantal gedateerde regels per dag voor de afgelopen dagen (vandaag niet meegerekend)
+
+        Args:
+            log_file: Bestandsnaam
+            days: Aantal dagen
+            entries: Resultaat van refresh() om te hergebruiken (optioneel)
+
+        Returns:
+            dict: 'YYYY-MM-DD' -> aantal
+        """
+        counts = self._entry(log_file, entries)['days']
+        trend = {}
+        for i in range(days, 0, -1):
+            day = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
+            trend[day] = counts.get(day, 0)
+        return trend
+
+
+# Singleton instantie
+log_index = LogIndex()
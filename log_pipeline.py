@@ -0,0 +1,161 @@
+"""
+Asynchrone logging via een begrensde wachtrij.
+
+De handlers van de root logger (console, app.log, app.json.log en error.log)
+formatteren en schrijven anders op de thread van het request. Met deze module
+zet de root logger records alleen nog in een wachtrij (QueueHandler); een
+achtergrondthread (QueueListener) geeft ze door aan de echte handlers.
+
+- De wachtrij is begrensd (LOG_QUEUE_SIZE). Is hij vol, dan worden records
+  onder ERROR weggegooid; ERROR en hoger wachten kort (backpressure) zodat
+  fouten niet verloren gaan.
+- Records worden alleen in de wachtrij gezet als minstens één handler ze
+  zou verwerken; formatteren gebeurt pas op de listener-thread.
+- Tellers (in wachtrij gezet, weggegooid, gewacht) zijn op te vragen voor
+  het logdashboard.
+"""
+import os
+import copy
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler met een begrensde wachtrij en tellers voor weggegooide records"""
+
+    def __init__(self, log_queue, block_timeout=0.5):
+        """
+        Args:
+            log_queue: queue.Queue met maxsize
+            block_timeout: Seconden die ERROR-records maximaal wachten als de wachtrij vol is
+        """
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'blocked': 0,
+            'max_queue_depth': 0
+        }
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def prepare(self, record):
+        """
+        Maak het record klaar voor de wachtrij zonder het te formatteren.
+
+        Alleen het bericht wordt met de argumenten samengevoegd (die kunnen na
+        het loggen nog veranderen); de handlers formatteren zelf op de
+        listener-thread. exc_info blijft behouden zodat de JSON-formatter de
+        exception nog kan opnemen.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.ERROR or not self.block_timeout:
+                self._count('dropped')
+                return
+            # Fouten niet zomaar weggooien: even wachten op ruimte in de wachtrij
+            self._count('blocked')
+            try:
+                self.queue.put(record, timeout=self.block_timeout)
+            except queue.Full:
+                self._count('dropped')
+                return
+
+        with self._stats_lock:
+            self.stats['enqueued'] += 1
+            depth = self.queue.qsize()
+            if depth > self.stats['max_queue_depth']:
+                self.stats['max_queue_depth'] = depth
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """QueueListener die bij stoppen wacht tot er ruimte is voor het stopsignaal"""
+
+    def enqueue_sentinel(self):
+        # Bij een volle wachtrij zou put_nowait een queue.Full geven
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        # Mag vaker aangeroepen worden (handmatig en via atexit)
+        if self._thread is not None:
+            super().stop()
+
+
+# Actieve pipeline van dit proces (handler en listener)
+_queue_handler = None
+_listener = None
+
+
+def setup_queue_logging(root_logger, handlers, queue_size=None, block_timeout=None):
+    """
+    Vervang de handlers van een logger door een asynchrone wachtrij
+
+    Args:
+        root_logger: De logger (meestal de root logger)
+        handlers: De echte handlers die op de achtergrond schrijven
+        queue_size: Maximale grootte van de wachtrij (standaard LOG_QUEUE_SIZE of 10000)
+        block_timeout: Wachttijd voor ERROR-records bij een volle wachtrij (standaard LOG_QUEUE_BLOCK_TIMEOUT of 0.5)
+
+    Returns:
+        BoundedQueueHandler: De handler die aan de logger is toegevoegd
+    """
+    global _queue_handler, _listener
+
+    queue_size = queue_size or int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+    if block_timeout is None:
+        block_timeout = float(os.environ.get("LOG_QUEUE_BLOCK_TIMEOUT", 0.5))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = BoundedQueueHandler(log_queue, block_timeout=block_timeout)
+    # Filter op het laagste niveau van de handlers, zodat records die door
+    # geen enkele handler verwerkt worden niet eens in de wachtrij komen
+    queue_handler.setLevel(min(handler.level for handler in handlers))
+
+    for handler in handlers:
+        if handler in root_logger.handlers:
+            root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+
+    listener = DrainingQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Bij afsluiten de wachtrij leegschrijven
+    atexit.register(listener.stop)
+
+    _queue_handler = queue_handler
+    _listener = listener
+    return queue_handler
+
+
+def get_queue_stats():
+    """
+    Geef de tellers van de logwachtrij van dit proces terug
+
+    Returns:
+        dict: enabled, queue_size, queue_depth, enqueued, dropped, blocked en max_queue_depth
+    """
+    if _queue_handler is None:
+        return {'enabled': False}
+
+    with _queue_handler._stats_lock:
+        stats = dict(_queue_handler.stats)
+    stats['enabled'] = True
+    stats['queue_size'] = _queue_handler.queue.maxsize
+    stats['queue_depth'] = _queue_handler.queue.qsize()
+    return stats
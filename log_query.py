@@ -0,0 +1,296 @@
+"""
+Zoeken in de gestructureerde JSON-logs.
+
+app.py schrijft ieder logrecord als één JSON-regel naar logs/app.json.log
+(geroteerd naar app.json.log.1 t/m .5). Deze module doorzoekt die bestanden op
+tijdvak, niveau, logger en tekst zonder ze volledig in te lezen:
+
+- Per bestand wordt het eerste en laatste tijdstempel bepaald (en gecachet),
+  zodat bestanden buiten het tijdvak worden overgeslagen.
+- Binnen een bestand wordt met binair zoeken naar het begin van het tijdvak
+  gesprongen; records staan immers chronologisch.
+- Resultaten worden per pagina geleverd met een cursor (inode + byte-offset)
+  waarmee de volgende pagina verder leest.
+"""
+import os
+import re
+import json
+import logging
+import threading
+from datetime import datetime
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Volgorde van logniveaus voor de min_level filter
+LEVEL_ORDER = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+# Hoeveel bytes vanaf het einde gelezen worden om het laatste record te vinden
+_TAIL_READ_SIZE = 64 * 1024
+
+
+class LogQuery:
+    """Filtercriteria voor een zoekopdracht in de JSON-logs"""
+
+    def __init__(self, since=None, until=None, levels=None, min_level=None, logger_name=None, text=None):
+        """
+        Args:
+            since: datetime ondergrens (inclusief)
+            until: datetime bovengrens (inclusief)
+            levels: Lijst met exacte niveaus (bijv. ['ERROR', 'CRITICAL'])
+            min_level: Minimaal niveau (bijv. 'WARNING')
+            logger_name: Loggernaam; submodules tellen mee ('routes' matcht ook 'routes.api')
+            text: Zoektekst in bericht en exception (hoofdletterongevoelig)
+        """
+        self.since = since
+        self.until = until
+        self.levels = {level.upper() for level in levels} if levels else None
+        self.min_level = LEVEL_ORDER.get(min_level.upper(), 0) if min_level else 0
+        self.logger_name = logger_name
+        self.text = text.lower() if text else None
+
+    def matches(self, record, timestamp):
+        """Controleer of een (geparsed) record aan de filters voldoet"""
+        if self.since and timestamp < self.since:
+            return False
+        if self.until and timestamp > self.until:
+            return False
+        level = record.get('level', '')
+        if self.levels and level not in self.levels:
+            return False
+        if self.min_level and LEVEL_ORDER.get(level, 0) < self.min_level:
+            return False
+        if self.logger_name:
+            name = record.get('logger', '')
+            if name != self.logger_name and not name.startswith(self.logger_name + '.'):
+                return False
+        if self.text:
+            haystack = f"{record.get('message', '')} {record.get('exception', '')}".lower()
+            if self.text not in haystack:
+                return False
+        return True
+
+
+def _parse_timestamp(record):
+    """Lees het tijdstempel van een record, of None"""
+    try:
+        return datetime.fromisoformat(record['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _parse_line(line):
+    """Parse een JSON-logregel; geeft (record, timestamp) of (None, None)"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None, None
+    if not isinstance(record, dict):
+        return None, None
+    return record, _parse_timestamp(record)
+
+
+class JsonLogSearcher:
+    """Doorzoekt app.json.log en de geroteerde varianten"""
+
+    def __init__(self, logs_dir='logs', base_name='app.json.log'):
+        self.logs_dir = logs_dir
+        self.base_name = base_name
+        self._range_cache = {}   # pad -> (inode, grootte, eerste, laatste)
+        self._lock = threading.Lock()
+        self._file_pattern = re.compile(r'^' + re.escape(base_name) + r'(?:\.(\d+))?$')
+
+    def log_files(self):
+        """
+        Geef de logbestanden terug van oud naar nieuw
+
+        Returns:
+            list: Tuples (pad, inode, grootte)
+        """
+        if not os.path.isdir(self.logs_dir):
+            return []
+        files = []
+        for name in os.listdir(self.logs_dir):
+            match = self._file_pattern.match(name)
+            if not match:
+                continue
+            path = os.path.join(self.logs_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # app.json.log.5 is het oudst, app.json.log (rotatie 0) het nieuwst
+            rotation = int(match.group(1)) if match.group(1) else 0
+            files.append((rotation, path, stat.st_ino, stat.st_size))
+        files.sort(key=lambda item: item[0], reverse=True)
+        return [(path, inode, size) for _, path, inode, size in files]
+
+    def time_range(self, path, inode, size):
+        """
+        Bepaal het eerste en laatste tijdstempel van een bestand (gecachet per inode en grootte)
+
+        Returns:
+            tuple: (eerste, laatste) als datetime, of (None, None) als onbekend
+        """
+        with self._lock:
+            cached = self._range_cache.get(path)
+        if cached and cached[0] == inode and cached[1] == size:
+            return cached[2], cached[3]
+
+        first = last = None
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    _, first = _parse_line(line)
+                    if first:
+                        break
+                f.seek(max(0, size - _TAIL_READ_SIZE))
+                for line in reversed(f.read(_TAIL_READ_SIZE).splitlines()):
+                    _, last = _parse_line(line)
+                    if last:
+                        break
+        except OSError as e:
+            logger.warning(f"Kan tijdvak van {path} niet bepalen: {str(e)}")
+
+        with self._lock:
+            self._range_cache[path] = (inode, size, first, last)
+        return first, last
+
+    def _seek_since(self, f, size, since):
+        """
+        Zoek binair naar de byte-offset van de eerste regel met tijdstempel >= since.
+
+        Omdat een binair gekozen positie midden in een regel valt, wordt steeds
+        de eerstvolgende volledige regel gebruikt. Het resultaat kan iets te vroeg
+        liggen; de filter slaat die regels daarna alsnog over.
+        """
+        low, high = 0, size
+        while high - low > 4096:
+            middle = (low + high) // 2
+            f.seek(middle)
+            f.readline()  # Onvolledige regel overslaan
+            line_start = f.tell()
+            line = f.readline()
+            if not line:
+                high = middle
+                continue
+            _, timestamp = _parse_line(line)
+            if timestamp is None or timestamp < since:
+                low = line_start
+            else:
+                high = middle
+        # low is altijd 0 of het begin van een regel met een eerder tijdstempel
+        return low
+
+    def search(self, query, limit=100, cursor=None):
+        """
+        Zoek records die aan de query voldoen
+
+        Args:
+            query: LogQuery met filters
+            limit: Maximaal aantal records in deze pagina
+            cursor: Cursor van de vorige pagina ('<inode>-<offset>') of None
+
+        Returns:
+            SearchResult: Iterator over de records; na afloop bevat next_cursor
+            de cursor voor de volgende pagina
+        """
+        return SearchResult(self, query, limit, cursor)
+
+
+class SearchResult:
+    """
+    Iterator over de gevonden records van één pagina.
+
+    Na het itereren bevat next_cursor de cursor voor de volgende pagina, of
+    None als er geen resultaten meer zijn.
+    """
+
+    def __init__(self, searcher, query, limit, cursor):
+        self.searcher = searcher
+        self.query = query
+        self.limit = limit
+        self.cursor = cursor
+        self.next_cursor = None
+        self.files_scanned = 0
+        self.files_skipped = 0
+
+    def __iter__(self):
+        query = self.query
+        files = self.searcher.log_files()
+
+        resume_inode = resume_offset = None
+        if self.cursor:
+            try:
+                inode_str, offset_str = self.cursor.split('-', 1)
+                resume_inode, resume_offset = int(inode_str), int(offset_str)
+            except ValueError:
+                raise ValueError("Ongeldige cursor")
+            if resume_offset < 0:
+                raise ValueError("Ongeldige cursor")
+            # Begin bij het bestand van de cursor (ook als het intussen geroteerd is)
+            for index, (_, inode, _) in enumerate(files):
+                if inode == resume_inode:
+                    files = files[index:]
+                    break
+            else:
+                # Bestand bestaat niet meer; zoek verder vanaf het begin
+                resume_inode = None
+
+        found = 0
+        for path, inode, size in files:
+            first, last = self.searcher.time_range(path, inode, size)
+            if first and last and ((query.since and last < query.since) or (query.until and first > query.until)):
+                self.files_skipped += 1
+                continue
+            self.files_scanned += 1
+
+            with open(path, 'rb') as f:
+                if inode == resume_inode:
+                    offset = resume_offset
+                elif query.since and first and first < query.since:
+                    offset = self.searcher._seek_since(f, size, query.since)
+                else:
+                    offset = 0
+                f.seek(offset)
+
+                while offset < size:
+                    line = f.readline()
+                    if not line or not line.endswith(b'\n'):
+                        # Onvolledige laatste regel (wordt nog geschreven)
+                        break
+                    offset += len(line)
+                    record, timestamp = _parse_line(line)
+                    if record is None or timestamp is None:
+                        continue
+                    if query.until and timestamp > query.until:
+                        # Records zijn chronologisch: verder zoeken heeft geen zin
+                        return
+                    if not query.matches(record, timestamp):
+                        continue
+                    if found >= self.limit:
+                        # Er is nog minstens één resultaat: volgende pagina begint bij deze regel
+                        self.next_cursor = f"{inode}-{offset - len(line)}"
+                        return
+                    found += 1
+                    yield record
+
+
+def parse_query_datetime(value):
+    """
+    Parse een datum/tijd uit een query parameter (ISO 8601, bijv. 2024-05-01T13:00)
+
+    Returns:
+        datetime of None
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        # De logs bevatten lokale tijd zonder tijdzone
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+# Singleton instantie
+json_log_searcher = JsonLogSearcher()
@@ -3,16 +3,32 @@ Logs monitoring module voor het bekijken en analyseren van logs.
 Biedt een webinterface voor toegang tot logbestanden en foutmeldingen.
 """
 import os
+import re
 import json
 import logging
 from datetime import datetime, timedelta
-from flask import Blueprint, render_template, request, jsonify, abort, current_app
+from flask import Blueprint, render_template, request, jsonify, abort, current_app, Response
 from flask_login import login_required, current_user
+from sqlalchemy import text
 from models import User, db
+from log_index import log_index
+from log_query import LogQuery, json_log_searcher, parse_query_datetime
 
 # Maximaal aantal regels om uit een log bestand te lezen
 MAX_LOG_LINES = 500
 
+# Maximaal aantal records per pagina van de log query API
+MAX_QUERY_RECORDS = 1000
+
+# Blokgrootte voor het achterwaarts lezen van logbestanden
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# Maximaal aantal bytes dat per follow-aanvraag wordt teruggegeven
+MAX_FOLLOW_BYTES = 1024 * 1024
+
+# Toegestane lognamen: app.log, app.json.log en geroteerde varianten zoals app.log.1
+LOG_FILE_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+\.log(\.\d+)?$')
+
 # Blueprint registreren
 logs_bp = Blueprint('logs', __name__, url_prefix='/admin/logs')
 
@@ -37,10 +53,10 @@ def logs_dashboard():
 @login_required
 def view_log(log_file):
     """Bekijk een specifiek logbestand"""
-    log_path = os.path.join('logs', log_file)
+    log_path = _resolve_log_path(log_file)
     
     # Veiligheidscontrole: voorkom directory traversal
-    if not os.path.exists(log_path) or '..' in log_file or not log_file.endswith('.log'):
+    if not log_path:
         logger.error(f"Ongeldige log bestandsaanvraag: {log_file}")
         abort(404)
     
@@ -49,22 +65,34 @@ def view_log(log_file):
     if lines_count > MAX_LOG_LINES:
         lines_count = MAX_LOG_LINES
     
-    log_content = _read_log_file(log_path, lines_count)
+    log_content, cursor = _tail_log_file(log_path, lines_count)
     
     return render_template('log_viewer.html', 
                            log_file=log_file, 
                            log_content=log_content,
                            lines_count=lines_count,
+                           cursor=cursor,
                            now=datetime.now())
 
 @logs_bp.route('/api/logs/<log_file>')
 @login_required
 def api_get_logs(log_file):
-    """API endpoint voor het ophalen van logbestanden in JSON-formaat"""
-    log_path = os.path.join('logs', log_file)
+    """
+    API endpoint voor het ophalen van logbestanden in JSON-formaat
+    
+    Query parameters:
+        lines: Aantal regels (maximaal MAX_LOG_LINES)
+        before: Byte-offset; geef de regels vóór deze positie terug ("oudere laden")
+        after: Byte-offset; geef de nieuwe regels na deze positie terug (follow-modus)
+        inode: Inode van het bestand bij de vorige aanvraag (detecteert rotatie)
+    
+    De cursor (start_offset, end_offset, inode) staat in de X-Log-* headers en,
+    voor tekstlogs, ook in de JSON response.
+    """
+    log_path = _resolve_log_path(log_file)
     
     # Veiligheidscontrole
-    if not os.path.exists(log_path) or '..' in log_file or not log_file.endswith('.log'):
+    if not log_path:
         logger.error(f"Ongeldige API log bestandsaanvraag: {log_file}")
         return jsonify({"error": "Log bestand niet gevonden"}), 404
     
@@ -72,35 +100,170 @@ def api_get_logs(log_file):
     if lines_count > MAX_LOG_LINES:
         lines_count = MAX_LOG_LINES
     
-    log_content = _read_log_file(log_path, lines_count)
+    after = request.args.get('after', type=int)
+    if after is not None:
+        log_content, cursor = _read_log_since(log_path, after, request.args.get('inode', type=int))
+    else:
+        log_content, cursor = _tail_log_file(log_path, lines_count, request.args.get('before', type=int))
     
     # Controleren of het JSON-formaat is
-    if log_file.endswith('.json.log'):
+    if '.json.log' in log_file:
         try:
             json_logs = []
             for line in log_content:
                 if line.strip():
                     json_logs.append(json.loads(line))
-            return jsonify(json_logs)
+            response = jsonify(json_logs)
         except json.JSONDecodeError:
             logger.error(f"Fout bij het parsen van JSON log: {log_file}")
             return jsonify({"error": "Ongeldig JSON formaat in logbestand"}), 500
+    else:
+        response = jsonify({"log_content": log_content, **cursor})
+    
+    response.headers['X-Log-Start-Offset'] = str(cursor['start_offset'])
+    response.headers['X-Log-End-Offset'] = str(cursor['end_offset'])
+    response.headers['X-Log-Inode'] = str(cursor['inode'])
+    return response
+
+@logs_bp.route('/api/query')
+@login_required
+def api_query_logs():
+    """
+    API endpoint voor het doorzoeken van de JSON-logs (inclusief geroteerde bestanden)
+    
+    Query parameters:
+        since, until: Tijdvak in ISO 8601 (bijv. 2024-05-01T13:00)
+        level: Eén of meer exacte niveaus, kommagescheiden (bijv. ERROR,CRITICAL)
+        min_level: Minimaal niveau (bijv. WARNING)
+        logger: Loggernaam (inclusief submodules)
+        q: Zoektekst in bericht en exception
+        limit: Aantal records per pagina (maximaal MAX_QUERY_RECORDS)
+        cursor: next_cursor uit de vorige pagina
+    
+    De records worden chronologisch gestreamd; next_cursor staat aan het einde van de response.
+    """
+    try:
+        levels = request.args.get('level')
+        query = LogQuery(
+            since=parse_query_datetime(request.args.get('since')),
+            until=parse_query_datetime(request.args.get('until')),
+            levels=levels.split(',') if levels else None,
+            min_level=request.args.get('min_level'),
+            logger_name=request.args.get('logger'),
+            text=request.args.get('q')
+        )
+    except ValueError:
+        return jsonify({"error": "Ongeldig tijdstip, gebruik ISO 8601 (bijv. 2024-05-01T13:00)"}), 400
+    
+    limit = min(max(request.args.get('limit', default=100, type=int), 1), MAX_QUERY_RECORDS)
+    result = json_log_searcher.search(query, limit=limit, cursor=request.args.get('cursor'))
+    records = iter(result)
+    
+    # Eerste record alvast ophalen zodat een ongeldige cursor nog een 400 kan geven
+    try:
+        first_record = next(records, None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    return jsonify({"log_content": log_content})
+    def generate():
+        yield '{"records": ['
+        if first_record is not None:
+            yield json.dumps(first_record)
+            for record in records:
+                yield ',' + json.dumps(record)
+        yield '], ' + json.dumps({
+            'next_cursor': result.next_cursor,
+            'files_scanned': result.files_scanned,
+            'files_skipped': result.files_skipped
+        })[1:]
+    
+    return Response(generate(), mimetype='application/json')
 
 @logs_bp.route('/api/stats')
 @login_required
 def api_get_stats():
     """API endpoint voor het ophalen van logstatistieken"""
+    # Eén keer de index bijwerken voor beide bestanden; de helpers gebruiken dat resultaat
+    try:
+        entries = log_index.refresh('app.log', 'error.log')
+    except Exception as e:
+        logger.error(f"Fout bij het bijwerken van de logindex: {str(e)}")
+        entries = None
     stats = {
-        'error_count': _count_log_level('error.log', 'ERROR'),
-        'warning_count': _count_log_level('app.log', 'WARNING'),
-        'info_count': _count_log_level('app.log', 'INFO'),
-        'recent_errors': _get_recent_errors(),
+        'error_count': _count_log_level('error.log', 'ERROR', entries),
+        'warning_count': _count_log_level('app.log', 'WARNING', entries),
+        'info_count': _count_log_level('app.log', 'INFO', entries),
+        'recent_errors': _get_recent_errors(entries=entries),
         'log_sizes': _get_log_sizes()
     }
     return jsonify(stats)
 
+@logs_bp.route('/api/db-pool')
+@login_required
+def api_get_db_pool_stats():
+    """API endpoint voor statistieken van de databaseverbindingspool van deze worker"""
+    from database import get_pool_stats
+    
+    stats = get_pool_stats(db.engine)
+    
+    # Schatting van het maximale aantal verbindingen over alle gunicorn workers
+    workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+    if 'pool_size' in stats:
+        stats['workers'] = workers
+        stats['max_connections_all_workers'] = workers * (stats['pool_size'] + stats['max_overflow'])
+    
+    # Vergelijk met de limiet van PostgreSQL zelf
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            with db.engine.connect() as conn:
+                stats['postgres_max_connections'] = int(conn.execute(text("SHOW max_connections")).scalar())
+                stats['postgres_active_connections'] = conn.execute(
+                    text("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()")
+                ).scalar()
+        except Exception as e:
+            logger.warning(f"Kan PostgreSQL verbindingslimiet niet ophalen: {str(e)}")
+    
+    return jsonify(stats)
+
+@logs_bp.route('/api/token-cache')
+@login_required
+def api_get_token_cache_stats():
+    """API endpoint voor tellers van de Microsoft token cache (hits versus aanvragen)"""
+    from msal_token_cache import token_cache
+    return jsonify(token_cache.get_stats())
+
+@logs_bp.route('/api/http-clients')
+@login_required
+def api_get_http_client_stats():
+    """API endpoint voor verzoeken en latentie per externe integratie van deze worker"""
+    from http_client import http_client
+    return jsonify({'pid': os.getpid(), 'integrations': http_client.get_stats()})
+
+@logs_bp.route('/api/email-outbox')
+@login_required
+def api_get_email_outbox_stats():
+    """API endpoint voor de toestand van de e-mailwachtrij (alle workers) en de tellers van deze worker"""
+    from email_outbox import email_outbox
+    return jsonify(email_outbox.get_stats())
+
+@logs_bp.route('/api/smtp-pool')
+@login_required
+def api_get_smtp_pool_stats():
+    """API endpoint voor tellers van de gedeelde SMTP-verbindingen van deze worker"""
+    from smtp_pool import smtp_pool
+    stats = smtp_pool.get_stats()
+    stats['pid'] = os.getpid()
+    return jsonify(stats)
+
+@logs_bp.route('/api/log-queue')
+@login_required
+def api_get_log_queue_stats():
+    """API endpoint voor tellers van de asynchrone logwachtrij van deze worker"""
+    from log_pipeline import get_queue_stats
+    stats = get_queue_stats()
+    stats['pid'] = os.getpid()
+    return jsonify(stats)
+
 @logs_bp.route('/error-test')
 @login_required
 def error_test():
@@ -151,7 +314,7 @@ def _get_available_log_files():
     
     log_files = []
     for file in os.listdir(logs_dir):
-        if file.endswith('.log'):
+        if LOG_FILE_PATTERN.match(file):
             file_path = os.path.join(logs_dir, file)
             file_size = os.path.getsize(file_path)
             file_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
@@ -167,65 +330,135 @@ def _get_available_log_files():
     log_files.sort(key=lambda x: x['modified'], reverse=True)
     return log_files
 
-def _read_log_file(log_path, lines_count):
-    """Lees de laatste N regels van een logbestand"""
+def _resolve_log_path(log_file):
+    """
+    Valideer een lognaam en geef het pad terug
+    
+    Returns:
+        str of None: Het pad naar het logbestand, of None als de naam ongeldig is of niet bestaat
+    """
+    if '..' in log_file or not LOG_FILE_PATTERN.match(log_file):
+        return None
+    log_path = os.path.join('logs', log_file)
+    if not os.path.isfile(log_path):
+        return None
+    return log_path
+
+def _tail_log_file(log_path, lines_count, end_offset=None):
+    """
+    Lees de laatste N regels van een logbestand (vóór end_offset).
+    
+    Het bestand wordt vanaf het einde in blokken van TAIL_BLOCK_SIZE achterwaarts
+    gelezen, zodat de leestijd afhangt van N en niet van de bestandsgrootte.
+    
+    Args:
+        log_path: Pad naar het logbestand
+        lines_count: Aantal regels (0 = het hele bestand)
+        end_offset: Byte-offset waarvoor gelezen wordt (None = einde van het bestand)
+        
+    Returns:
+        tuple: (lijst met regels, cursor dict met start_offset, end_offset, inode en file_size)
+    """
     try:
-        with open(log_path, 'r', encoding='utf-8') as file:
-            # Voor grote bestanden lezen we alleen de laatste N regels
-            if lines_count > 0:
-                # Efficiënte manier om de laatste N regels te lezen
-                lines = file.readlines()
-                return lines[-lines_count:] if len(lines) > lines_count else lines
+        with open(log_path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            file_size = stat.st_size
+            if end_offset is None or end_offset > file_size or end_offset < 0:
+                end_offset = file_size
+            
+            if lines_count <= 0:
+                file.seek(0)
+                buffer = file.read(end_offset)
+                position = 0
             else:
-                # Als lines_count 0 is, lees alles
-                return file.readlines()
+                # Lees blokken terug tot we genoeg volledige regels hebben
+                position = end_offset
+                buffer = b''
+                while position > 0 and buffer.count(b'\n') <= lines_count:
+                    read_size = min(TAIL_BLOCK_SIZE, position)
+                    position -= read_size
+                    file.seek(position)
+                    buffer = file.read(read_size) + buffer
+        
+        raw_lines = buffer.splitlines(keepends=True)
+        # De eerste regel is onvolledig als we niet bij het begin van het bestand zijn
+        if position > 0 and raw_lines:
+            position += len(raw_lines[0])
+            raw_lines = raw_lines[1:]
+        if lines_count > 0 and len(raw_lines) > lines_count:
+            skipped = raw_lines[:-lines_count]
+            position += sum(len(line) for line in skipped)
+            raw_lines = raw_lines[-lines_count:]
+        
+        cursor = {
+            'start_offset': position,
+            'end_offset': end_offset,
+            'inode': stat.st_ino,
+            'file_size': file_size
+        }
+        return [line.decode('utf-8', errors='replace') for line in raw_lines], cursor
     except Exception as e:
         logger.error(f"Fout bij het lezen van logbestand {log_path}: {str(e)}")
-        return [f"Fout bij het lezen van logbestand: {str(e)}"]
+        return [f"Fout bij het lezen van logbestand: {str(e)}"], {
+            'start_offset': 0, 'end_offset': 0, 'inode': 0, 'file_size': 0
+        }
 
-def _count_log_level(log_file, level):
-    """Tel het aantal regels in een logbestand met een bepaald logniveau"""
-    log_path = os.path.join('logs', log_file)
-    if not os.path.exists(log_path):
-        return 0
+def _read_log_since(log_path, offset, inode=None):
+    """
+    Lees de volledige regels die sinds een byte-offset aan een logbestand zijn toegevoegd.
     
-    count = 0
+    Als het bestand intussen geroteerd (andere inode) of ingekort is, wordt
+    vanaf het begin van het nieuwe bestand gelezen.
+    
+    Args:
+        log_path: Pad naar het logbestand
+        offset: Byte-offset van de vorige aanvraag
+        inode: Inode van de vorige aanvraag (optioneel)
+        
+    Returns:
+        tuple: (lijst met regels, cursor dict; 'reset' is True na rotatie)
+    """
     try:
-        with open(log_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                if f" {level} " in line:
-                    count += 1
+        with open(log_path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            reset = (inode is not None and inode != stat.st_ino) or offset > stat.st_size or offset < 0
+            if reset:
+                offset = 0
+            file.seek(offset)
+            buffer = file.read(min(stat.st_size - offset, MAX_FOLLOW_BYTES))
+        
+        # Alleen volledige regels teruggeven; de rest komt bij de volgende aanvraag
+        last_newline = buffer.rfind(b'\n')
+        buffer = buffer[:last_newline + 1] if last_newline >= 0 else b''
+        
+        cursor = {
+            'start_offset': offset,
+            'end_offset': offset + len(buffer),
+            'inode': stat.st_ino,
+            'file_size': stat.st_size,
+            'reset': reset
+        }
+        lines = [line.decode('utf-8', errors='replace') for line in buffer.splitlines(keepends=True)]
+        return lines, cursor
+    except Exception as e:
+        logger.error(f"Fout bij het volgen van logbestand {log_path}: {str(e)}")
+        return [], {'start_offset': offset, 'end_offset': offset, 'inode': 0, 'file_size': 0, 'reset': False}
+
+def _count_log_level(log_file, level, entries=None):
+    """Tel het aantal regels in een logbestand met een bepaald logniveau"""
+    try:
+        return log_index.level_count(log_file, level, entries)
     except Exception as e:
         logger.error(f"Fout bij het tellen van logniveau {level} in {log_file}: {str(e)}")
-    
-    return count
+        return 0
 
-def _get_recent_errors(days=1):
+def _get_recent_errors(days=1, entries=None):
     """Verkrijg recente fouten uit de error.log"""
-    log_path = os.path.join('logs', 'error.log')
-    if not os.path.exists(log_path):
-        return []
-    
-    errors = []
-    one_day_ago = datetime.now() - timedelta(days=days)
-    
     try:
-        with open(log_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                try:
-                    # Parse de datum uit het logbericht
-                    date_str = line.split(' - ')[0]
-                    log_date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S,%f')
-                    
-                    if log_date >= one_day_ago:
-                        errors.append(line.strip())
-                except (ValueError, IndexError):
-                    # Sla ongeldige regels over
-                    continue
+        return log_index.recent_lines('error.log', datetime.now() - timedelta(days=days), limit=10, entries=entries)
     except Exception as e:
         logger.error(f"Fout bij het ophalen van recente fouten: {str(e)}")
-    
-    return errors[-10:]  # Laatste 10 fouten
+        return []
 
 def _get_log_sizes():
     """Verkrijg de groottes van alle logbestanden"""
@@ -236,7 +469,7 @@ def _get_log_sizes():
         return log_sizes
     
     for file in os.listdir(logs_dir):
-        if file.endswith('.log'):
+        if LOG_FILE_PATTERN.match(file):
             file_path = os.path.join(logs_dir, file)
             log_sizes[file] = _format_size(os.path.getsize(file_path))
     
@@ -252,34 +485,14 @@ def _format_size(size_bytes):
 
 def _analyze_error_trend():
     """Analyseer de trend van fouten over de laatste 7 dagen"""
-    log_path = os.path.join('logs', 'error.log')
-    if not os.path.exists(log_path):
+    if not os.path.exists(os.path.join('logs', 'error.log')):
         return {}
     
-    # Initialiseer de trend dictionary met de afgelopen 7 dagen
-    trend = {}
-    for i in range(7, 0, -1):
-        date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-        trend[date] = 0
-    
     try:
-        with open(log_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                try:
-                    # Parse de datum uit het logbericht
-                    date_str = line.split(' - ')[0]
-                    log_date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S,%f')
-                    day = log_date.strftime('%Y-%m-%d')
-                    
-                    if day in trend:
-                        trend[day] += 1
-                except (ValueError, IndexError):
-                    # Sla ongeldige regels over
-                    continue
+        return log_index.daily_counts('error.log', 7)
     except Exception as e:
         logger.error(f"Fout bij het analyseren van fouttrend: {str(e)}")
-    
-    return trend
+        return {}
 
 def register_error_notification_handlers(app):
     """Registreer handlers voor foutmeldingen"""
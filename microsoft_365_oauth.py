@@ -13,8 +13,8 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-from msal import ConfidentialClientApplication
 from flask import current_app
+from msal_token_cache import token_cache
 
 # Logger configuratie
 logger = logging.getLogger(__name__)
@@ -74,12 +74,12 @@ class Microsoft365OAuth:
     
     def _load_from_system_settings(self):
         """Laad instellingen uit systeem instellingen of omgevingsvariabelen"""
-        from models import EmailSettings
+        from settings_cache import settings_cache
         
         try:
             # Systeem-instellingen ophalen (workspace_id=None)
             with current_app.app_context():
-                system_settings = EmailSettings.query.filter_by(workspace_id=None).first()
+                system_settings = settings_cache.email_settings(None)
                 
                 if system_settings:
                     self.email_settings = system_settings
@@ -137,17 +137,10 @@ class Microsoft365OAuth:
             logger.debug(f"Email account: {self.email_account}")
             logger.debug(f"Authority: {authority}")
             
-            # Token ophalen via MSAL
-            # client_credential moet een string zijn voor client secret flow
-            app = ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,  # Let op: dit moet de plain text secret zijn
-                authority=authority
-            )
-            
-            # Verkrijg token voor client credentials flow
+            # Verkrijg token voor client credentials flow via de gedeelde token cache
+            # (client_secret moet de plain text secret zijn)
             logger.debug(f"Scope voor token: {scope}")
-            result = app.acquire_token_for_client(scopes=scope)
+            result = token_cache.acquire_token(self.tenant_id, self.client_id, self.client_secret, scope)
             
             if 'access_token' not in result:
                 if 'error' in result:
@@ -158,8 +151,9 @@ class Microsoft365OAuth:
                 return None
             
             # Toon een preview van het token (eerste 10 karakters) voor debugging
-            token_preview = result['access_token'][:10] + "..." if result['access_token'] else None
-            logger.info(f"OAuth2 token succesvol verkregen: {token_preview}")
+            if result.get('token_source') != 'cache':
+                token_preview = result['access_token'][:10] + "..." if result['access_token'] else None
+                logger.info(f"OAuth2 token succesvol verkregen: {token_preview}")
             return result['access_token']
             
         except Exception as e:
@@ -1,7 +1,6 @@
 """
 Database migratie script voor het toevoegen van WHMCS-velden aan bestaande tabellen
 """
-import os
 import sys
 import logging
 from datetime import datetime
@@ -10,20 +9,13 @@ from datetime import datetime
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Flask en SQLAlchemy imports
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+# SQLAlchemy imports
 from sqlalchemy import MetaData, Table, Column, Integer, Boolean, DateTime, String
 from sqlalchemy.sql import text
 
-# Gebruik de database module voor de bestaande SQLAlchemy instantie
+# Gebruik de database module voor de bestaande SQLAlchemy instantie. De migraties
+# draaien binnen de app context van de hoofdapplicatie en delen dus haar engine/pool.
 from database import db
-# Maak een tijdelijke Flask-app voor de database-verbinding
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-# Initialiseer de bestaande db instantie met deze app
-db.init_app(app)
 
 def add_column_if_not_exists(table_name, column_name, column_type):
     """Voeg een kolom toe aan een tabel als deze nog niet bestaat"""
@@ -87,7 +79,8 @@ def migrate_whmcs_fields():
                 ALTER TABLE customers 
                 ADD COLUMN IF NOT EXISTS whmcs_client_id INTEGER,
                 ADD COLUMN IF NOT EXISTS synced_from_whmcs BOOLEAN DEFAULT FALSE,
-                ADD COLUMN IF NOT EXISTS whmcs_last_sync TIMESTAMP
+                ADD COLUMN IF NOT EXISTS whmcs_last_sync TIMESTAMP,
+                ADD COLUMN IF NOT EXISTS whmcs_sync_hash VARCHAR(64)
             """))
             # Forceer commit om de wijzigingen direct toe te passen
             conn.commit()
@@ -103,7 +96,8 @@ def migrate_whmcs_fields():
                 ADD COLUMN IF NOT EXISTS notes TEXT,
                 ADD COLUMN IF NOT EXISTS whmcs_invoice_id INTEGER,
                 ADD COLUMN IF NOT EXISTS synced_from_whmcs BOOLEAN DEFAULT FALSE,
-                ADD COLUMN IF NOT EXISTS whmcs_last_sync TIMESTAMP
+                ADD COLUMN IF NOT EXISTS whmcs_last_sync TIMESTAMP,
+                ADD COLUMN IF NOT EXISTS whmcs_sync_hash VARCHAR(64)
             """))
             # Forceer commit om de wijzigingen direct toe te passen
             conn.commit()
@@ -129,6 +123,107 @@ def migrate_whmcs_fields():
     
     logger.info("Migratie van WHMCS-velden voltooid")
 
+def migrate_customer_search_indexes():
+    """
+    Maak de indexen voor het zoeken van klanten per werkruimte (klantkiezer).
+    Prefix-zoekopdrachten (LIKE 'abc%') op lower(company_name) en vat_number
+    kunnen met varchar_pattern_ops de index gebruiken, ongeacht de collatie.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        logger.info("Zoekindexen voor klanten overgeslagen (alleen PostgreSQL)")
+        return
+    
+    with db.engine.connect() as conn:
+        try:
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_customers_workspace_company_name
+                ON customers (workspace_id, lower(company_name) varchar_pattern_ops)
+            """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_customers_workspace_vat_number
+                ON customers (workspace_id, vat_number varchar_pattern_ops)
+            """))
+            conn.commit()
+            logger.info("Zoekindexen voor klanten aangemaakt")
+        except Exception as e:
+            logger.error(f"Fout bij aanmaken van zoekindexen voor klanten: {str(e)}")
+
+def migrate_whmcs_sync_state():
+    """
+    Maak de tabel whmcs_sync_state (watermerk en laatste run per werkruimte)
+    aan als die nog niet bestaat.
+    """
+    from models import WhmcsSyncState
+    
+    try:
+        WhmcsSyncState.__table__.create(bind=db.engine, checkfirst=True)
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE whmcs_sync_state ADD COLUMN IF NOT EXISTS last_error TEXT"))
+            conn.commit()
+        logger.info("Tabel whmcs_sync_state gecontroleerd")
+    except Exception as e:
+        logger.error(f"Fout bij aanmaken van tabel whmcs_sync_state: {str(e)}")
+
+def migrate_whmcs_unique_indexes():
+    """
+    Maak de unieke indexen op (workspace_id, whmcs_client_id) en
+    (workspace_id, whmcs_invoice_id). De WHMCS-sync gebruikt die als
+    conflictdoel voor INSERT ... ON CONFLICT DO UPDATE.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        logger.info("Unieke WHMCS-indexen overgeslagen (alleen PostgreSQL)")
+        return
+    
+    indexes = (
+        ('uix_customers_workspace_whmcs_client', 'customers', 'whmcs_client_id'),
+        ('uix_invoices_workspace_whmcs_invoice', 'invoices', 'whmcs_invoice_id'),
+    )
+    for index_name, table_name, column_name in indexes:
+        with db.engine.connect() as conn:
+            try:
+                conn.execute(text(f"""
+                    CREATE UNIQUE INDEX IF NOT EXISTS {index_name}
+                    ON {table_name} (workspace_id, {column_name})
+                    WHERE {column_name} IS NOT NULL
+                """))
+                conn.commit()
+                logger.info(f"Unieke index {index_name} aangemaakt")
+            except Exception as e:
+                # Meestal dubbele WHMCS-records in een werkruimte; die moeten eerst opgeruimd worden
+                logger.error(f"Fout bij aanmaken van unieke index {index_name} (dubbele {column_name}?): {str(e)}")
+
+def migrate_server_sessions():
+    """
+    Maak de tabel server_sessions (server-side sessies, SESSION_BACKEND=database)
+    aan als die nog niet bestaat.
+    """
+    from models import ServerSession
+    
+    try:
+        ServerSession.__table__.create(bind=db.engine, checkfirst=True)
+        logger.info("Tabel server_sessions gecontroleerd")
+    except Exception as e:
+        logger.error(f"Fout bij aanmaken van tabel server_sessions: {str(e)}")
+
+def migrate_email_outbox():
+    """
+    Maak de tabel email_outbox (wachtrij voor uitgaande e-mail) aan als die
+    nog niet bestaat.
+    """
+    from models import EmailOutbox
+    
+    try:
+        EmailOutbox.__table__.create(bind=db.engine, checkfirst=True)
+        logger.info("Tabel email_outbox gecontroleerd")
+    except Exception as e:
+        logger.error(f"Fout bij aanmaken van tabel email_outbox: {str(e)}")
+
 if __name__ == "__main__":
+    from app import app
     with app.app_context():
-        migrate_whmcs_fields()
\ No newline at end of file
+        migrate_whmcs_fields()
+        migrate_customer_search_indexes()
+        migrate_whmcs_sync_state()
+        migrate_whmcs_unique_indexes()
+        migrate_email_outbox()
+        migrate_server_sessions()
\ No newline at end of file
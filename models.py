@@ -66,6 +66,7 @@ class Customer(db.Model):
     whmcs_client_id = db.Column(db.Integer, nullable=True)
     synced_from_whmcs = db.Column(db.Boolean, default=False)
     whmcs_last_sync = db.Column(db.DateTime, nullable=True)
+    whmcs_sync_hash = db.Column(db.String(64), nullable=True)  # Hash van de laatst verwerkte WHMCS-gegevens
     
     # Workspace relationship
     workspace_id = db.Column(db.Integer, db.ForeignKey('workspaces.id'))
@@ -141,6 +142,7 @@ class Invoice(db.Model):
     whmcs_invoice_id = db.Column(db.Integer, nullable=True)
     synced_from_whmcs = db.Column(db.Boolean, default=False)
     whmcs_last_sync = db.Column(db.DateTime, nullable=True)
+    whmcs_sync_hash = db.Column(db.String(64), nullable=True)  # Hash van de laatst verwerkte WHMCS-gegevens
     
     # Workspace relationship
     workspace_id = db.Column(db.Integer, db.ForeignKey('workspaces.id'))
@@ -702,6 +704,55 @@ class EmailTemplate(db.Model):
         }
 
 
+class EmailOutbox(db.Model):
+    """
+    Wachtrij voor uitgaande e-mails (zie email_outbox.py).
+    Berichten worden volledig opgemaakt opgeslagen en op de achtergrond
+    verstuurd, met herhaalpogingen bij fouten.
+    """
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    workspace_id = db.Column(db.Integer, db.ForeignKey('workspaces.id', ondelete='SET NULL'), nullable=True)
+    kind = db.Column(db.String(50))  # user_invitation, workspace_invitation, ...
+    recipient = db.Column(db.String(255), nullable=False)
+    cc = db.Column(db.Text)  # JSON-lijst met e-mailadressen
+    subject = db.Column(db.String(255))
+    body_html = db.Column(db.Text)
+    attachments = db.Column(db.Text)  # JSON met 'path' en 'filename' per bijlage
+
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)  # Moment waarop een worker het bericht oppakte
+    last_error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.now)
+
+    __table_args__ = (
+        sa.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        {'extend_existing': True}
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'workspace_id': self.workspace_id,
+            'kind': self.kind,
+            'recipient': self.recipient,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at,
+            'last_error': self.last_error,
+            'sent_at': self.sent_at,
+            'created_at': self.created_at
+        }
+
+
 class Subscription(db.Model):
     """Model voor abonnementen die beschikbaar zijn in het systeem"""
     __tablename__ = 'subscriptions'
@@ -883,6 +934,63 @@ class SystemSettings(db.Model):
         return setting
 
 
+class WhmcsSyncState(db.Model):
+    """
+    Voortgang van de WHMCS-synchronisatie per werkruimte en soort gegevens
+    ('clients' of 'invoices'). Het watermerk is de hoogste WHMCS-wijzigingsdatum
+    die bij de laatste volledige, geslaagde sync is gezien.
+    """
+    __tablename__ = 'whmcs_sync_state'
+    __table_args__ = (
+        sa.UniqueConstraint('workspace_id', 'entity', name='uix_whmcs_sync_state_workspace_entity'),
+        {'extend_existing': True}
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    workspace_id = db.Column(db.Integer, db.ForeignKey('workspaces.id'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)
+    watermark = db.Column(db.DateTime, nullable=True)
+    last_started = db.Column(db.DateTime, nullable=True)
+    last_finished = db.Column(db.DateTime, nullable=True)
+    last_stats = db.Column(db.Text, nullable=True)  # JSON met de tellers van de laatste (of lopende) sync
+    last_error = db.Column(db.Text, nullable=True)  # Foutmelding als de laatste sync afgebroken is
+    
+    @staticmethod
+    def get_or_create(workspace_id, entity):
+        """Haal de syncstatus op, of maak een nieuwe (nog niet gecommit)"""
+        state = WhmcsSyncState.query.filter_by(workspace_id=workspace_id, entity=entity).first()
+        if not state:
+            state = WhmcsSyncState(workspace_id=workspace_id, entity=entity)
+            db.session.add(state)
+        return state
+    
+    def to_dict(self):
+        return {
+            'workspace_id': self.workspace_id,
+            'entity': self.entity,
+            'watermark': self.watermark,
+            'last_started': self.last_started,
+            'last_finished': self.last_finished,
+            'last_stats': json.loads(self.last_stats) if self.last_stats else None,
+            'last_error': self.last_error
+        }
+
+
+class ServerSession(db.Model):
+    """
+    Model voor server-side sessies (zie server_session.py).
+    De cookie bevat alleen het sessie-id; de inhoud staat in deze tabel.
+    """
+    __tablename__ = 'server_sessions'
+    
+    session_id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ServerSession {self.session_id[:8]}>'
+
+
 class Workspace(db.Model):
     __tablename__ = 'workspaces'
     __table_args__ = {'extend_existing': True}
@@ -1039,15 +1147,15 @@ class User(UserMixin, db.Model):
     
     def has_permission(self, permission_name):
         """Controleert of de gebruiker een specifieke permissie heeft"""
+        from utils import get_permission_snapshot
+        snapshot = get_permission_snapshot(self)
+        
         # Super admins en workspace admins hebben altijd alle rechten
-        if self.is_super_admin or self.is_admin:
+        if snapshot['is_super_admin'] or snapshot['is_admin']:
             return True
         
         # Controleer specifieke permissies voor normale gebruikers
-        if self.permissions:
-            return getattr(self.permissions, permission_name, False)
-        
-        return False
+        return snapshot['permissions'].get(permission_name, False)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -1197,6 +1305,89 @@ def get_customer_summary(workspace_id=None):
     
     return customer_data
 
+def iter_invoice_export_rows(year, workspace_id=None, batch_size=1000):
+    """
+    Geef alle facturen van een jaar als dicts voor een export, zonder ze
+    allemaal tegelijk in het geheugen te laden. Alleen de benodigde kolommen
+    worden opgehaald en de rijen komen per blok van batch_size uit de database.
+    
+    Args:
+        year: Jaar van de factuurdatum
+        workspace_id: ID van de werkruimte (optioneel)
+        batch_size: Aantal rijen per blok
+        
+    Yields:
+        dict: Factuurgegevens met klantnaam en BTW-nummer van de klant
+    """
+    query = db.session.query(
+        Invoice.invoice_number, Invoice.date, Invoice.invoice_type,
+        Invoice.amount_excl_vat, Invoice.vat_rate, Invoice.vat_amount, Invoice.amount_incl_vat,
+        Invoice.status, Customer.company_name, Customer.first_name, Customer.last_name, Customer.vat_number
+    ).join(Customer, Invoice.customer_id == Customer.id).filter(
+        Invoice.date >= date(year, 1, 1),
+        Invoice.date <= date(year, 12, 31)
+    )
+    
+    if workspace_id:
+        query = query.filter(Invoice.workspace_id == workspace_id)
+    
+    query = query.order_by(Invoice.date, Invoice.invoice_number).execution_options(yield_per=batch_size)
+    
+    for row in query:
+        # Zelfde naamgeving als Customer.name
+        if row.first_name and row.last_name:
+            customer_name = f"{row.first_name} {row.last_name}"
+        else:
+            customer_name = row.company_name
+        yield {
+            'invoice_number': row.invoice_number,
+            'date': row.date,
+            'customer_name': customer_name,
+            'vat_number': row.vat_number,
+            'invoice_type': row.invoice_type,
+            'amount_excl_vat': row.amount_excl_vat,
+            'vat_rate': row.vat_rate,
+            'vat_amount': row.vat_amount,
+            'amount_incl_vat': row.amount_incl_vat,
+            'status': row.status
+        }
+
+def search_customers(workspace_id, term=None, limit=20):
+    """
+    Zoek klanten van een werkruimte op het begin van de naam of het BTW-nummer
+    (voor de klantkiezer). Gebruikt de indexen ix_customers_workspace_company_name
+    en ix_customers_workspace_vat_number.
+    
+    Args:
+        workspace_id: ID van de werkruimte
+        term: Begin van de bedrijfsnaam of het BTW-nummer (optioneel)
+        limit: Maximaal aantal resultaten
+        
+    Returns:
+        list: Dicts met id, name, company_name, vat_number, customer_type en default_vat_rate
+    """
+    query = Customer.query.filter(Customer.workspace_id == workspace_id)
+    
+    term = (term or '').strip()
+    if term:
+        # LIKE-jokertekens in de zoekterm letterlijk nemen
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        vat_prefix = escaped.replace(' ', '').replace('.', '').upper()
+        query = query.filter(sa.or_(
+            sa.func.lower(Customer.company_name).like(f"{escaped.lower()}%", escape='\\'),
+            Customer.vat_number.like(f"{vat_prefix}%", escape='\\')
+        ))
+    
+    customers_found = query.order_by(sa.func.lower(Customer.company_name)).limit(limit).all()
+    return [{
+        'id': str(customer.id),
+        'name': customer.name,
+        'company_name': customer.company_name,
+        'vat_number': customer.vat_number,
+        'customer_type': customer.customer_type,
+        'default_vat_rate': customer.default_vat_rate
+    } for customer in customers_found]
+
 # User management functions
 def get_users():
     """Get all users"""
@@ -5,8 +5,9 @@ import os
 import logging
 from datetime import datetime, timedelta
 import json
-import requests
 from app import app, db
+from http_client import http_client
+from settings_cache import settings_cache
 from flask import url_for
 from models import MollieSettings, Payment, Workspace, Subscription
 
@@ -42,6 +43,7 @@ class MollieService:
         Returns:
             MollieSettings: De gevonden instellingen of None
         """
+        # Rechtstreeks uit de database: de aanroeper mag deze instellingen wijzigen
         if workspace_id:
             return MollieSettings.query.filter_by(workspace_id=workspace_id).first()
         else:
@@ -57,7 +59,7 @@ class MollieService:
         Returns:
             bool: True als geconfigureerd, anders False
         """
-        settings = self.get_settings(workspace_id)
+        settings = settings_cache.mollie_settings(workspace_id)
         
         if settings and settings.api_key:
             return True
@@ -75,7 +77,7 @@ class MollieService:
         Returns:
             str: De API-sleutel of None
         """
-        settings = self.get_settings(workspace_id)
+        settings = settings_cache.mollie_settings(workspace_id)
         
         if settings and settings.api_key:
             return settings.api_key
@@ -142,7 +144,8 @@ class MollieService:
             }
             
             # Verstuur aanvraag naar Mollie API
-            response = requests.post(
+            response = http_client.request(
+                'mollie', 'POST',
                 f"{self.base_url}/payments",
                 headers=self.headers,
                 json=payment_data
@@ -216,7 +219,8 @@ class MollieService:
         
         try:
             # Haal betalingsstatus op
-            response = requests.get(
+            response = http_client.request(
+                'mollie', 'GET',
                 f"{self.base_url}/payments/{mollie_payment_id}",
                 headers=self.headers
             )
@@ -374,7 +378,8 @@ class MollieService:
         
         try:
             # Haal betaalmethoden op
-            response = requests.get(
+            response = http_client.request(
+                'mollie', 'GET',
                 f"{self.base_url}/methods",
                 headers=self.headers
             )
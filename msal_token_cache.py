@@ -0,0 +1,182 @@
+"""
+Procesbrede cache voor Microsoft (MSAL) toegangstokens.
+
+Zowel MSGraphProvider (Graph API) als Microsoft365OAuth (SMTP met OAuth) vroegen
+bij iedere e-mail een nieuw token aan via acquire_token_for_client, wat telkens
+een extra HTTPS round-trip naar de identity provider kost. Deze module bewaart
+tokens per (tenant, client_id, scope) en hergebruikt ze tot kort voor het
+verlopen. Tokens die bijna verlopen worden op de achtergrond vernieuwd.
+"""
+import time
+import hashlib
+import logging
+import threading
+import msal
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+
+class MSALTokenCache:
+    """
+    Thread-safe cache voor client credentials tokens.
+
+    Houdt ook de ConfidentialClientApplication per client bij, zodat die niet
+    bij iedere aanvraag opnieuw wordt opgebouwd.
+    """
+
+    def __init__(self, refresh_margin=300, background_window=900):
+        """
+        Initialiseer de token cache
+
+        Args:
+            refresh_margin: Seconden voor het verlopen waarop een token niet meer wordt gebruikt
+            background_window: Seconden voor het verlopen waarop een achtergrondvernieuwing start
+        """
+        self.refresh_margin = refresh_margin
+        self.background_window = background_window
+        self._lock = threading.Lock()
+        self._tokens = {}      # (tenant_id, client_id, scopes) -> {'access_token', 'expires_at'}
+        self._apps = {}        # (tenant_id, client_id, secret hash) -> ConfidentialClientApplication
+        self._key_locks = {}   # sleutel -> Lock, zodat per sleutel maar één aanvraag tegelijk loopt
+        self._refreshing = set()
+        self._stats = {
+            'cache_hits': 0,
+            'token_fetches': 0,
+            'background_refreshes': 0,
+            'fetch_errors': 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _key_lock(self, key):
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def _get_client_app(self, tenant_id, client_id, client_secret):
+        """Haal de (gedeelde) MSAL client op voor deze credentials"""
+        secret_hash = hashlib.sha256((client_secret or '').encode('utf-8')).hexdigest()
+        app_key = (tenant_id, client_id, secret_hash)
+        with self._lock:
+            client_app = self._apps.get(app_key)
+        if client_app is None:
+            client_app = msal.ConfidentialClientApplication(
+                client_id=client_id,
+                authority=f"https://login.microsoftonline.com/{tenant_id}",
+                client_credential=client_secret
+            )
+            with self._lock:
+                client_app = self._apps.setdefault(app_key, client_app)
+        return client_app
+
+    def _cached_result(self, key, now):
+        """Geef een bruikbaar token uit de cache terug, of None"""
+        with self._lock:
+            entry = self._tokens.get(key)
+        if entry and entry['expires_at'] - now > self.refresh_margin:
+            return {
+                'access_token': entry['access_token'],
+                'expires_in': int(entry['expires_at'] - now),
+                'token_type': 'Bearer',
+                'token_source': 'cache'
+            }
+        return None
+
+    def _fetch(self, key, client_secret):
+        """Vraag een nieuw token aan bij de identity provider en sla het op"""
+        tenant_id, client_id, scopes = key
+        client_app = self._get_client_app(tenant_id, client_id, client_secret)
+        self._count('token_fetches')
+        result = client_app.acquire_token_for_client(scopes=list(scopes))
+
+        if 'access_token' in result:
+            expires_at = time.time() + int(result.get('expires_in', 3600))
+            with self._lock:
+                self._tokens[key] = {'access_token': result['access_token'], 'expires_at': expires_at}
+        else:
+            self._count('fetch_errors')
+        return result
+
+    def _refresh_in_background(self, key, client_secret):
+        """Start een achtergrondvernieuwing als er nog geen loopt voor deze sleutel"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                with self._key_lock(key):
+                    self._count('background_refreshes')
+                    result = self._fetch(key, client_secret)
+                    if 'access_token' not in result:
+                        logger.warning(f"Achtergrondvernieuwing van token mislukt: {result.get('error')}")
+            except Exception as e:
+                logger.error(f"Fout bij achtergrondvernieuwing van token: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='msal-token-refresh', daemon=True).start()
+
+    def acquire_token(self, tenant_id, client_id, client_secret, scopes):
+        """
+        Verkrijg een toegangstoken, bij voorkeur uit de cache
+
+        Args:
+            tenant_id: Azure AD tenant ID
+            client_id: Client (applicatie) ID
+            client_secret: Client secret
+            scopes: Lijst met scopes
+
+        Returns:
+            dict: Resultaat in MSAL-formaat (met 'access_token' of 'error')
+        """
+        key = (tenant_id, client_id, tuple(sorted(scopes)))
+        now = time.time()
+
+        cached = self._cached_result(key, now)
+        if cached:
+            self._count('cache_hits')
+            if cached['expires_in'] < self.background_window:
+                self._refresh_in_background(key, client_secret)
+            return cached
+
+        with self._key_lock(key):
+            # Een andere thread kan het token intussen al hebben opgehaald
+            cached = self._cached_result(key, time.time())
+            if cached:
+                self._count('cache_hits')
+                return cached
+            return self._fetch(key, client_secret)
+
+    def invalidate(self, tenant_id=None, client_id=None):
+        """
+        Verwijder tokens uit de cache (bijv. na het wijzigen van de instellingen)
+
+        Args:
+            tenant_id: Alleen tokens van deze tenant (optioneel)
+            client_id: Alleen tokens van deze client (optioneel)
+        """
+        with self._lock:
+            for key in list(self._tokens):
+                if (tenant_id is None or key[0] == tenant_id) and (client_id is None or key[1] == client_id):
+                    del self._tokens[key]
+            for app_key in list(self._apps):
+                if (tenant_id is None or app_key[0] == tenant_id) and (client_id is None or app_key[1] == client_id):
+                    del self._apps[app_key]
+
+    def get_stats(self):
+        """Geef tellers van cache hits versus aanvragen bij de identity provider terug"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_tokens'] = len(self._tokens)
+        return stats
+
+
+# Singleton instantie
+token_cache = MSALTokenCache()
@@ -0,0 +1,215 @@
+"""
+Exportlaag voor rapporten en lijsten (CSV en Excel).
+
+Alle exports werken op een iterable van dicts plus een kolomselectie, zodat
+rijen rechtstreeks uit een databasequery kunnen komen:
+
+- CSV wordt als generator gestreamd; er staat nooit meer dan één blok rijen
+  in het geheugen.
+- Excel wordt met openpyxl in write-only modus naar een tijdelijk bestand
+  geschreven en daarna in blokken verstuurd. Ook daar groeit het geheugen
+  niet mee met het aantal rijen.
+"""
+import io
+import os
+import csv
+import logging
+import tempfile
+from itertools import chain
+from datetime import date, datetime
+from decimal import Decimal
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Aantal CSV-rijen per blok dat naar de client gaat
+CSV_BATCH_ROWS = 500
+
+# Blokgrootte bij het versturen van een Excel-bestand
+FILE_CHUNK_SIZE = 64 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_MIMETYPE = 'text/csv'
+
+# Types die openpyxl zelf kan wegschrijven; al het andere (UUID, ...) wordt tekst
+_XLSX_TYPES = (str, int, float, Decimal, bool, date, datetime)
+
+
+def normalize_columns(columns):
+    """
+    Zet een kolomdefinitie om naar (sleutel, kop) tuples
+
+    Args:
+        columns: Lijst met sleutels of (sleutel, kop) tuples
+
+    Returns:
+        list: Lijst met (sleutel, kop) tuples
+    """
+    return [column if isinstance(column, tuple) else (column, str(column)) for column in columns]
+
+
+def select_columns(columns, requested):
+    """
+    Beperk de kolommen tot een selectie, in de volgorde van de selectie
+
+    Args:
+        columns: Beschikbare kolommen (sleutels of (sleutel, kop) tuples)
+        requested: Gewenste sleutels, als lijst of kommagescheiden tekst (bijv. ?columns=date,amount)
+
+    Returns:
+        list: (sleutel, kop) tuples; alle kolommen als er niets (geldigs) gevraagd is
+    """
+    columns = normalize_columns(columns)
+    if isinstance(requested, str):
+        requested = [key.strip() for key in requested.split(',')]
+    if not requested:
+        return columns
+
+    by_key = {str(key): (key, header) for key, header in columns}
+    selected = [by_key[key] for key in requested if key in by_key]
+    return selected or columns
+
+
+def _resolve(rows, columns):
+    """Bepaal de kolommen; zonder definitie worden de sleutels van de eerste rij gebruikt"""
+    rows = iter(rows)
+    if columns is not None:
+        return normalize_columns(columns), rows
+    first = next(rows, None)
+    if first is None:
+        return [], rows
+    return normalize_columns(list(first.keys())), chain([first], rows)
+
+
+def iter_csv(rows, columns=None, delimiter=',', include_header=True):
+    """
+    Schrijf rijen als CSV, blok voor blok
+
+    Args:
+        rows: Iterable van dicts
+        columns: Sleutels of (sleutel, kop) tuples (standaard de sleutels van de eerste rij)
+        delimiter: Scheidingsteken
+        include_header: Of de eerste regel de kolomkoppen bevat
+
+    Yields:
+        str: Opeenvolgende stukken CSV
+    """
+    columns, rows = _resolve(rows, columns)
+    keys = [key for key, _ in columns]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, quoting=csv.QUOTE_MINIMAL)
+    if include_header:
+        writer.writerow([header for _, header in columns])
+
+    pending = 0
+    for row in rows:
+        writer.writerow([row.get(key) for key in keys])
+        pending += 1
+        if pending >= CSV_BATCH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _xlsx_value(value):
+    if value is None or isinstance(value, _XLSX_TYPES):
+        return value
+    return str(value)
+
+
+def write_xlsx(rows, columns=None, sheet_title='Export', include_header=True):
+    """
+    Schrijf rijen naar een tijdelijk Excel-bestand (openpyxl write-only modus)
+
+    Args:
+        rows: Iterable van dicts
+        columns: Sleutels of (sleutel, kop) tuples (standaard de sleutels van de eerste rij)
+        sheet_title: Naam van het werkblad
+        include_header: Of de eerste rij de kolomkoppen bevat
+
+    Returns:
+        str: Pad naar het tijdelijke bestand; de aanroeper ruimt het op
+    """
+    from openpyxl import Workbook
+
+    columns, rows = _resolve(rows, columns)
+    keys = [key for key, _ in columns]
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title[:31])
+    if include_header:
+        sheet.append([header for _, header in columns])
+    for row in rows:
+        sheet.append([_xlsx_value(row.get(key)) for key in keys])
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def _iter_file(path):
+    """Lees een tijdelijk bestand in blokken en verwijder het daarna"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            logger.warning(f"Tijdelijk exportbestand {path} kon niet verwijderd worden")
+
+
+def export_response(export_format, rows, columns=None, filename='export', sheet_title='Export'):
+    """
+    Maak een downloadresponse voor een export
+
+    Args:
+        export_format: 'excel' of 'csv'
+        rows: Iterable van dicts (mag een generator over een query zijn)
+        columns: Sleutels of (sleutel, kop) tuples
+        filename: Bestandsnaam zonder extensie
+        sheet_title: Naam van het werkblad (alleen Excel)
+
+    Returns:
+        Response, of None bij een onbekend formaat
+    """
+    from flask import Response, stream_with_context
+    from werkzeug.utils import secure_filename
+
+    filename = secure_filename(filename) or 'export'
+
+    if export_format == 'csv':
+        # Rijen worden pas tijdens het versturen opgehaald; de request context
+        # (en daarmee de databasesessie) blijft zo lang beschikbaar
+        return Response(
+            stream_with_context(iter_csv(rows, columns)),
+            mimetype=CSV_MIMETYPE,
+            headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'}
+        )
+
+    if export_format == 'excel':
+        path = write_xlsx(rows, columns, sheet_title=sheet_title)
+        return Response(
+            _iter_file(path),
+            mimetype=XLSX_MIMETYPE,
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}.xlsx"',
+                'Content-Length': str(os.path.getsize(path))
+            }
+        )
+
+    return None
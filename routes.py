@@ -5,8 +5,9 @@ import json
 import traceback
 from datetime import datetime, date, timedelta
 from decimal import Decimal
-from flask import render_template, request, redirect, url_for, flash, send_file, jsonify, session, abort, g
+from flask import render_template, request, redirect, url_for, flash, send_file, jsonify, session, abort, g, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
+from werkzeug.utils import secure_filename
 from app import app, db
 from email_service import EmailService, EmailServiceHelper
 from email_service_oauth import EmailServiceOAuth, EmailServiceOAuthHelper
@@ -16,15 +17,19 @@ logger = logging.getLogger(__name__)
 from models import (
     Customer, Invoice, User, UserPermission, Workspace, EmailSettings, EmailMessage, get_next_invoice_number, check_duplicate_invoice, add_invoice,
     calculate_vat_report, get_monthly_summary, get_quarterly_summary, get_customer_summary,
-    get_users, get_user, create_user, update_user, delete_user
+    get_users, get_user, create_user, update_user, delete_user, search_customers, iter_invoice_export_rows
 )
 from utils import (
-    format_currency, format_decimal, generate_pdf_invoice, export_to_excel, export_to_csv,
+    format_currency, format_decimal,
     get_vat_rates, date_to_quarter, get_quarters, get_months, get_years,
-    save_uploaded_file, allowed_file, permission_required, check_permission
+    save_uploaded_file, allowed_file, permission_required, check_permission, invalidate_permission_cache
 )
 from file_processor import FileProcessor
 from token_helper import token_helper
+from msal_token_cache import token_cache
+from bulk_upload_store import bulk_upload_store, paginate_section, empty_results, RESULT_SECTIONS
+from invoice_pdf import invoice_pdf_renderer
+from report_export import export_response, select_columns
 
 # Authentication routes
 @app.route('/login', methods=['GET', 'POST'])
@@ -655,6 +660,9 @@ def new_invoice():
             db.session.add(invoice)
             db.session.commit()
             
+            # PDF alvast renderen (alleen als INVOICE_PDF_WARMUP aan staat)
+            invoice_pdf_renderer.warm_up(invoice.id)
+            
             flash('Factuur succesvol toegevoegd', 'success')
             return redirect(url_for('invoices_list'))
             
@@ -971,17 +979,12 @@ def generate_invoice_pdf(invoice_id):
             flash('Klant niet gevonden', 'danger')
             return redirect(url_for('invoices_list'))
         
-        # Convert to dictionary format for the PDF generation
-        invoice_dict = invoice.to_dict()
-        customer_dict = customer.to_dict()
-        
-        # Generate PDF
-        pdf_path = generate_pdf_invoice(invoice_dict, customer_dict)
+        # Generate PDF (uit de cache als factuur, klant en template niet gewijzigd zijn)
+        pdf_path = invoice_pdf_renderer.get_pdf_path(invoice, customer)
         
         # Filename for download
         filename = f"Factuur-{invoice.invoice_number}.pdf"
         
-        # Send file and then delete it after sending
         return send_file(
             pdf_path,
             as_attachment=True,
@@ -1239,40 +1242,53 @@ def view_customer(customer_id):
             flash('Klant niet gevonden', 'danger')
             return redirect(url_for('customers_list'))
         
-        # Query customer invoices - all and separate processed/unprocessed
+        # Query customer invoices (alleen van de huidige werkruimte)
         invoice_query = Invoice.query.filter_by(customer_id=customer.id)
         # Alle gebruikers (inclusief super admins in workspace mode) krijgen alleen hun eigen workspace data
         workspace_id = current_user.workspace_id
         if workspace_id:
             invoice_query = invoice_query.filter_by(workspace_id=workspace_id)
-        customer_invoices_query = invoice_query.all()
         
-        # Filter processed and unprocessed invoices
-        processed_invoices = [invoice.to_dict() for invoice in customer_invoices_query 
-                              if invoice.status == 'processed' or invoice.status is None]
-        unprocessed_invoices = [invoice.to_dict() for invoice in customer_invoices_query 
-                               if invoice.status == 'unprocessed']
+        # Totalen in één aggregatiequery, gegroepeerd op status en type
+        totals = invoice_query.with_entities(
+            Invoice.status, Invoice.invoice_type,
+            db.func.count(Invoice.id), db.func.coalesce(db.func.sum(Invoice.amount_incl_vat), 0)
+        ).group_by(Invoice.status, Invoice.invoice_type).all()
+        
+        invoice_count = sum(count for _, _, count, _ in totals)
+        processed_count = sum(count for status, _, count, _ in totals if status == 'processed' or status is None)
+        unprocessed_count = sum(count for status, _, count, _ in totals if status == 'unprocessed')
+        total_income = sum(amount for _, invoice_type, _, amount in totals if invoice_type == 'income')
+        total_expense = sum(amount for _, invoice_type, _, amount in totals if invoice_type == 'expense')
+        
+        # Alleen de huidige pagina van iedere lijst laden (?processed_page=N / ?unprocessed_page=N)
+        per_page = min(max(request.args.get('per_page', default=25, type=int), 1), 100)
+        ordered_query = invoice_query.order_by(Invoice.date.desc(), Invoice.created_at.desc())
+        processed_page = ordered_query.filter(
+            db.or_(Invoice.status == 'processed', Invoice.status.is_(None))
+        ).paginate(page=request.args.get('processed_page', default=1, type=int),
+                   per_page=per_page, error_out=False, count=False)
+        unprocessed_page = ordered_query.filter(Invoice.status == 'unprocessed').paginate(
+            page=request.args.get('unprocessed_page', default=1, type=int),
+            per_page=per_page, error_out=False, count=False
+        )
+        # De aantallen zijn al bekend uit de aggregatiequery
+        processed_page.total = processed_count
+        unprocessed_page.total = unprocessed_count
         
         # Convert to dictionary format for the template
         customer_data = customer.to_dict()
         
-        # Calculate total income and expense
-        total_income = sum(
-            inv.amount_incl_vat 
-            for inv in customer_invoices_query 
-            if inv.invoice_type == 'income'
-        )
-        total_expense = sum(
-            inv.amount_incl_vat 
-            for inv in customer_invoices_query 
-            if inv.invoice_type == 'expense'
-        )
-        
         return render_template(
             'customer_detail.html',
             customer=customer_data,
-            invoices=processed_invoices,
-            unprocessed_invoices=unprocessed_invoices,
+            invoices=[invoice.to_dict() for invoice in processed_page.items],
+            unprocessed_invoices=[invoice.to_dict() for invoice in unprocessed_page.items],
+            processed_pagination=processed_page,
+            unprocessed_pagination=unprocessed_page,
+            invoice_count=invoice_count,
+            unprocessed_count=unprocessed_count,
+            active_tab='unprocessed' if request.args.get('tab') == 'unprocessed' else 'processed',
             total_income=total_income,
             total_expense=total_expense,
             format_currency=format_currency,
@@ -1465,24 +1481,18 @@ def bulk_action_customers():
                     customers_data.append(customer_dict)
             
             if customers_data:
-                # Generate Excel file with customer data
-                excel_file = export_to_excel(
-                    customers_data, 
-                    'klanten_export.xlsx',
+                # Return Excel file with customer data as download
+                return export_response(
+                    'excel',
+                    customers_data,
                     columns=[
                         'company_name', 'first_name', 'last_name', 'vat_number', 
                         'email', 'phone', 'street', 'house_number', 
                         'postal_code', 'city', 'country', 'customer_type',
                         'invoice_count', 'total_income', 'total_expense'
-                    ]
-                )
-                
-                # Return Excel file as download
-                return send_file(
-                    excel_file,
-                    as_attachment=True,
-                    download_name='klanten_export.xlsx',
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                    ],
+                    filename='klanten_export',
+                    sheet_title='Klanten'
                 )
             else:
                 flash('Geen klantgegevens beschikbaar voor export', 'warning')
@@ -1589,30 +1599,14 @@ def monthly_report(year):
     # Get export format
     export_format = request.args.get('format')
     if export_format:
-        if export_format == 'excel':
-            temp_file = export_to_excel(
-                monthly_data, 
-                f'Monthly_Report_{year}.xlsx',
-                columns=['month_name', 'income', 'expenses', 'profit', 'vat_collected', 'vat_paid', 'vat_balance']
-            )
-            return send_file(
-                temp_file,
-                as_attachment=True,
-                download_name=f'Monthly_Report_{year}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        elif export_format == 'csv':
-            temp_file = export_to_csv(
-                monthly_data, 
-                f'Monthly_Report_{year}.csv',
-                columns=['month_name', 'income', 'expenses', 'profit', 'vat_collected', 'vat_paid', 'vat_balance']
-            )
-            return send_file(
-                temp_file,
-                as_attachment=True,
-                download_name=f'Monthly_Report_{year}.csv',
-                mimetype='text/csv'
-            )
+        response = export_response(
+            export_format,
+            monthly_data,
+            columns=select_columns(['month_name', 'income', 'expenses', 'profit', 'vat_collected', 'vat_paid', 'vat_balance'], request.args.get('columns')),
+            filename=f'Monthly_Report_{year}'
+        )
+        if response is not None:
+            return response
     
     # Regular HTML response
     return render_template(
@@ -1643,30 +1637,14 @@ def quarterly_report(year):
     # Get export format
     export_format = request.args.get('format')
     if export_format:
-        if export_format == 'excel':
-            temp_file = export_to_excel(
-                quarterly_data, 
-                f'Quarterly_Report_{year}.xlsx',
-                columns=['quarter', 'income', 'expenses', 'profit', 'vat_collected', 'vat_paid', 'vat_balance']
-            )
-            return send_file(
-                temp_file,
-                as_attachment=True,
-                download_name=f'Quarterly_Report_{year}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        elif export_format == 'csv':
-            temp_file = export_to_csv(
-                quarterly_data, 
-                f'Quarterly_Report_{year}.csv',
-                columns=['quarter', 'income', 'expenses', 'profit', 'vat_collected', 'vat_paid', 'vat_balance']
-            )
-            return send_file(
-                temp_file,
-                as_attachment=True,
-                download_name=f'Quarterly_Report_{year}.csv',
-                mimetype='text/csv'
-            )
+        response = export_response(
+            export_format,
+            quarterly_data,
+            columns=select_columns(['quarter', 'income', 'expenses', 'profit', 'vat_collected', 'vat_paid', 'vat_balance'], request.args.get('columns')),
+            filename=f'Quarterly_Report_{year}'
+        )
+        if response is not None:
+            return response
     
     # Regular HTML response
     return render_template(
@@ -1697,30 +1675,14 @@ def customer_report():
     # Get export format
     export_format = request.args.get('format')
     if export_format:
-        if export_format == 'excel':
-            temp_file = export_to_excel(
-                customer_data, 
-                'Customer_Report.xlsx',
-                columns=['customer_name', 'income', 'vat_collected', 'invoice_count']
-            )
-            return send_file(
-                temp_file,
-                as_attachment=True,
-                download_name='Customer_Report.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        elif export_format == 'csv':
-            temp_file = export_to_csv(
-                customer_data, 
-                'Customer_Report.csv',
-                columns=['customer_name', 'income', 'vat_collected', 'invoice_count']
-            )
-            return send_file(
-                temp_file,
-                as_attachment=True,
-                download_name='Customer_Report.csv',
-                mimetype='text/csv'
-            )
+        response = export_response(
+            export_format,
+            customer_data,
+            columns=select_columns(['customer_name', 'income', 'vat_collected', 'invoice_count'], request.args.get('columns')),
+            filename='Customer_Report'
+        )
+        if response is not None:
+            return response
     
     # Regular HTML response
     return render_template(
@@ -1734,6 +1696,42 @@ def customer_report():
         now=datetime.now()
     )
 
+# Kolommen van de jaarexport van facturen
+INVOICE_EXPORT_COLUMNS = [
+    ('invoice_number', 'Factuurnummer'),
+    ('date', 'Datum'),
+    ('customer_name', 'Klant'),
+    ('vat_number', 'BTW-nummer'),
+    ('invoice_type', 'Type'),
+    ('amount_excl_vat', 'Bedrag excl. BTW'),
+    ('vat_rate', 'BTW-tarief'),
+    ('vat_amount', 'BTW-bedrag'),
+    ('amount_incl_vat', 'Bedrag incl. BTW'),
+    ('status', 'Status')
+]
+
+@app.route('/reports/invoices/<int:year>', methods=['GET'])
+@login_required
+@permission_required('can_export_reports')
+def invoice_export(year):
+    """Exporteer alle facturen van een jaar; rijen worden per blok uit de database gelezen"""
+    # Super admin zonder actieve workspace sessie kan geen rapporten zien
+    if current_user.is_super_admin and not session.get('super_admin_id') and not current_user.workspace_id:
+        flash('U moet eerst een werkruimte kiezen om rapporten te bekijken', 'warning')
+        return redirect(url_for('dashboard'))
+    
+    response = export_response(
+        request.args.get('format', 'excel'),
+        iter_invoice_export_rows(year, current_user.workspace_id),
+        columns=select_columns(INVOICE_EXPORT_COLUMNS, request.args.get('columns')),
+        filename=f'Facturen_{year}',
+        sheet_title=f'Facturen {year}'
+    )
+    if response is None:
+        flash('Ongeldig exportformaat', 'warning')
+        return redirect(url_for('reports'))
+    return response
+
 # VAT report routes
 @app.route('/vat-report')
 @login_required
@@ -1786,46 +1784,16 @@ def generate_vat_report():
     # Get export format
     export_format = request.form.get('export_format')
     if export_format:
-        if export_format == 'excel':
-            # Prepare data for export
-            export_data = [{
-                'Period': period_name,
-                'Grid 03 (Sales excl. VAT)': report['grid_03'],
-                'Grid 54 (Output VAT)': report['grid_54'],
-                'Grid 59 (Input VAT)': report['grid_59'],
-                'Grid 71 (VAT Balance)': report['grid_71']
-            }]
-            
-            temp_file = export_to_excel(
-                export_data, 
-                f'VAT_Report_{period_name}.xlsx'
-            )
-            return send_file(
-                temp_file,
-                as_attachment=True,
-                download_name=f'VAT_Report_{period_name}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        elif export_format == 'csv':
-            # Prepare data for export
-            export_data = [{
-                'Period': period_name,
-                'Grid 03 (Sales excl. VAT)': report['grid_03'],
-                'Grid 54 (Output VAT)': report['grid_54'],
-                'Grid 59 (Input VAT)': report['grid_59'],
-                'Grid 71 (VAT Balance)': report['grid_71']
-            }]
-            
-            temp_file = export_to_csv(
-                export_data, 
-                f'VAT_Report_{period_name}.csv'
-            )
-            return send_file(
-                temp_file,
-                as_attachment=True,
-                download_name=f'VAT_Report_{period_name}.csv',
-                mimetype='text/csv'
-            )
+        export_data = [{
+            'Period': period_name,
+            'Grid 03 (Sales excl. VAT)': report['grid_03'],
+            'Grid 54 (Output VAT)': report['grid_54'],
+            'Grid 59 (Input VAT)': report['grid_59'],
+            'Grid 71 (VAT Balance)': report['grid_71']
+        }]
+        response = export_response(export_format, export_data, filename=f'VAT_Report_{period_name}', sheet_title='BTW')
+        if response is not None:
+            return response
     
     # Get customer information for invoices
     # Print debug information about invoices to understand their structure
@@ -1872,6 +1840,40 @@ def generate_vat_report():
     )
 
 # Bulk upload routes
+def _picker_customers(customer_id):
+    """
+    Geef de voorgeselecteerde klant terug voor de klantkiezer (alleen uit de eigen werkruimte).
+    De overige klanten worden door de kiezer via /api/customers/lookup opgehaald.
+    """
+    if not customer_id or not current_user.workspace_id:
+        return []
+    try:
+        customer = Customer.query.filter_by(
+            id=uuid.UUID(str(customer_id)), workspace_id=current_user.workspace_id
+        ).first()
+    except ValueError:
+        return []
+    if not customer:
+        return []
+    return [{
+        'id': str(customer.id),
+        'name': customer.name,
+        'customer_type': customer.customer_type,
+        'default_vat_rate': customer.default_vat_rate
+    }]
+
+@app.route('/api/customers/lookup')
+@login_required
+@permission_required('can_upload_invoices')
+def customer_lookup():
+    """Klantkiezer: zoek klanten van de huidige werkruimte op naam of BTW-nummer"""
+    workspace_id = current_user.workspace_id
+    if not workspace_id:
+        return jsonify([])
+    
+    limit = min(max(request.args.get('limit', default=20, type=int), 1), 50)
+    return jsonify(search_customers(workspace_id, request.args.get('q'), limit=limit))
+
 @app.route('/bulk-upload', methods=['GET', 'POST'])
 @login_required
 @permission_required('can_upload_invoices')
@@ -1891,20 +1893,20 @@ def bulk_upload():
         # Check if any files were uploaded
         if 'files[]' not in request.files:
             flash('Geen bestanden geselecteerd', 'danger')
-            customers_data = [customer.to_dict() for customer in Customer.query.all()]
             return render_template(
                 'bulk_upload.html',
-                customers=customers_data,
+                customers=_picker_customers(customer_id),
+                selected_customer=customer_id,
                 now=datetime.now()
             )
         
         files = request.files.getlist('files[]')
         if not files or all(not f.filename for f in files):
             flash('Geen bestanden geselecteerd', 'danger')
-            customers_data = [customer.to_dict() for customer in Customer.query.all()]
             return render_template(
                 'bulk_upload.html',
-                customers=customers_data,
+                customers=_picker_customers(customer_id),
+                selected_customer=customer_id,
                 now=datetime.now()
             )
         
@@ -1914,7 +1916,6 @@ def bulk_upload():
         
         # Voorinformatieformulieren voorbereiden
         file_previews = []
-        customers_data = [customer.to_dict() for customer in Customer.query.all()]
         
         for file_path in saved_paths:
             # Basisinfo uit bestandsnaam halen (eenvoudige implementatie)
@@ -1943,38 +1944,32 @@ def bulk_upload():
             file_previews.append(preview)
         
         if file_previews:
-            # Bewaar de previews in de sessie
-            session['file_previews'] = file_previews
-            
-            # Ga naar het reviewformulier
+            # Ga naar het reviewformulier (de previews gaan via het formulier mee,
+            # niet via de sessiecookie)
             return render_template(
                 'bulk_upload_review.html',
                 file_previews=file_previews,
-                customers=customers_data,
+                customers=_picker_customers(customer_id),
                 vat_rates=get_vat_rates(),
                 now=datetime.now()
             )
         else:
             flash('Geen bestanden werden geüpload', 'warning')
-            customers_data = [customer.to_dict() for customer in Customer.query.all()]
             return render_template(
                 'bulk_upload.html',
-                customers=customers_data,
+                customers=_picker_customers(customer_id),
+                selected_customer=customer_id,
                 now=datetime.now()
             )
     
     # GET request - show the form
-    customers_data = [customer.to_dict() for customer in Customer.query.all()]
     selected_customer = None
+    customers_data = _picker_customers(url_customer_id)
     
     # Set pre-selected customer if specified in URL
-    if url_customer_id:
+    if customers_data:
         selected_customer = url_customer_id
-        # Try to get customer name for displaying
-        for customer in customers_data:
-            if str(customer['id']) == url_customer_id:
-                flash(f"Bestanden worden geüpload voor klant: {customer['name']}", 'info')
-                break
+        flash(f"Bestanden worden geüpload voor klant: {customers_data[0]['name']}", 'info')
     
     return render_template(
         'bulk_upload.html',
@@ -1983,6 +1978,71 @@ def bulk_upload():
         now=datetime.now()
     )
 
+def _selected_invoices(selected_ids):
+    """Laad de geselecteerde facturen van de huidige werkruimte in één query"""
+    invoice_ids = []
+    for invoice_id in selected_ids:
+        try:
+            invoice_ids.append(uuid.UUID(invoice_id) if isinstance(invoice_id, str) else invoice_id)
+        except ValueError:
+            continue
+    if not invoice_ids:
+        return []
+
+    query = Invoice.query.filter(Invoice.id.in_(invoice_ids))
+    if current_user.workspace_id:
+        query = query.filter_by(workspace_id=current_user.workspace_id)
+    return query.order_by(Invoice.date).all()
+
+
+def _invoice_pdf_zip_response(invoices, download_name):
+    """Stream de PDF's van de facturen als ZIP-download"""
+    customer_ids = {invoice.customer_id for invoice in invoices}
+    customers = {customer.id: customer for customer in Customer.query.filter(Customer.id.in_(customer_ids))}
+    items = [(invoice, customers[invoice.customer_id]) for invoice in invoices if invoice.customer_id in customers]
+
+    logger.info(f"PDF export van {len(items)} facturen gestart door {current_user.username}")
+    # Bestandsnaam zonder tekens die de header kunnen breken
+    download_name = secure_filename(download_name) or 'Facturen.zip'
+    return Response(
+        stream_with_context(invoice_pdf_renderer.iter_zip(items)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+    )
+
+
+@app.route('/invoices/export/pdf')
+@login_required
+@permission_required('can_manage_invoices')
+def export_invoices_pdf():
+    """Download alle facturen binnen de filters van het factuuroverzicht (bijv. een kwartaal) als ZIP"""
+    if not current_user.workspace_id:
+        flash('U moet eerst een werkruimte kiezen om facturen te exporteren', 'warning')
+        return redirect(url_for('dashboard'))
+
+    query = Invoice.query.filter_by(workspace_id=current_user.workspace_id)
+    try:
+        if request.args.get('customer_id'):
+            query = query.filter(Invoice.customer_id == uuid.UUID(request.args['customer_id']))
+        if request.args.get('type'):
+            query = query.filter(Invoice.invoice_type == request.args['type'])
+        if request.args.get('start_date'):
+            query = query.filter(Invoice.date >= datetime.strptime(request.args['start_date'], '%Y-%m-%d').date())
+        if request.args.get('end_date'):
+            query = query.filter(Invoice.date <= datetime.strptime(request.args['end_date'], '%Y-%m-%d').date())
+    except ValueError:
+        flash('Ongeldige filter voor de export', 'danger')
+        return redirect(url_for('invoices_list'))
+
+    invoices = query.order_by(Invoice.date).all()
+    if not invoices:
+        flash('Geen facturen gevonden om te exporteren', 'info')
+        return redirect(url_for('invoices_list', **request.args))
+
+    period = '-'.join(filter(None, [request.args.get('start_date'), request.args.get('end_date')]))
+    return _invoice_pdf_zip_response(invoices, f"Facturen-{period or datetime.now().strftime('%Y%m%d')}.zip")
+
+
 @app.route('/invoices/bulk-action', methods=['POST'])
 @login_required
 @permission_required('can_manage_invoices')
@@ -2016,8 +2076,11 @@ def bulk_action_invoices():
             flash(f'{delete_count} facturen succesvol verwijderd', 'success')
         
     elif bulk_action == 'export_pdf':
-        # Not implemented yet - would create a ZIP file with multiple PDFs
-        flash('PDF bulk export nog niet geïmplementeerd', 'info')
+        # Alle geselecteerde facturen als één ZIP met PDF's
+        invoices = _selected_invoices(selected_ids)
+        if invoices:
+            return _invoice_pdf_zip_response(invoices, f"Facturen-{datetime.now().strftime('%Y%m%d')}.zip")
+        flash('Geen geldige facturen geselecteerd', 'warning')
         
     elif bulk_action == 'change_status':
         # Change the status of selected invoices (processed/unprocessed)
@@ -2094,8 +2157,11 @@ def bulk_action_customer_invoices(customer_id):
             flash(f'{delete_count} facturen succesvol verwijderd', 'success')
         
     elif bulk_action == 'export_pdf':
-        # Not implemented yet - would create a ZIP file with multiple PDFs
-        flash('PDF bulk export nog niet geïmplementeerd', 'info')
+        # Alle geselecteerde facturen van deze klant als één ZIP met PDF's
+        invoices = [invoice for invoice in _selected_invoices(selected_ids) if invoice.customer_id == customer_id]
+        if invoices:
+            return _invoice_pdf_zip_response(invoices, f"Facturen-{customer.company_name}-{datetime.now().strftime('%Y%m%d')}.zip")
+        flash('Geen geldige facturen geselecteerd', 'warning')
         
     elif bulk_action == 'mark_processed':
         # Mark selected invoices as processed
@@ -2270,8 +2336,9 @@ def bulk_upload_process():
                 'error': str(e)
             })
     
-    # Bewaar resultaten in sessie
-    session['bulk_upload_results'] = results
+    # Bewaar resultaten server-side; in de sessie komt alleen het job-id
+    job_id = bulk_upload_store.save(results, owner_id=current_user.id)
+    session['bulk_upload_job_id'] = job_id
     
     # Bereid samenvatting voor
     summary = {
@@ -2291,7 +2358,7 @@ def bulk_upload_process():
     else:
         flash('Er zijn geen facturen aangemaakt', 'warning')
     
-    return redirect(url_for('bulk_upload_results'))
+    return redirect(url_for('bulk_upload_results', job_id=job_id))
 
 def process_to_customer_portal(file_data):
     """
@@ -2380,29 +2447,48 @@ def process_to_customer_portal(file_data):
 @login_required
 @permission_required('can_upload_invoices')
 def bulk_upload_results():
-    # Get results from session
-    results = session.get('bulk_upload_results', {
-        'saved_files': [],
-        'recognized_invoices': [],
-        'new_customers': [],
-        'manual_review': [],
-        'errors': []
-    })
+    # Haal het job-id op uit de URL of, als fallback, uit de sessie
+    job_id = request.args.get('job_id') or session.get('bulk_upload_job_id')
+    stored_results = bulk_upload_store.load(job_id, owner_id=current_user.id) if job_id else None
+    if stored_results is None:
+        if job_id:
+            flash('De resultaten van deze upload zijn niet meer beschikbaar', 'warning')
+        stored_results = empty_results()
     
     # Create a more detailed summary
     summary = {
-        'total_files': len(results['saved_files']),
-        'processed_invoices': len(results['recognized_invoices']),
-        'new_customers': len(results['new_customers']),
-        'manual_review': len(results['manual_review']),
-        'errors': len(results['errors'])
+        'total_files': len(stored_results['saved_files']),
+        'processed_invoices': len(stored_results['recognized_invoices']),
+        'new_customers': len(stored_results['new_customers']),
+        'manual_review': len(stored_results['manual_review']),
+        'errors': len(stored_results['errors'])
     }
     
-    # Get customers for displaying names instead of IDs
-    customers_dict = {c['id']: c for c in [customer.to_dict() for customer in Customer.query.all()]}
+    # Pagineer iedere sectie afzonderlijk (?<sectie>_page=N)
+    per_page = min(max(request.args.get('per_page', default=50, type=int), 1), 200)
+    pagination = {}
+    results = {}
+    for section in RESULT_SECTIONS:
+        page = request.args.get(f'{section}_page', default=1, type=int)
+        pagination[section] = paginate_section(stored_results[section], page, per_page)
+        results[section] = pagination[section]['items']
+    
+    # Haal alleen de klanten op die op de huidige pagina voorkomen
+    customer_ids = set()
+    for invoice in results['recognized_invoices']:
+        try:
+            customer_ids.add(uuid.UUID(invoice.get('customer_id')))
+        except (TypeError, ValueError):
+            continue
+    customers_dict = {}
+    if customer_ids:
+        customers_dict = {
+            str(customer.id): customer.to_dict()
+            for customer in Customer.query.filter(Customer.id.in_(customer_ids)).all()
+        }
     
     # Enrich invoice data with customer names
-    for invoice in results.get('recognized_invoices', []):
+    for invoice in results['recognized_invoices']:
         if invoice.get('customer_id') in customers_dict:
             invoice['customer_name'] = customers_dict[invoice['customer_id']]['name']
         else:
@@ -2412,6 +2498,8 @@ def bulk_upload_results():
         'bulk_upload_results.html',
         results=results,
         summary=summary,
+        pagination=pagination,
+        job_id=job_id,
         customers_dict=customers_dict,
         format_currency=format_currency,
         now=datetime.now()
@@ -2871,6 +2959,7 @@ def edit_permissions(user_id):
         # Opslaan in database
         try:
             db.session.commit()
+            invalidate_permission_cache(user.id)
             flash('Gebruikersrechten zijn bijgewerkt', 'success')
             return redirect(url_for('edit_permissions', user_id=user_id))
         except Exception as e:
@@ -2947,6 +3036,7 @@ def edit_user(user_id):
         # Update user
         try:
             update_user(user_id, email, new_password if new_password else None, is_admin, is_super_admin, workspace_id)
+            invalidate_permission_cache(user_id)
             flash(f'Gebruiker {user.username} is bijgewerkt', 'success')
             return redirect(url_for('admin'))
         except Exception as e:
@@ -3258,9 +3348,9 @@ def create_client():
                 customer_email=email
             )
             
-            # Send invitation email
+            # Send invitation email (via the outbox, so the request does not wait for the mail server)
             customer_name = f"{first_name} {last_name}" if first_name and last_name else None
-            email_service = EmailService()
+            email_service = EmailService(use_outbox=True)
             email_sent = email_service.send_workspace_invitation(
                 recipient_email=email,
                 workspace_name=workspace_name,
@@ -3269,7 +3359,7 @@ def create_client():
             )
             
             if email_sent:
-                flash(f"Klant \"{company_name}\" en werkruimte \"{workspace_name}\" aangemaakt. Uitnodiging verzonden naar {email}.", "success")
+                flash(f"Klant \"{company_name}\" en werkruimte \"{workspace_name}\" aangemaakt. Uitnodiging wordt verzonden naar {email}.", "success")
             else:
                 flash(f"Klant \"{company_name}\" en werkruimte \"{workspace_name}\" aangemaakt, maar de uitnodiging kon niet worden verzonden.", "warning")
             
@@ -3566,6 +3656,9 @@ def update_ms_graph_settings():
         # Sla de wijzigingen op in de database
         db.session.commit()
         
+        # Gecachte tokens van de oude credentials niet meer gebruiken
+        token_cache.invalidate()
+        
         # Update omgevingsvariabelen (belangrijk voor huidige sessie)
         os.environ['MS_GRAPH_CLIENT_ID'] = client_id
         os.environ['MS_GRAPH_TENANT_ID'] = tenant_id
@@ -3656,6 +3749,9 @@ def update_ms_oauth_settings():
         # Sla de wijzigingen op in de database
         db.session.commit()
         
+        # Gecachte tokens van de oude credentials niet meer gebruiken
+        token_cache.invalidate()
+        
         # Update omgevingsvariabelen (belangrijk voor huidige sessie)
         os.environ['MS_GRAPH_CLIENT_ID'] = client_id
         os.environ['MS_GRAPH_TENANT_ID'] = tenant_id
@@ -3834,8 +3930,8 @@ def invite_user():
                 is_admin=is_admin
             )
             
-            # Verzend uitnodigingsmail
-            email_service = EmailService()
+            # Verzend uitnodigingsmail via de e-mailwachtrij
+            email_service = EmailService(use_outbox=True)
             email_sent = email_service.send_user_invitation(
                 recipient_email=email,
                 workspace_name=workspace.name,
@@ -3844,7 +3940,7 @@ def invite_user():
             )
             
             if email_sent:
-                flash(f"Uitnodiging verzonden naar {email} voor werkruimte {workspace.name}.", "success")
+                flash(f"Uitnodiging wordt verzonden naar {email} voor werkruimte {workspace.name}.", "success")
             else:
                 flash(f"De uitnodiging kon niet worden verzonden naar {email}.", "warning")
             
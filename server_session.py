@@ -0,0 +1,327 @@
+"""
+Server-side sessieopslag voor Flask.
+
+Standaard bewaart Flask de volledige sessie in een ondertekende cookie, die bij
+ieder request heen en weer gaat en opnieuw ondertekend wordt. Met deze module
+bevat de cookie alleen nog een (ondertekend) sessie-id en staat de inhoud in
+een backend:
+
+- 'database': de tabel server_sessions in de applicatiedatabase (PostgreSQL)
+- 'sqlite': een lokaal SQLite-bestand (handig voor één server zonder extra tabel)
+
+Inschakelen via de omgevingsvariabele SESSION_BACKEND (standaard 'cookie').
+"""
+import os
+import time
+import secrets
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Sessie-object waarvan alleen het id in de cookie staat"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """
+        Geef de sessie een nieuw id met behoud van de inhoud (bij inloggen),
+        zodat een vooraf bekend sessie-id niet bruikbaar is (session fixation)
+        """
+        if self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class SessionBackend:
+    """Basisklasse voor sessie-backends"""
+
+    def get(self, sid):
+        """Geef de opgeslagen (geserialiseerde) sessie terug, of None"""
+        raise NotImplementedError
+
+    def set(self, sid, data, expires_at):
+        """Sla een geserialiseerde sessie (str) op tot expires_at (datetime)"""
+        raise NotImplementedError
+
+    def delete(self, sid):
+        """Verwijder een sessie"""
+        raise NotImplementedError
+
+    def sweep(self):
+        """Verwijder verlopen sessies en geef het aantal terug"""
+        raise NotImplementedError
+
+
+class DatabaseSessionBackend(SessionBackend):
+    """Bewaart sessies in de tabel server_sessions via de SQLAlchemy engine"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def table(self):
+        from models import ServerSession
+        return ServerSession.__table__
+
+    def get(self, sid):
+        table = self.table
+        with self.db.engine.connect() as conn:
+            row = conn.execute(
+                table.select().where(table.c.session_id == sid)
+            ).first()
+        if row is None:
+            return None
+        if row.expires_at and row.expires_at < datetime.now():
+            self.delete(sid)
+            return None
+        return row.data
+
+    def set(self, sid, data, expires_at):
+        table = self.table
+        values = {'session_id': sid, 'data': data, 'expires_at': expires_at}
+        with self.db.engine.begin() as conn:
+            if conn.dialect.name == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+                statement = insert(table).values(**values)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[table.c.session_id],
+                    set_={'data': data, 'expires_at': expires_at}
+                )
+                conn.execute(statement)
+            else:
+                updated = conn.execute(
+                    table.update().where(table.c.session_id == sid).values(data=data, expires_at=expires_at)
+                )
+                if updated.rowcount == 0:
+                    conn.execute(table.insert().values(**values))
+
+    def delete(self, sid):
+        table = self.table
+        with self.db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.session_id == sid))
+
+    def sweep(self):
+        table = self.table
+        with self.db.engine.begin() as conn:
+            result = conn.execute(table.delete().where(table.c.expires_at < datetime.now()))
+        return result.rowcount or 0
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Bewaart sessies in een lokaal SQLite-bestand (één verbinding per thread)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            # WAL zodat meerdere gunicorn workers tegelijk kunnen lezen en schrijven
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connection().execute(
+            "SELECT data, expires_at FROM sessions WHERE session_id = ?", (sid,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self.delete(sid)
+            return None
+        return row[0]
+
+    def set(self, sid, data, expires_at):
+        self._connection().execute(
+            "INSERT INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+            (sid, data, expires_at.timestamp())
+        )
+
+    def delete(self, sid):
+        self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (sid,))
+
+    def sweep(self):
+        cursor = self._connection().execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount or 0
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask SessionInterface die de sessie-inhoud in een backend bewaart.
+    De cookie bevat alleen een ondertekend sessie-id.
+    """
+    serializer = session_json_serializer
+    session_class = ServerSideSession
+
+    def __init__(self, backend, sweep_interval=600):
+        self.backend = backend
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0
+        self._sweep_lock = threading.Lock()
+
+    def _get_signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def _new_session(self):
+        return self.session_class(sid=secrets.token_urlsafe(32), new=True)
+
+    def open_session(self, app, request):
+        cookie_value = request.cookies.get(self.get_cookie_name(app))
+        if not cookie_value or not app.secret_key:
+            return self._new_session()
+
+        try:
+            sid = self._get_signer(app).unsign(cookie_value).decode('utf-8')
+        except BadSignature:
+            return self._new_session()
+
+        try:
+            stored = self.backend.get(sid)
+        except Exception as e:
+            logger.error(f"Fout bij het laden van sessie: {str(e)}")
+            stored = None
+
+        if stored is None:
+            return self._new_session()
+
+        try:
+            data = self.serializer.loads(stored.decode('utf-8') if isinstance(stored, bytes) else stored)
+        except Exception:
+            return self._new_session()
+        return self.session_class(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # Na regenerate() hoort het oude id nergens meer bij
+        if session.previous_sid and session.previous_sid != session.sid:
+            try:
+                self.backend.delete(session.previous_sid)
+            except Exception as e:
+                logger.error(f"Fout bij het verwijderen van oude sessie: {str(e)}")
+            session.previous_sid = None
+
+        # Lege sessie: verwijder de opslag en de cookie
+        if not session:
+            if session.modified:
+                try:
+                    self.backend.delete(session.sid)
+                except Exception as e:
+                    logger.error(f"Fout bij het verwijderen van sessie: {str(e)}")
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        cookie_expires = self.get_expiration_time(app, session)
+        stored_expires = datetime.now() + app.permanent_session_lifetime
+        try:
+            self.backend.set(session.sid, self.serializer.dumps(dict(session)), stored_expires)
+        except Exception as e:
+            logger.error(f"Fout bij het opslaan van sessie: {str(e)}")
+            return
+
+        signed_sid = self._get_signer(app).sign(session.sid.encode('utf-8')).decode('utf-8')
+        response.set_cookie(name, signed_sid, expires=cookie_expires, httponly=httponly,
+                            domain=domain, path=path, secure=secure, samesite=samesite)
+        response.vary.add('Cookie')
+
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        """Ruim verlopen sessies op, hooguit eens per sweep_interval per proces"""
+        now = time.time()
+        with self._sweep_lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            removed = self.backend.sweep()
+            if removed:
+                logger.info(f"{removed} verlopen sessies opgeruimd")
+        except Exception as e:
+            logger.error(f"Fout bij het opruimen van verlopen sessies: {str(e)}")
+
+
+def init_server_session(app, backend_name, db=None):
+    """
+    Activeer server-side sessies voor de app
+
+    Args:
+        app: Flask app
+        backend_name: 'database' of 'sqlite'
+        db: SQLAlchemy db instantie (vereist voor 'database')
+
+    Returns:
+        ServerSideSessionInterface: De geactiveerde session interface
+    """
+    if backend_name == 'database':
+        if db is None:
+            from database import db
+        backend = DatabaseSessionBackend(db)
+    elif backend_name == 'sqlite':
+        path = os.environ.get("SESSION_SQLITE_PATH", os.path.join("instance", "sessions.sqlite3"))
+        backend = SQLiteSessionBackend(path)
+    else:
+        raise ValueError(f"Onbekende sessie-backend: {backend_name}")
+
+    # Hoe lang sessies in de backend bewaard blijven (standaard Flask: 31 dagen)
+    lifetime_hours = os.environ.get("SESSION_LIFETIME_HOURS")
+    if lifetime_hours:
+        app.permanent_session_lifetime = timedelta(hours=int(lifetime_hours))
+    app.session_interface = ServerSideSessionInterface(backend)
+
+    # Nieuw sessie-id bij elke login (bescherming tegen session fixation)
+    from flask_login import user_logged_in
+
+    @user_logged_in.connect_via(app)
+    def _regenerate_session_on_login(sender, user, **extra):
+        from flask import session
+        if isinstance(session, ServerSideSession):
+            session.regenerate()
+
+    logger.info(f"Server-side sessies geactiveerd met backend '{backend_name}'")
+    return app.session_interface
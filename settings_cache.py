@@ -0,0 +1,189 @@
+"""
+Procescache voor integratie-instellingen (WHMCS, Mollie en e-mail) en
+e-mailtemplates.
+
+Services zoals WHMCSService en EmailService worden per request aangemaakt
+en lazen daarbij telkens hun instellingen uit de database. Deze cache
+bewaart per proces een losgekoppelde kopie van de instellingen:
+
+- Wijzigingen via de ORM (SystemSettings, MollieSettings, EmailSettings,
+  EmailTemplate) maken de cache van dit proces leeg zodra de transactie gecommit is.
+- Andere processen (gunicorn-workers) zien een wijziging uiterlijk na
+  SETTINGS_CACHE_TTL seconden.
+
+De kopieën zijn nieuwe, niet aan een sessie gekoppelde modelobjecten; ze
+mogen gelezen worden maar worden nooit opgeslagen. Code die instellingen
+wijzigt moet ze zelf uit de database ophalen.
+"""
+import os
+import time
+import logging
+import threading
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from models import SystemSettings, MollieSettings, EmailSettings, EmailTemplate
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Maximale leeftijd van een cache-item in seconden (0 = niet cachen)
+SETTINGS_CACHE_TTL = float(os.environ.get('SETTINGS_CACHE_TTL', 60))
+
+# Soort instellingen per model; bij een wijziging wordt die soort leeggemaakt
+_MODEL_KINDS = {
+    SystemSettings: 'whmcs',
+    MollieSettings: 'mollie',
+    EmailSettings: 'email',
+    EmailTemplate: 'email_template',
+}
+
+_SESSION_KEY = 'settings_cache_invalidate'
+
+
+def _detached_copy(instance):
+    """Maak een losgekoppelde kopie van een modelobject met dezelfde kolomwaarden"""
+    if instance is None:
+        return None
+    mapper = inspect(instance).mapper
+    return mapper.class_(**{attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs})
+
+
+class SettingsCache:
+    """Cache van instellingen per soort en werkruimte"""
+
+    def __init__(self, ttl=None):
+        """
+        Args:
+            ttl: Maximale leeftijd van een item in seconden (standaard SETTINGS_CACHE_TTL)
+        """
+        self.ttl = ttl if ttl is not None else SETTINGS_CACHE_TTL
+        self._entries = {}
+        self._generation = 0   # Verhoogd bij elke invalidatie
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+            generation = self._generation
+
+        value = _detached_copy(loader())
+        with self._lock:
+            # Niet bewaren als de cache intussen leeggemaakt is: de waarde kan al verouderd zijn
+            if self.ttl and generation == self._generation:
+                self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def whmcs_settings(self):
+        """
+        WHMCS-instellingen (SystemSettings met key 'whmcs_integration')
+
+        Returns:
+            SystemSettings: Losgekoppelde kopie, of None
+        """
+        return self._get(
+            ('whmcs',),
+            lambda: SystemSettings.query.filter_by(key='whmcs_integration').first()
+        )
+
+    def mollie_settings(self, workspace_id=None):
+        """
+        Mollie-instellingen van een werkruimte, of de systeeminstellingen
+
+        Args:
+            workspace_id: Optionele workspace ID
+
+        Returns:
+            MollieSettings: Losgekoppelde kopie, of None
+        """
+        if workspace_id:
+            loader = lambda: MollieSettings.query.filter_by(workspace_id=workspace_id).first()
+        else:
+            loader = lambda: MollieSettings.query.filter_by(is_system_default=True).first()
+        return self._get(('mollie', workspace_id), loader)
+
+    def email_settings(self, workspace_id=None):
+        """
+        E-mailinstellingen van een werkruimte, of de systeeminstellingen (workspace_id=None)
+
+        Args:
+            workspace_id: Optionele workspace ID
+
+        Returns:
+            EmailSettings: Losgekoppelde kopie, of None
+        """
+        return self._get(
+            ('email', workspace_id),
+            lambda: EmailSettings.query.filter_by(workspace_id=workspace_id).first()
+        )
+
+    def email_template(self, workspace_id, name):
+        """
+        E-mailtemplate op naam: dat van de werkruimte, anders het systeemtemplate.
+        Ook 'niet gevonden' wordt gecachet.
+
+        Args:
+            workspace_id: Workspace ID, of None voor alleen het systeemtemplate
+            name: Naam van het template
+
+        Returns:
+            EmailTemplate: Losgekoppelde kopie, of None
+        """
+        def loader():
+            template = None
+            if workspace_id:
+                template = EmailTemplate.query.filter_by(workspace_id=workspace_id, name=name).first()
+            return template or EmailTemplate.query.filter_by(workspace_id=None, name=name).first()
+
+        return self._get(('email_template', workspace_id, name), loader)
+
+    def invalidate(self, kind=None):
+        """
+        Maak de cache (van één soort) leeg
+
+        Args:
+            kind: 'whmcs', 'mollie', 'email' of 'email_template'; None voor alles
+        """
+        with self._lock:
+            if kind is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == kind]:
+                    del self._entries[key]
+            self._generation += 1
+            self._stats['invalidations'] += 1
+        logger.debug(f"Instellingencache leeggemaakt: {kind or 'alles'}")
+
+    def get_stats(self):
+        """Geef het aantal hits, misses, invalidaties en items in de cache terug"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+# Singleton instantie
+settings_cache = SettingsCache()
+
+
+def _mark_changed(mapper, connection, target):
+    """Onthoud op de sessie welke soort instellingen gewijzigd is"""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_KEY, set()).add(_MODEL_KINDS[mapper.class_])
+
+
+for _model in _MODEL_KINDS:
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _mark_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    # Pas na de commit leegmaken; anders kan een andere thread de oude waarden opnieuw
+    # cachen. Na een rollback blijft de markering staan; onnodig leegmaken kan geen kwaad.
+    for kind in session.info.pop(_SESSION_KEY, ()):
+        settings_cache.invalidate(kind)
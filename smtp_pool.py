@@ -0,0 +1,220 @@
+"""
+Gedeelde SMTP-verbindingen voor het versturen van e-mail.
+
+SMTPProvider maakte per bericht een nieuwe verbinding, met TLS-handshake en
+login. Deze pool bewaart per proces en per SMTP-account (server, poort,
+gebruiker, wachtwoord, SSL/TLS) ingelogde verbindingen, zodat opeenvolgende
+berichten (uitnodigingen, herinneringen, de e-mailwachtrij) dezelfde sessie
+gebruiken:
+
+- Een verbinding wordt steeds door één thread tegelijk gebruikt; threads die
+  tegelijk versturen krijgen elk een eigen verbinding.
+- Verbindingen die langer dan SMTP_POOL_IDLE_SECONDS ongebruikt zijn, of
+  SMTP_POOL_MAX_MESSAGES berichten verstuurd hebben, worden gesloten.
+- Heeft de server een bewaarde verbinding intussen verbroken
+  (SMTPServerDisconnected), dan wordt het bericht opnieuw verstuurd over
+  een andere of nieuwe verbinding. Mislukt dat op een nieuwe verbinding,
+  dan volgt de fout zoals voorheen.
+"""
+import os
+import ssl
+import time
+import atexit
+import hashlib
+import logging
+import smtplib
+import threading
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Hoe lang een ongebruikte verbinding open blijft (0 = niet hergebruiken)
+SMTP_POOL_IDLE_SECONDS = float(os.environ.get('SMTP_POOL_IDLE_SECONDS', 60))
+
+# Maximaal aantal bewaarde verbindingen per SMTP-account
+SMTP_POOL_MAXSIZE = int(os.environ.get('SMTP_POOL_MAXSIZE', 4))
+
+# Na dit aantal berichten wordt een verbinding vernieuwd (veel servers begrenzen dit per sessie)
+SMTP_POOL_MAX_MESSAGES = int(os.environ.get('SMTP_POOL_MAX_MESSAGES', 100))
+
+# Timeout voor verbinden en serverantwoorden in seconden
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 30))
+
+
+class _PooledConnection:
+    """Ingelogde SMTP-verbinding met gebruiksgegevens"""
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.messages = 0
+        self.last_used = time.monotonic()
+
+
+class SmtpConnectionPool:
+    """Beheert ingelogde SMTP-verbindingen per account"""
+
+    def __init__(self, idle_seconds=None, maxsize=None, max_messages=None):
+        """
+        Args:
+            idle_seconds: Seconden dat een ongebruikte verbinding open blijft (standaard SMTP_POOL_IDLE_SECONDS)
+            maxsize: Maximaal aantal bewaarde verbindingen per account (standaard SMTP_POOL_MAXSIZE)
+            max_messages: Berichten per verbinding (standaard SMTP_POOL_MAX_MESSAGES)
+        """
+        self.idle_seconds = idle_seconds if idle_seconds is not None else SMTP_POOL_IDLE_SECONDS
+        self.maxsize = maxsize or SMTP_POOL_MAXSIZE
+        self.max_messages = max_messages or SMTP_POOL_MAX_MESSAGES
+        self._idle = {}   # Account -> lijst van vrije verbindingen
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stats = {'sent': 0, 'connections_opened': 0, 'connections_reused': 0, 'reconnects': 0, 'errors': 0}
+
+    def send(self, settings, from_addr, recipients, message):
+        """
+        Verstuur een bericht over een (hergebruikte) verbinding
+
+        Args:
+            settings: Dict met server, port, username, password, use_ssl en use_tls
+            from_addr: Afzenderadres voor de envelop
+            recipients: Lijst van ontvangers (inclusief CC)
+            message: Het volledige bericht als string
+
+        Raises:
+            smtplib.SMTPException, OSError: Als het versturen mislukt
+        """
+        key = self._key(settings)
+        while True:
+            connection, reused = self._acquire(key, settings)
+            try:
+                connection.smtp.sendmail(from_addr, recipients, message)
+            except smtplib.SMTPServerDisconnected:
+                self._close(connection)
+                if not reused:
+                    self._count('errors')
+                    raise
+                # De server heeft de bewaarde verbinding verbroken; opnieuw met een nieuwe verbinding
+                logger.info(f"SMTP-verbinding met {settings['server']} verbroken, opnieuw verbinden")
+                self._count('reconnects')
+                continue
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # Het bericht is geweigerd, maar de sessie is na RSET nog bruikbaar
+                self._count('errors')
+                self._release(key, connection)
+                raise
+            except Exception:
+                self._count('errors')
+                self._close(connection)
+                raise
+
+            connection.messages += 1
+            self._count('sent')
+            self._release(key, connection)
+            return
+
+    def close_all(self):
+        """Sluit alle bewaarde verbindingen (bijv. bij het afsluiten van het proces)"""
+        with self._lock:
+            connections = [connection for idle in self._idle.values() for connection in idle]
+            self._idle.clear()
+        for connection in connections:
+            self._close(connection)
+
+    def get_stats(self):
+        """
+        Geef de tellers van dit proces terug
+
+        Returns:
+            dict: Verzonden berichten, geopende/hergebruikte verbindingen, herverbindingen,
+                  fouten en het aantal open verbindingen
+        """
+        with self._lock:
+            return dict(self._stats, idle_connections=sum(len(idle) for idle in self._idle.values()))
+
+    def _key(self, settings):
+        # Het wachtwoord alleen als hash in de sleutel; een nieuw wachtwoord geeft nieuwe verbindingen
+        password_hash = hashlib.sha256((settings['password'] or '').encode('utf-8')).hexdigest()
+        return (
+            settings['server'], settings['port'], settings['username'], password_hash,
+            bool(settings['use_ssl']), bool(settings['use_tls'])
+        )
+
+    def _acquire(self, key, settings):
+        """
+        Geef een vrije verbinding, of open een nieuwe
+
+        Returns:
+            tuple: (_PooledConnection, of de verbinding hergebruikt is)
+        """
+        expired = []
+        connection = None
+        with self._lock:
+            self._check_fork()
+            # Verlopen verbindingen van alle accounts opruimen
+            now = time.monotonic()
+            for idle in self._idle.values():
+                expired.extend(candidate for candidate in idle if now - candidate.last_used >= self.idle_seconds)
+                idle[:] = [candidate for candidate in idle if now - candidate.last_used < self.idle_seconds]
+            idle = self._idle.get(key)
+            if idle:
+                connection = idle.pop()
+                self._stats['connections_reused'] += 1
+        for candidate in expired:
+            self._close(candidate)
+
+        if connection is not None:
+            return connection, True
+
+        connection = _PooledConnection(self._connect(settings))
+        self._count('connections_opened')
+        return connection, False
+
+    def _release(self, key, connection):
+        """Geef een verbinding terug aan de pool, of sluit hem"""
+        connection.last_used = time.monotonic()
+        keep = self.idle_seconds > 0 and connection.messages < self.max_messages
+        if keep:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                keep = len(idle) < self.maxsize
+                if keep:
+                    idle.append(connection)
+        if not keep:
+            self._close(connection)
+
+    def _connect(self, settings):
+        """Open en authenticeer een nieuwe SMTP-verbinding"""
+        if settings['use_ssl']:
+            # Voor SSL verbinding (meestal poort 465)
+            context = ssl.create_default_context()
+            smtp = smtplib.SMTP_SSL(settings['server'], settings['port'], context=context, timeout=SMTP_TIMEOUT)
+        else:
+            # Voor niet-SSL verbinding (meestal poort 25 of 587)
+            smtp = smtplib.SMTP(settings['server'], settings['port'], timeout=SMTP_TIMEOUT)
+        try:
+            if not settings['use_ssl'] and settings['use_tls']:
+                smtp.starttls()  # Upgrade naar TLS indien nodig
+            smtp.login(settings['username'], settings['password'])
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def _close(self, connection):
+        try:
+            connection.smtp.quit()
+        except Exception:
+            connection.smtp.close()
+
+    def _check_fork(self):
+        # Na een fork horen de sockets bij het ouderproces; niet gebruiken en niet sluiten
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = {}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+# Singleton instantie
+smtp_pool = SmtpConnectionPool()
+atexit.register(smtp_pool.close_all)
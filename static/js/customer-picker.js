@@ -0,0 +1,86 @@
+/**
+ * Klantkiezer voor de bulk upload formulieren
+ * Vult <select data-customer-picker data-lookup-url="..."> pas bij gebruik met klanten
+ * uit de huidige werkruimte, via een zoekveld boven de select.
+ */
+document.addEventListener('DOMContentLoaded', function() {
+  const selects = document.querySelectorAll('select[data-customer-picker]');
+  if (!selects.length) return;
+
+  // Resultaten per zoekterm delen tussen alle kiezers op de pagina
+  const resultCache = new Map();
+
+  function lookup(url, term) {
+    const key = url + '|' + term.toLowerCase();
+    if (!resultCache.has(key)) {
+      const params = new URLSearchParams({ q: term });
+      resultCache.set(key, fetch(url + '?' + params)
+        .then(response => {
+          if (!response.ok) throw new Error('HTTP ' + response.status);
+          return response.json();
+        })
+        .catch(error => {
+          resultCache.delete(key);
+          throw error;
+        }));
+    }
+    return resultCache.get(key);
+  }
+
+  function typeLabel(customerType) {
+    if (!customerType) return '';
+    return ' (' + customerType.charAt(0).toUpperCase() + customerType.slice(1) + ')';
+  }
+
+  function fillOptions(select, customers) {
+    const placeholder = select.options[0];
+    const selected = select.selectedIndex > 0 ? select.options[select.selectedIndex] : null;
+
+    // Alles behalve de placeholder en de huidige selectie vervangen
+    Array.from(select.options).forEach(option => {
+      if (option !== placeholder && option !== selected) option.remove();
+    });
+
+    customers.forEach(customer => {
+      if (selected && selected.value === customer.id) return;
+      const option = document.createElement('option');
+      option.value = customer.id;
+      option.textContent = customer.name + typeLabel(customer.customer_type);
+      option.setAttribute('data-vat-rate', customer.default_vat_rate === null ? 'None' : customer.default_vat_rate);
+      select.appendChild(option);
+    });
+  }
+
+  selects.forEach(select => {
+    const url = select.getAttribute('data-lookup-url');
+    const search = document.createElement('input');
+    search.type = 'search';
+    search.className = 'form-control form-control-sm mb-1';
+    search.placeholder = 'Zoek klant op naam of BTW-nummer...';
+    select.parentNode.insertBefore(search, select);
+
+    let timer = null;
+    let loaded = false;
+
+    function refresh() {
+      lookup(url, search.value.trim())
+        .then(customers => {
+          fillOptions(select, customers);
+          loaded = true;
+        })
+        .catch(error => console.error('Kon klanten niet ophalen:', error));
+    }
+
+    search.addEventListener('input', function() {
+      clearTimeout(timer);
+      timer = setTimeout(refresh, 250);
+    });
+
+    // Eerste lijst pas ophalen als de gebruiker de kiezer gebruikt
+    [search, select].forEach(element => {
+      element.addEventListener('focus', function() {
+        if (!loaded) refresh();
+      });
+    });
+  });
+});
@@ -207,19 +207,20 @@ def is_safe_url(url):
     return test_url.scheme in ('http', 'https') and ref_url.netloc == test_url.netloc
 
 
-def generate_pdf_invoice(invoice_data):
+def generate_pdf_invoice(invoice_data, customer_data):
     """
-    Genereer een PDF-factuur op basis van factuurgegevens
+    Genereer een PDF-factuur op basis van factuurgegevens (zonder cache;
+    gebruik invoice_pdf_renderer.get_pdf_path voor gecachete PDF's)
     
     Args:
         invoice_data: Dict met factuurgegevens
+        customer_data: Dict met klantgegevens
         
     Returns:
         bytes: PDF-inhoud als bytes
     """
-    # Dit is een placeholder functie die later geïmplementeerd zal worden
-    # met een echte PDF-generatie bibliotheek zoals WeasyPrint of ReportLab
-    return b"PDF CONTENT"
+    from invoice_pdf import invoice_pdf_renderer
+    return invoice_pdf_renderer.render_pdf_bytes(invoice_data, customer_data)
 
 
 def export_to_excel(data, headers=None):
@@ -233,31 +234,18 @@ def export_to_excel(data, headers=None):
     Returns:
         bytes: Excel-bestand als bytes
     """
-    import io
-    import openpyxl
-    from openpyxl import Workbook
+    from report_export import write_xlsx
     
-    wb = Workbook()
-    ws = wb.active
+    data = list(data)
+    width = len(headers) if headers else max((len(row) for row in data), default=0)
+    columns = list(zip(range(width), headers)) if headers else list(range(width))
     
-    # Voeg headers toe
-    if headers:
-        for col_num, header in enumerate(headers, 1):
-            ws.cell(row=1, column=col_num, value=header)
-    
-    # Voeg data toe
-    row_num = 2 if headers else 1
-    for row in data:
-        for col_num, cell_value in enumerate(row, 1):
-            ws.cell(row=row_num, column=col_num, value=cell_value)
-        row_num += 1
-    
-    # Sla op naar bytes
-    excel_file = io.BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-    
-    return excel_file.getvalue()
+    path = write_xlsx((dict(enumerate(row)) for row in data), columns, include_header=bool(headers))
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
 
 
 def export_to_csv(data, headers=None, delimiter=','):
@@ -272,19 +260,16 @@ def export_to_csv(data, headers=None, delimiter=','):
     Returns:
         str: CSV-inhoud
     """
-    import io
-    import csv
-    
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=delimiter, quoting=csv.QUOTE_MINIMAL)
-    
-    if headers:
-        writer.writerow(headers)
+    from report_export import iter_csv
     
-    for row in data:
-        writer.writerow(row)
+    data = list(data)
+    width = len(headers) if headers else max((len(row) for row in data), default=0)
+    columns = list(zip(range(width), headers)) if headers else list(range(width))
     
-    return output.getvalue()
+    return ''.join(iter_csv(
+        (dict(enumerate(row)) for row in data), columns,
+        delimiter=delimiter, include_header=bool(headers)
+    ))
 
 
 def get_vat_rates():
@@ -451,9 +436,113 @@ def allowed_file(filename, allowed_extensions):
 
 
 # Gebruikersrechten functies
+import threading
+import time
 from flask_login import current_user
 from functools import wraps
-from flask import flash, redirect, url_for
+from flask import flash, redirect, url_for, g, has_request_context
+
+# Alle permissievelden van UserPermission
+PERMISSION_FIELDS = (
+    'can_view_customers', 'can_add_customers', 'can_edit_customers', 'can_delete_customers',
+    'can_view_invoices', 'can_add_invoices', 'can_edit_invoices', 'can_delete_invoices', 'can_upload_invoices',
+    'can_view_reports', 'can_export_reports', 'can_generate_vat_report',
+    'can_view_dashboard', 'can_manage_settings'
+)
+
+# Optionele proces-cache voor permissie-snapshots (seconden, 0 = uitgeschakeld).
+# Houd deze kort: andere gunicorn workers merken wijzigingen pas na de TTL op.
+PERMISSION_CACHE_TTL = int(os.environ.get('PERMISSION_CACHE_TTL', 0))
+_permission_cache = {}  # user_id -> (verloopt_op, snapshot)
+_permission_cache_lock = threading.Lock()
+
+
+def build_permission_snapshot(user):
+    """
+    Maak een compacte, onveranderlijke weergave van de rechten van een gebruiker
+    
+    Args:
+        user: User object (met geladen permissions relatie)
+        
+    Returns:
+        dict: user_id, is_super_admin, is_admin en een dict met permissievlaggen
+    """
+    permissions = user.permissions
+    return {
+        'user_id': user.id,
+        'is_super_admin': bool(user.is_super_admin),
+        'is_admin': bool(user.is_admin),
+        'permissions': {
+            name: bool(getattr(permissions, name, False)) for name in PERMISSION_FIELDS
+        } if permissions else {}
+    }
+
+
+def get_permission_snapshot(user=None):
+    """
+    Haal de permissie-snapshot van een gebruiker op.
+    
+    De snapshot wordt per request op flask.g bewaard en optioneel kort in een
+    proces-cache (PERMISSION_CACHE_TTL), zodat decorators, models en templates
+    niet bij iedere controle de permissions relatie opnieuw laden.
+    
+    Args:
+        user: User object (standaard de ingelogde gebruiker)
+        
+    Returns:
+        dict of None: De snapshot, of None voor niet-ingelogde gebruikers
+    """
+    if user is None:
+        user = current_user
+    if not getattr(user, 'is_authenticated', False):
+        return None
+    
+    user_id = user.id
+    request_cache = None
+    if has_request_context():
+        request_cache = g.setdefault('_permission_snapshots', {})
+        if user_id in request_cache:
+            return request_cache[user_id]
+    
+    snapshot = None
+    if PERMISSION_CACHE_TTL > 0:
+        with _permission_cache_lock:
+            cached = _permission_cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            snapshot = cached[1]
+    
+    if snapshot is None:
+        snapshot = build_permission_snapshot(user)
+        if PERMISSION_CACHE_TTL > 0:
+            with _permission_cache_lock:
+                _permission_cache[user_id] = (time.monotonic() + PERMISSION_CACHE_TTL, snapshot)
+    
+    if request_cache is not None:
+        request_cache[user_id] = snapshot
+    return snapshot
+
+
+def invalidate_permission_cache(user_id=None):
+    """
+    Verwijder gecachte permissie-snapshots na een wijziging van rechten
+    
+    Args:
+        user_id: ID van de gebruiker (None om de hele cache te legen)
+    """
+    with _permission_cache_lock:
+        if user_id is None:
+            _permission_cache.clear()
+        else:
+            _permission_cache.pop(user_id, None)
+    
+    if has_request_context():
+        request_cache = g.get('_permission_snapshots')
+        if request_cache:
+            if user_id is None:
+                request_cache.clear()
+            else:
+                request_cache.pop(user_id, None)
+
 
 def check_permission(permission_name):
     """
@@ -465,26 +554,20 @@ def check_permission(permission_name):
     Returns:
         bool: True als de gebruiker de permissie heeft, anders False
     """
+    snapshot = get_permission_snapshot()
+    if snapshot is None:
+        return False
+    
     # Super admins hebben altijd alle rechten
-    if current_user.is_super_admin:
+    if snapshot['is_super_admin']:
         return True
     
     # Normale admins hebben standaard beheerrechten
-    if current_user.is_admin and permission_name not in [
-        'can_view_customers', 'can_add_customers', 'can_edit_customers', 'can_delete_customers',
-        'can_view_invoices', 'can_add_invoices', 'can_edit_invoices', 'can_delete_invoices', 'can_upload_invoices',
-        'can_view_reports', 'can_export_reports', 'can_generate_vat_report',
-        'can_view_dashboard', 'can_manage_settings'
-    ]:
+    if snapshot['is_admin'] and permission_name not in PERMISSION_FIELDS:
         return True
     
-    # Controleer gebruikersrechten
-    permissions = current_user.permissions
-    if not permissions:
-        return False
-    
     # Controleer specifieke permissie
-    return getattr(permissions, permission_name, False)
+    return snapshot['permissions'].get(permission_name, False)
 
 def permission_required(permission_name):
     """
@@ -7,6 +7,7 @@ from datetime import datetime
 from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, flash
 from flask_login import login_required, current_user
 from whmcs_service import WHMCSService
+from whmcs_sync_runner import whmcs_sync_runner
 from models import Customer, Invoice, SystemSettings
 from database import db
 from utils import admin_required, super_admin_required
@@ -36,12 +37,16 @@ def whmcs_dashboard():
     whmcs_service = WHMCSService()
     is_configured = whmcs_service.is_configured()
     
+    # Voortgang en resultaten van de laatste synchronisatie van deze werkruimte
+    sync_status = whmcs_sync_runner.get_status(current_user.workspace_id) if current_user.workspace_id else None
+    
     return render_template(
         'admin/whmcs_dashboard.html',
         settings=settings,
         whmcs_customers_count=whmcs_customers_count,
         whmcs_invoices_count=whmcs_invoices_count,
         is_configured=is_configured,
+        sync_status=sync_status,
         whmcs_api_url=whmcs_service.api_url,
         whmcs_api_identifier=whmcs_service.api_identifier,
         # Verberg het geheim voor de veiligheid maar toon een indicator
@@ -139,11 +144,15 @@ def test_whmcs_connection():
             'message': f"Fout bij verbinden met WHMCS API: {str(e)}"
         })
 
-@whmcs_bp.route('/admin/whmcs/sync/clients', methods=['POST'])
-@login_required
-@admin_required
-def sync_whmcs_clients():
-    """Synchroniseer klanten van WHMCS naar de applicatie"""
+def _sync_workspace_id():
+    """Werkruimte voor een sync: die van de gebruiker, of de opgegeven voor een super admin"""
+    if not current_user.is_super_admin:
+        return current_user.workspace_id
+    # Geen of geen geldig getal: None, zodat de route de gewone foutmelding geeft
+    return request.values.get('workspace_id', type=int)
+
+def _start_sync(entities, label, status=None):
+    """Zet een sync in de wachtrij van de achtergrondthread"""
     whmcs_service = WHMCSService()
     
     try:
@@ -153,79 +162,58 @@ def sync_whmcs_clients():
                 'message': 'WHMCS API is niet geconfigureerd. Voeg API-gegevens toe.'
             })
         
-        # Synchroniseer klanten
-        workspace_id = current_user.workspace_id if not current_user.is_super_admin else request.form.get('workspace_id')
-        if workspace_id is None or workspace_id == '':
+        workspace_id = _sync_workspace_id()
+        if workspace_id is None:
             return jsonify({
                 'success': False,
                 'message': 'Geen werkruimte ID opgegeven voor synchronisatie'
             })
         
-        result = whmcs_service.sync_clients_to_app(int(workspace_id))
-        
-        # Update laatste synchronisatietijd
-        settings = SystemSettings.query.filter_by(key='whmcs_integration').first()
-        if settings:
-            settings.whmcs_last_sync = datetime.now()
-            db.session.commit()
+        # Standaard incrementeel; 'full' verwerkt ook ongewijzigde records opnieuw
+        incremental = request.form.get('full') != '1'
+        if not whmcs_sync_runner.submit(workspace_id, entities, status=status, incremental=incremental):
+            return jsonify({
+                'success': False,
+                'message': 'Er loopt al een synchronisatie voor deze werkruimte. Probeer het later opnieuw.'
+            })
         
         return jsonify({
             'success': True,
-            'message': f"Synchronisatie voltooid: {result['added']} klanten toegevoegd, {result['updated']} bijgewerkt",
-            'data': result
+            'message': f"Synchronisatie van {label} gestart op de achtergrond",
+            'status_url': url_for('whmcs.whmcs_sync_status', workspace_id=workspace_id)
         })
     except Exception as e:
-        current_app.logger.error(f"Fout bij synchroniseren van WHMCS-klanten: {str(e)}")
+        current_app.logger.error(f"Fout bij starten van WHMCS-synchronisatie van {label}: {str(e)}")
         return jsonify({
             'success': False,
-            'message': f"Fout bij synchroniseren van WHMCS-klanten: {str(e)}"
+            'message': f"Fout bij starten van WHMCS-synchronisatie van {label}: {str(e)}"
         })
 
+@whmcs_bp.route('/admin/whmcs/sync/clients', methods=['POST'])
+@login_required
+@admin_required
+def sync_whmcs_clients():
+    """Synchroniseer klanten van WHMCS naar de applicatie (op de achtergrond)"""
+    return _start_sync(('clients',), 'klanten')
+
 @whmcs_bp.route('/admin/whmcs/sync/invoices', methods=['POST'])
 @login_required
 @admin_required
 def sync_whmcs_invoices():
-    """Synchroniseer facturen van WHMCS naar de applicatie"""
-    whmcs_service = WHMCSService()
+    """Synchroniseer facturen van WHMCS naar de applicatie (op de achtergrond)"""
+    # Factuurstatus filter (optioneel)
+    return _start_sync(('invoices',), 'facturen', status=request.form.get('status') or None)
+
+@whmcs_bp.route('/admin/whmcs/sync/status')
+@login_required
+@admin_required
+def whmcs_sync_status():
+    """Voortgang en laatste resultaten van de WHMCS-synchronisatie"""
+    workspace_id = _sync_workspace_id()
+    if workspace_id is None:
+        return jsonify({'success': False, 'message': 'Geen werkruimte ID opgegeven'})
     
-    try:
-        if not whmcs_service.is_configured():
-            return jsonify({
-                'success': False,
-                'message': 'WHMCS API is niet geconfigureerd. Voeg API-gegevens toe.'
-            })
-        
-        # Bepaal werkruimte
-        workspace_id = current_user.workspace_id if not current_user.is_super_admin else request.form.get('workspace_id')
-        if workspace_id is None or workspace_id == '':
-            return jsonify({
-                'success': False,
-                'message': 'Geen werkruimte ID opgegeven voor synchronisatie'
-            })
-        
-        # Factuurstatus filter (optioneel)
-        status = request.form.get('status')
-        
-        # Synchroniseer facturen
-        result = whmcs_service.sync_invoices_to_app(int(workspace_id), status)
-        
-        # Update laatste synchronisatietijd
-        settings = SystemSettings.query.filter_by(key='whmcs_integration').first()
-        if settings:
-            settings.whmcs_last_sync = datetime.now()
-            db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': f"Synchronisatie voltooid: {result['added']} facturen toegevoegd, {result['updated']} bijgewerkt, {result['no_customer']} zonder gekoppelde klant",
-            'data': result
-        })
-    except Exception as e:
-        current_app.logger.error(f"Fout bij synchroniseren van WHMCS-facturen: {str(e)}")
-        return jsonify({
-            'success': False,
-            'message': f"Fout bij synchroniseren van WHMCS-facturen: {str(e)}"
-        })
+    return jsonify({'success': True, 'data': whmcs_sync_runner.get_status(workspace_id)})
 
 @whmcs_bp.route('/admin/whmcs/client/<int:whmcs_client_id>')
 @login_required
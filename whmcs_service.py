@@ -8,12 +8,73 @@ import uuid
 import json
 import hashlib
 import logging
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator
 from flask import current_app
-from models import Customer, Invoice, InvoiceItem, SystemSettings
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+from models import Customer, Invoice, InvoiceItem, WhmcsSyncState
 from database import db
+from http_client import http_client
+from settings_cache import settings_cache
+
+# Aantal records per pagina bij het doorlopen van GetClients/GetInvoices
+WHMCS_PAGE_SIZE = int(os.environ.get('WHMCS_PAGE_SIZE', 250))
+
+# Aantal gelijktijdige GetInvoice-verzoeken tijdens een sync
+WHMCS_DETAIL_CONCURRENCY = int(os.environ.get('WHMCS_DETAIL_CONCURRENCY', 8))
+
+# Maximaal aantal API-verzoeken per seconde voor detailgegevens (0 = onbeperkt)
+WHMCS_MAX_REQUESTS_PER_SECOND = float(os.environ.get('WHMCS_MAX_REQUESTS_PER_SECOND', 10))
+
+
+# WHMCS-velden die bepalen of een record sinds de vorige sync gewijzigd is
+CLIENT_HASH_FIELDS = (
+    'companyname', 'firstname', 'lastname', 'email', 'phonenumber',
+    'address1', 'postcode', 'city', 'country', 'tax_id'
+)
+INVOICE_HASH_FIELDS = (
+    'invoicenum', 'userid', 'date', 'duedate', 'total', 'status', 'notes', 'updated_at'
+)
+
+# Kolommen die een upsert bij een bestaand record overschrijft; de overige
+# kolommen (ID, factuurnummer, huisnummer, ...) worden alleen bij aanmaken gezet
+CUSTOMER_UPDATE_COLUMNS = (
+    'company_name', 'vat_number', 'first_name', 'last_name', 'email', 'phone', 'street',
+    'postal_code', 'city', 'country', 'customer_type', 'whmcs_last_sync', 'whmcs_sync_hash'
+)
+INVOICE_UPDATE_COLUMNS = (
+    'date', 'due_date', 'amount_excl_vat', 'amount_incl_vat', 'vat_rate', 'vat_amount',
+    'status', 'notes', 'whmcs_last_sync', 'whmcs_sync_hash'
+)
+
+
+class WHMCSAPIError(Exception):
+    """Fout van de WHMCS API tijdens het doorlopen van meerdere pagina's"""
+
+
+class _RateLimiter:
+    """Verdeelt verzoeken van meerdere threads gelijkmatig over de tijd"""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Wacht tot het volgende verzoek verstuurd mag worden"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
 
 class WHMCSService:
     """Service voor communicatie met de WHMCS API"""
@@ -28,18 +89,10 @@ class WHMCSService:
         self.api_identifier = os.environ.get('WHMCS_API_IDENTIFIER')
         self.api_secret = os.environ.get('WHMCS_API_SECRET')
         
-        self.logger.info(f"Env WHMCS_API_URL: {self.api_url}")
-        self.logger.info(f"Env WHMCS_API_IDENTIFIER: {self.api_identifier}")
-        self.logger.info(f"Env WHMCS_API_SECRET set: {bool(self.api_secret)}")
-        
-        # Als niet in environment, probeer database
+        # Als niet in environment, probeer database (via de instellingencache)
         if not self.is_configured():
-            settings = SystemSettings.query.filter_by(key='whmcs_integration').first()
+            settings = settings_cache.whmcs_settings()
             if settings:
-                self.logger.info(f"DB whmcs_api_url: {settings.whmcs_api_url}")
-                self.logger.info(f"DB whmcs_api_identifier: {settings.whmcs_api_identifier}")
-                self.logger.info(f"DB whmcs_api_secret set: {bool(settings.whmcs_api_secret)}")
-                
                 self.api_url = settings.whmcs_api_url
                 self.api_identifier = settings.whmcs_api_identifier
                 self.api_secret = settings.whmcs_api_secret
@@ -76,10 +129,11 @@ class WHMCSService:
             request_params.update(params)
         
         try:
-            # Log de API URL voor debugging
-            self.logger.info(f"Making WHMCS API request to URL: {self.api_url}")
-            # Maak API-verzoek
-            response = requests.post(self.api_url, data=request_params, timeout=30)
+            # Log de actie voor debugging
+            self.logger.debug(f"Making WHMCS API request: {action}")
+            # Maak API-verzoek via de gedeelde sessie (keep-alive). De gebruikte
+            # acties zijn alleen lees-acties, dus POST mag herhaald worden.
+            response = http_client.request('whmcs', 'POST', self.api_url, retry_post=True, data=request_params, timeout=30)
             response.raise_for_status()  # Raising an exception for 4XX/5XX responses
             
             # Parse JSON-respons
@@ -105,6 +159,93 @@ class WHMCSService:
             self.logger.error(f"Unexpected error in WHMCS API request: {str(e)}")
             return {"result": "error", "message": f"Unexpected error: {str(e)}"}
 
+    @staticmethod
+    def _as_list(records) -> List[Dict]:
+        """WHMCS geeft bij één record een dict en bij geen records een lege string terug"""
+        if isinstance(records, dict):
+            return [records]
+        return records or []
+
+    def _iter_pages(self, action: str, container: str, item: str, params: Dict = None,
+                    page_size: int = None) -> Iterator[List[Dict]]:
+        """
+        Doorloop alle pagina's van een WHMCS lijst-actie met limitstart/totalresults
+        
+        Er staat steeds maar één pagina in het geheugen. Er wordt op ID gesorteerd,
+        zodat records die tijdens het doorlopen worden toegevoegd achteraan komen
+        en er geen records verschuiven tussen pagina's.
+        
+        Args:
+            action: API-actie (GetClients of GetInvoices)
+            container: Sleutel van de lijst in de respons ('clients' of 'invoices')
+            item: Sleutel van de records in de lijst ('client' of 'invoice')
+            params: Aanvullende filterparameters
+            page_size: Aantal records per pagina (standaard WHMCS_PAGE_SIZE)
+        
+        Yields:
+            List[Dict]: Records van één pagina
+        
+        Raises:
+            WHMCSAPIError: Als een pagina niet opgehaald kan worden
+        """
+        page_size = page_size or WHMCS_PAGE_SIZE
+        offset = 0
+        
+        while True:
+            request_params = dict(params or {})
+            request_params.update({
+                'limitstart': offset,
+                'limitnum': page_size,
+                'orderby': 'id',
+                'order': 'asc'
+            })
+            result = self._make_api_request(action, request_params)
+            if result.get('result') != 'success':
+                raise WHMCSAPIError(f"{action} mislukt bij offset {offset}: {result.get('message', 'Unknown error')}")
+            
+            records = result.get(container) or {}
+            page = self._as_list(records.get(item) if isinstance(records, dict) else None)
+            if not page:
+                return
+            
+            yield page
+            
+            offset += len(page)
+            total = int(result.get('totalresults', 0) or 0)
+            if offset >= total:
+                return
+
+    def iter_client_pages(self, page_size: int = None) -> Iterator[List[Dict]]:
+        """
+        Doorloop alle klanten van WHMCS, pagina per pagina
+        
+        Args:
+            page_size: Aantal klanten per pagina (standaard WHMCS_PAGE_SIZE)
+        
+        Yields:
+            List[Dict]: Klantgegevens van één pagina
+        """
+        return self._iter_pages('GetClients', 'clients', 'client', page_size=page_size)
+
+    def iter_invoice_pages(self, client_id: int = None, status: str = None, page_size: int = None) -> Iterator[List[Dict]]:
+        """
+        Doorloop alle facturen van WHMCS, pagina per pagina
+        
+        Args:
+            client_id: Filter op WHMCS klant ID (optioneel)
+            status: Filter op factuurstatus (optioneel)
+            page_size: Aantal facturen per pagina (standaard WHMCS_PAGE_SIZE)
+        
+        Yields:
+            List[Dict]: Factuurgegevens van één pagina
+        """
+        params = {}
+        if client_id:
+            params['userid'] = client_id
+        if status:
+            params['status'] = status
+        return self._iter_pages('GetInvoices', 'invoices', 'invoice', params, page_size)
+
     def get_clients(self, limit: int = 100, offset: int = 0) -> List[Dict]:
         """
         Haal klanten op uit WHMCS
@@ -124,7 +265,8 @@ class WHMCSService:
         result = self._make_api_request('GetClients', params)
         
         if result.get('result') == 'success' and 'clients' in result:
-            return result['clients']['client']
+            clients = result['clients']
+            return self._as_list(clients.get('client') if isinstance(clients, dict) else None)
         
         self.logger.warning(f"Failed to get clients from WHMCS: {result.get('message', 'Unknown error')}")
         return []
@@ -160,7 +302,7 @@ class WHMCSService:
         
         return None
 
-    def get_invoices(self, client_id: int = None, status: str = None, limit: int = 100) -> List[Dict]:
+    def get_invoices(self, client_id: int = None, status: str = None, limit: int = 100, offset: int = 0) -> List[Dict]:
         """
         Haal facturen op uit WHMCS
         
@@ -168,11 +310,15 @@ class WHMCSService:
             client_id: Filter op WHMCS klant ID (optioneel)
             status: Filter op factuurstatus (optioneel)
             limit: Maximum aantal facturen om op te halen
+            offset: Vanaf welke positie facturen op te halen
         
         Returns:
             List[Dict]: Lijst van factuurgegevens
         """
-        params = {'limitnum': limit}
+        params = {
+            'limitstart': offset,
+            'limitnum': limit,
+        }
         
         if client_id:
             params['userid'] = client_id
@@ -184,10 +330,7 @@ class WHMCSService:
         
         if result.get('result') == 'success' and 'invoices' in result and 'invoice' in result['invoices']:
             # Als er maar één factuur is, krijgen we een dict terug in plaats van een lijst
-            invoices = result['invoices']['invoice']
-            if isinstance(invoices, dict):
-                return [invoices]
-            return invoices
+            return self._as_list(result['invoices']['invoice'])
         
         self.logger.warning(f"Failed to get invoices from WHMCS: {result.get('message', 'Unknown error')}")
         return []
@@ -215,370 +358,556 @@ class WHMCSService:
         
         return None
 
-    def sync_clients_to_app(self, workspace_id: int) -> Dict:
+    def get_invoices_details(self, invoice_ids: List[int]) -> Dict[int, Optional[Dict]]:
+        """
+        Haal de details van meerdere facturen tegelijk op
+        
+        De GetInvoice-verzoeken lopen parallel in een begrensde threadpool
+        (WHMCS_DETAIL_CONCURRENCY) en worden beperkt tot
+        WHMCS_MAX_REQUESTS_PER_SECOND. Er wordt niets naar de database
+        geschreven; dat blijft op de aanroepende thread.
+        
+        Args:
+            invoice_ids: WHMCS factuur ID's
+        
+        Returns:
+            Dict[int, Optional[Dict]]: Factuurgegevens per ID (None als niet gevonden)
+        """
+        if not invoice_ids:
+            return {}
+        
+        limiter = _RateLimiter(WHMCS_MAX_REQUESTS_PER_SECOND)
+        
+        def fetch(invoice_id):
+            limiter.wait()
+            return self.get_invoice(invoice_id)
+        
+        workers = max(1, min(WHMCS_DETAIL_CONCURRENCY, len(invoice_ids)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='whmcs-detail') as executor:
+            return dict(zip(invoice_ids, executor.map(fetch, invoice_ids)))
+
+    @staticmethod
+    def _payload_hash(data: Dict, fields) -> str:
+        """Hash van de relevante velden van een WHMCS-record (voor wijzigingsdetectie)"""
+        values = [data.get(field) for field in fields]
+        return hashlib.sha256(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _parse_whmcs_datetime(value) -> Optional[datetime]:
+        """Parse een WHMCS-tijdstempel ('YYYY-MM-DD HH:MM:SS'), of None"""
+        try:
+            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+        except (TypeError, ValueError):
+            return None
+
+    def _start_sync_state(self, workspace_id: int, entity: str) -> WhmcsSyncState:
+        state = WhmcsSyncState.get_or_create(workspace_id, entity)
+        state.last_started = datetime.now()
+        state.last_stats = None
+        state.last_error = None
+        db.session.commit()
+        return state
+
+    def _update_sync_progress(self, state: WhmcsSyncState, stats: Dict) -> None:
+        """Bewaar de tellers na elke pagina, zodat het dashboard de voortgang kan tonen"""
+        state.last_stats = json.dumps(stats)
+        db.session.commit()
+
+    def _finish_sync_state(self, state: WhmcsSyncState, stats: Dict, watermark: datetime = None) -> None:
+        state.last_finished = datetime.now()
+        state.last_stats = json.dumps(stats)
+        if watermark:
+            state.watermark = watermark
+        db.session.commit()
+
+    def sync_clients_to_app(self, workspace_id: int, incremental: bool = True) -> Dict:
         """
         Synchroniseer klanten van WHMCS naar de applicatie
         
         Args:
             workspace_id: ID van de werkruimte waaraan de klanten moeten worden toegevoegd
+            incremental: Klanten waarvan de WHMCS-gegevens niet gewijzigd zijn overslaan
         
         Returns:
             Dict: Resultaten van de synchronisatie
         """
         self.logger.info(f"Starting client sync from WHMCS to app for workspace {workspace_id}")
+        state = self._start_sync_state(workspace_id, 'clients')
         
         # Statistieken bijhouden
         stats = {
             'added': 0,
             'updated': 0,
+            'unchanged': 0,
             'failed': 0,
             'total': 0
         }
         
-        # Ophalen van alle actieve klanten van WHMCS
-        whmcs_clients = self.get_clients(limit=500)  # Een hoger limiet voor bulksynchronisatie
-        stats['total'] = len(whmcs_clients)
+        # Alle klanten van WHMCS pagina per pagina verwerken. GetClients kent geen
+        # wijzigingsdatum, dus ongewijzigde klanten worden op hun hash herkend.
+        for whmcs_clients in self.iter_client_pages():
+            stats['total'] += len(whmcs_clients)
+            self._sync_client_page(whmcs_clients, workspace_id, stats, incremental)
+            self._update_sync_progress(state, stats)
+        
+        self._finish_sync_state(state, stats)
         
+        self.logger.info(f"Completed WHMCS client sync: {stats}")
+        return stats
+
+    def _upsert_page(self, table, conflict_column: str, rows: List[Dict], update_columns) -> tuple:
+        """
+        Schrijf rijen weg met één INSERT ... ON CONFLICT DO UPDATE op (workspace_id, conflict_column)
+        
+        Het conflictdoel is de partiële unieke index uit migrate_whmcs_unique_indexes.
+        Mislukt de batch (bijv. door een dubbel factuurnummer), dan wordt per rij
+        opnieuw geprobeerd in een savepoint, zodat één fout record niet de hele
+        pagina tegenhoudt. Er wordt niet gecommit.
+        
+        Args:
+            table: SQLAlchemy-tabel
+            conflict_column: WHMCS ID-kolom (whmcs_client_id of whmcs_invoice_id)
+            rows: Waarden per rij (allemaal met dezelfde sleutels)
+            update_columns: Kolommen die bij een bestaand record overschreven worden
+        
+        Returns:
+            tuple: (lijst met (id, WHMCS ID) van de geschreven rijen, lijst met (rij, fout) van mislukte rijen)
+        """
+        now = datetime.now()
+        
+        def statement(values):
+            stmt = pg_insert(table).values(values)
+            set_ = {column: stmt.excluded[column] for column in update_columns}
+            set_['updated_at'] = now
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.workspace_id, table.c[conflict_column]],
+                index_where=table.c[conflict_column].isnot(None),
+                set_=set_
+            )
+            return stmt.returning(table.c.id, table.c[conflict_column])
+        
+        try:
+            with db.session.begin_nested():
+                return [tuple(row) for row in db.session.execute(statement(rows))], []
+        except SQLAlchemyError as e:
+            self.logger.warning(f"Batch upsert into {table.name} failed, retrying per row: {str(e)}")
+        
+        written, failed = [], []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    written.extend(tuple(result) for result in db.session.execute(statement([row])))
+            except SQLAlchemyError as e:
+                failed.append((row, e))
+        return written, failed
+
+    def _sync_client_page(self, whmcs_clients: List[Dict], workspace_id: int, stats: Dict, incremental: bool = True) -> None:
+        """
+        Verwerk één pagina WHMCS-klanten
+        
+        Bestaande klanten van de pagina worden met één IN-query opgehaald,
+        nieuwe en gewijzigde klanten worden in één upsert weggeschreven en de
+        pagina wordt in één keer gecommit.
+        """
+        records = []
         for client_data in whmcs_clients:
             try:
-                whmcs_client_id = int(client_data.get('id'))
-                
-                # Controleer of de klant al bestaat in de app
-                existing_customer = Customer.query.filter_by(
-                    whmcs_client_id=whmcs_client_id,
-                    workspace_id=workspace_id
-                ).first()
-                
-                if existing_customer:
-                    # Update bestaande klant
-                    self._update_customer_from_whmcs(existing_customer, client_data)
-                    stats['updated'] += 1
-                    self.logger.debug(f"Updated customer from WHMCS: {existing_customer.id} (WHMCS ID: {whmcs_client_id})")
-                else:
-                    # Maak nieuwe klant aan
-                    new_customer = self._create_customer_from_whmcs(client_data, workspace_id)
-                    if new_customer:
-                        stats['added'] += 1
-                        self.logger.debug(f"Added new customer from WHMCS: {new_customer.id} (WHMCS ID: {whmcs_client_id})")
-                    else:
-                        stats['failed'] += 1
-                        self.logger.warning(f"Failed to create customer from WHMCS ID: {whmcs_client_id}")
-            except Exception as e:
+                records.append((int(client_data.get('id')), client_data))
+            except (TypeError, ValueError) as e:
                 stats['failed'] += 1
                 self.logger.error(f"Error syncing WHMCS client: {str(e)}")
         
-        # Aanpassen van het tijdstempel van de laatste synchronisatie
-        # (Dit zal later worden gedaan in de controller)
+        if not records:
+            return
+        
+        # Bestaande klanten van deze pagina in één query: WHMCS ID -> hash
+        existing = dict(
+            db.session.query(Customer.whmcs_client_id, Customer.whmcs_sync_hash)
+            .filter(
+                Customer.workspace_id == workspace_id,
+                Customer.whmcs_client_id.in_([whmcs_client_id for whmcs_client_id, _ in records])
+            )
+            .all()
+        )
+        
+        rows = {}
+        for whmcs_client_id, client_data in records:
+            try:
+                payload_hash = self._payload_hash(client_data, CLIENT_HASH_FIELDS)
+                if whmcs_client_id in existing and incremental and existing[whmcs_client_id] == payload_hash:
+                    # Niets gewijzigd sinds de vorige sync
+                    stats['unchanged'] += 1
+                    continue
+                rows[whmcs_client_id] = self._customer_values(client_data, workspace_id, payload_hash)
+            except Exception as e:
+                stats['failed'] += 1
+                self.logger.error(f"Error syncing WHMCS client {whmcs_client_id}: {str(e)}")
+        
+        if not rows:
+            return
         
-        self.logger.info(f"Completed WHMCS client sync: {stats}")
-        return stats
-
-    def _create_customer_from_whmcs(self, client_data: Dict, workspace_id: int) -> Optional[Customer]:
-        """Maak een nieuwe klant aan op basis van WHMCS-klantgegevens"""
         try:
-            # Extract en map klantgegevens
-            company = client_data.get('companyname', '').strip()
-            customer_type = 'business' if company else 'individual'
-            
-            # Als er geen bedrijfsnaam is, gebruik de volledige naam als bedrijfsnaam
-            # Dit is nodig omdat company_name een verplicht veld is in ons model
-            if not company:
-                company = f"{client_data.get('firstname', '')} {client_data.get('lastname', '')}".strip()
-                # Als er nog steeds geen naam is, gebruik een standaard
-                if not company:
-                    company = "Client zonder naam"
-            
-            # Maak nieuw klantobject
-            customer = Customer(
-                id=uuid.uuid4(),
-                workspace_id=workspace_id,
-                company_name=company,
-                vat_number=client_data.get('tax_id', ''),
-                first_name=client_data.get('firstname', ''),
-                last_name=client_data.get('lastname', ''),
-                email=client_data.get('email', ''),
-                phone=client_data.get('phonenumber', ''),
-                street=client_data.get('address1', ''),
-                house_number='',  # WHMCS slaat huisnummer niet apart op
-                postal_code=client_data.get('postcode', ''),
-                city=client_data.get('city', ''),
-                country=client_data.get('country', 'België'),
-                customer_type=customer_type,
-                default_vat_rate=21.0,  # Standaard Belgisch tarief
-                created_at=datetime.now(),
-                whmcs_client_id=int(client_data.get('id')),
-                synced_from_whmcs=True,
-                whmcs_last_sync=datetime.now()
+            written, failed = self._upsert_page(
+                Customer.__table__, 'whmcs_client_id', list(rows.values()), CUSTOMER_UPDATE_COLUMNS
             )
-            
-            # Sla op in database
-            db.session.add(customer)
             db.session.commit()
-            return customer
         except Exception as e:
             db.session.rollback()
-            self.logger.error(f"Error creating customer from WHMCS data: {str(e)}")
-            return None
+            stats['failed'] += len(rows)
+            self.logger.error(f"Error writing WHMCS client page: {str(e)}")
+            return
+        
+        for row, error in failed:
+            self.logger.error(f"Error syncing WHMCS client {row['whmcs_client_id']}: {str(error)}")
+        stats['failed'] += len(failed)
+        
+        added = sum(1 for _, whmcs_client_id in written if whmcs_client_id not in existing)
+        stats['added'] += added
+        stats['updated'] += len(written) - added
+        self.logger.debug(f"Wrote {len(written)} WHMCS clients ({added} new) for workspace {workspace_id}")
 
-    def _update_customer_from_whmcs(self, customer: Customer, client_data: Dict) -> bool:
-        """Update een bestaande klant met WHMCS-klantgegevens"""
-        try:
-            # Extract en map klantgegevens
-            company = client_data.get('companyname', '').strip()
-            customer_type = 'business' if company else 'individual'
-            
-            # Als er geen bedrijfsnaam is, gebruik de volledige naam als bedrijfsnaam
+    def _customer_values(self, client_data: Dict, workspace_id: int, payload_hash: str) -> Dict:
+        """Map WHMCS-klantgegevens naar de kolommen van een klant"""
+        # Extract en map klantgegevens
+        company = (client_data.get('companyname') or '').strip()
+        customer_type = 'business' if company else 'individual'
+        
+        # Als er geen bedrijfsnaam is, gebruik de volledige naam als bedrijfsnaam
+        # Dit is nodig omdat company_name een verplicht veld is in ons model
+        if not company:
+            company = f"{client_data.get('firstname', '')} {client_data.get('lastname', '')}".strip()
+            # Als er nog steeds geen naam is, gebruik een standaard
             if not company:
-                company = f"{client_data.get('firstname', '')} {client_data.get('lastname', '')}".strip()
-                # Als er nog steeds geen naam is, gebruik een standaard
-                if not company:
-                    company = "Client zonder naam"
-            
-            # Update klantgegevens
-            customer.company_name = company
-            customer.vat_number = client_data.get('tax_id', '')
-            customer.first_name = client_data.get('firstname', '')
-            customer.last_name = client_data.get('lastname', '')
-            customer.email = client_data.get('email', '')
-            customer.phone = client_data.get('phonenumber', '')
-            customer.street = client_data.get('address1', '')
-            # house_number blijft onveranderd omdat WHMCS dit niet apart opslaat
-            customer.postal_code = client_data.get('postcode', '')
-            customer.city = client_data.get('city', '')
-            customer.country = client_data.get('country', 'België')
-            customer.customer_type = customer_type
-            customer.whmcs_last_sync = datetime.now()
-            
-            # Sla op in database
-            db.session.commit()
-            return True
-        except Exception as e:
-            db.session.rollback()
-            self.logger.error(f"Error updating customer from WHMCS data: {str(e)}")
-            return False
+                company = "Client zonder naam"
+        
+        now = datetime.now()
+        return {
+            'id': uuid.uuid4(),
+            'workspace_id': workspace_id,
+            'company_name': company,
+            'vat_number': client_data.get('tax_id', ''),
+            'first_name': client_data.get('firstname', ''),
+            'last_name': client_data.get('lastname', ''),
+            'email': client_data.get('email', ''),
+            'phone': client_data.get('phonenumber', ''),
+            'street': client_data.get('address1', ''),
+            'house_number': '',  # WHMCS slaat huisnummer niet apart op
+            'postal_code': client_data.get('postcode', ''),
+            'city': client_data.get('city', ''),
+            'country': client_data.get('country', 'België'),
+            'customer_type': customer_type,
+            'default_vat_rate': 21.0,  # Standaard Belgisch tarief
+            'created_at': now,
+            'whmcs_client_id': int(client_data.get('id')),
+            'synced_from_whmcs': True,
+            'whmcs_last_sync': now,
+            'whmcs_sync_hash': payload_hash
+        }
 
-    def sync_invoices_to_app(self, workspace_id: int, status: str = None) -> Dict:
+    def sync_invoices_to_app(self, workspace_id: int, status: str = None, incremental: bool = True) -> Dict:
         """
         Synchroniseer facturen van WHMCS naar de applicatie
         
+        In incrementele modus worden bestaande facturen overgeslagen als hun
+        WHMCS-wijzigingsdatum (updated_at) vóór het watermerk van de vorige
+        volledige sync ligt, of als hun WHMCS-gegevens dezelfde hash hebben als
+        bij de vorige sync. Voor overgeslagen facturen worden ook geen details
+        opgehaald.
+        
         Args:
             workspace_id: ID van de werkruimte waaraan de facturen moeten worden toegevoegd
             status: Filter op factuurstatus (optioneel)
+            incremental: Ongewijzigde facturen overslaan
         
         Returns:
             Dict: Resultaten van de synchronisatie
         """
         self.logger.info(f"Starting invoice sync from WHMCS to app for workspace {workspace_id}")
+        state = self._start_sync_state(workspace_id, 'invoices')
+        watermark = state.watermark if incremental else None
         
         # Statistieken bijhouden
         stats = {
             'added': 0,
             'updated': 0,
+            'unchanged': 0,
             'failed': 0,
             'no_customer': 0,
             'total': 0
         }
         
-        # Ophalen van facturen van WHMCS
+        # Facturen van WHMCS pagina per pagina verwerken
         # Als er geen status is opgegeven, halen we alle facturen op
-        whmcs_invoices = self.get_invoices(status=status, limit=500)  # Een hoger limiet voor bulksynchronisatie
-        stats['total'] = len(whmcs_invoices)
+        newest = None
+        for whmcs_invoices in self.iter_invoice_pages(status=status):
+            stats['total'] += len(whmcs_invoices)
+            page_newest = self._sync_invoice_page(whmcs_invoices, workspace_id, stats, watermark, incremental)
+            if page_newest and (newest is None or page_newest > newest):
+                newest = page_newest
+            self._update_sync_progress(state, stats)
+        
+        # Het watermerk alleen verschuiven na een volledige sync zonder fouten;
+        # anders zouden niet verwerkte wijzigingen de volgende keer overgeslagen worden
+        advance = newest if not status and not stats['failed'] else None
+        self._finish_sync_state(state, stats, advance)
         
+        self.logger.info(f"Completed WHMCS invoice sync: {stats}")
+        return stats
+
+    def _sync_invoice_page(self, whmcs_invoices: List[Dict], workspace_id: int, stats: Dict,
+                           watermark: datetime = None, incremental: bool = True) -> Optional[datetime]:
+        """
+        Verwerk één pagina WHMCS-facturen
+        
+        Bestaande facturen en klanten van de pagina worden elk met één IN-query
+        opgehaald. Daarna worden de detailgegevens van de gewijzigde facturen
+        parallel opgehaald, worden de facturen in één upsert weggeschreven, de
+        gewijzigde factuuritems in bulk vervangen en wordt de pagina in één keer
+        gecommit. Facturen waarvan de details niet opgehaald konden worden,
+        worden niet weggeschreven en als mislukt geteld.
+        
+        Returns:
+            datetime: Meest recente WHMCS-wijzigingsdatum op deze pagina, of None
+        """
+        records = []
+        newest = None
         for invoice_data in whmcs_invoices:
             try:
                 whmcs_invoice_id = int(invoice_data.get('id'))
                 whmcs_client_id = int(invoice_data.get('userid'))
-                
-                # Haal de klant op uit de app op basis van WHMCS-klant-ID
-                customer = Customer.query.filter_by(
-                    whmcs_client_id=whmcs_client_id,
-                    workspace_id=workspace_id
-                ).first()
-                
-                if not customer:
-                    # Als de klant niet bestaat, slaan we de factuur over
-                    stats['no_customer'] += 1
-                    self.logger.warning(f"Customer not found for WHMCS invoice {whmcs_invoice_id} (WHMCS client ID: {whmcs_client_id})")
-                    continue
-                
-                # Controleer of de factuur al bestaat in de app
-                existing_invoice = Invoice.query.filter_by(
-                    whmcs_invoice_id=whmcs_invoice_id,
-                    workspace_id=workspace_id
-                ).first()
-                
-                # Haal gedetailleerde factuurgegevens op uit WHMCS
-                detailed_invoice = self.get_invoice(whmcs_invoice_id)
-                
-                if existing_invoice:
-                    # Update bestaande factuur
-                    self._update_invoice_from_whmcs(existing_invoice, invoice_data, detailed_invoice)
-                    stats['updated'] += 1
-                    self.logger.debug(f"Updated invoice from WHMCS: {existing_invoice.id} (WHMCS ID: {whmcs_invoice_id})")
-                else:
-                    # Maak nieuwe factuur aan
-                    new_invoice = self._create_invoice_from_whmcs(invoice_data, detailed_invoice, customer, workspace_id)
-                    if new_invoice:
-                        stats['added'] += 1
-                        self.logger.debug(f"Added new invoice from WHMCS: {new_invoice.id} (WHMCS ID: {whmcs_invoice_id})")
-                    else:
-                        stats['failed'] += 1
-                        self.logger.warning(f"Failed to create invoice from WHMCS ID: {whmcs_invoice_id}")
+                updated_at = self._parse_whmcs_datetime(invoice_data.get('updated_at'))
+                if updated_at and (newest is None or updated_at > newest):
+                    newest = updated_at
+                records.append((whmcs_invoice_id, whmcs_client_id, updated_at, invoice_data))
             except Exception as e:
                 stats['failed'] += 1
                 self.logger.error(f"Error syncing WHMCS invoice: {str(e)}")
         
-        self.logger.info(f"Completed WHMCS invoice sync: {stats}")
-        return stats
-
-    def _create_invoice_from_whmcs(self, invoice_data: Dict, detailed_invoice: Dict, customer: Customer, workspace_id: int) -> Optional[Invoice]:
-        """Maak een nieuwe factuur aan op basis van WHMCS-factuurgegevens"""
-        try:
-            # Parse datums
-            date_created = None
-            date_due = None
+        if not records:
+            return newest
+        
+        # Bestaande facturen van deze pagina in één query: WHMCS ID -> (hash, datum, vervaldatum)
+        existing = {
+            row.whmcs_invoice_id: row
+            for row in db.session.query(
+                Invoice.whmcs_invoice_id, Invoice.whmcs_sync_hash, Invoice.date, Invoice.due_date
+            ).filter(
+                Invoice.workspace_id == workspace_id,
+                Invoice.whmcs_invoice_id.in_([record[0] for record in records])
+            )
+        }
+        
+        changed = []
+        for whmcs_invoice_id, whmcs_client_id, updated_at, invoice_data in records:
+            payload_hash = self._payload_hash(invoice_data, INVOICE_HASH_FIELDS)
+            current = existing.get(whmcs_invoice_id)
+            if current and incremental and (
+                (watermark and updated_at and updated_at < watermark)
+                or current.whmcs_sync_hash == payload_hash
+            ):
+                # Niets gewijzigd sinds de vorige sync: geen details ophalen en niets schrijven
+                stats['unchanged'] += 1
+                continue
+            changed.append((whmcs_invoice_id, whmcs_client_id, invoice_data, payload_hash))
+        
+        if not changed:
+            return newest
+        
+        # Klanten van de gewijzigde facturen in één query: WHMCS klant-ID -> klant-ID
+        customers = dict(
+            db.session.query(Customer.whmcs_client_id, Customer.id)
+            .filter(
+                Customer.workspace_id == workspace_id,
+                Customer.whmcs_client_id.in_({record[1] for record in changed})
+            )
+            .all()
+        )
+        
+        pending = []
+        for whmcs_invoice_id, whmcs_client_id, invoice_data, payload_hash in changed:
+            if whmcs_client_id not in customers:
+                # Als de klant niet bestaat, slaan we de factuur over
+                stats['no_customer'] += 1
+                self.logger.warning(f"Customer not found for WHMCS invoice {whmcs_invoice_id} (WHMCS client ID: {whmcs_client_id})")
+                continue
+            pending.append((whmcs_invoice_id, whmcs_client_id, invoice_data, payload_hash))
+        
+        if not pending:
+            return newest
+        
+        # Haal gedetailleerde factuurgegevens op uit WHMCS (parallel)
+        details = self.get_invoices_details([record[0] for record in pending])
+        
+        rows = {}
+        for whmcs_invoice_id, whmcs_client_id, invoice_data, payload_hash in pending:
+            if details.get(whmcs_invoice_id) is None:
+                # Detail-aanroep mislukt (API-fout, timeout, rate limit): niet wegschrijven, anders
+                # zou de nieuwe hash de factuur bij de volgende incrementele sync als ongewijzigd
+                # markeren en worden de items nooit bijgewerkt. Als fout tellen houdt het watermerk tegen.
+                stats['failed'] += 1
+                self.logger.warning(f"No details for WHMCS invoice {whmcs_invoice_id}; will retry on next sync")
+                continue
             try:
-                date_created = datetime.strptime(invoice_data.get('date'), '%Y-%m-%d')
-                date_due = datetime.strptime(invoice_data.get('duedate'), '%Y-%m-%d')
-            except (ValueError, TypeError):
-                # Gebruik huidige datum als fallback
-                date_created = datetime.now()
-                date_due = datetime.now()
-            
-            # Converteer WHMCS-status naar app-status
-            status = self._map_whmcs_status_to_app(invoice_data.get('status'))
-            
-            # Bereken BTW-bedragen
-            amount_incl_vat = float(invoice_data.get('total', 0))
-            vat_rate = 21.0  # Standaard Belgisch tarief
-            
-            # WHMCS slaat bedragen op inclusief BTW
-            # We berekenen het bedrag exclusief BTW en het BTW-bedrag
-            amount_excl_vat = amount_incl_vat / (1 + (vat_rate / 100))
-            vat_amount = amount_incl_vat - amount_excl_vat
-            
-            # Maak nieuw factuurobject
-            invoice = Invoice(
-                id=uuid.uuid4(),
-                workspace_id=workspace_id,
-                customer_id=customer.id,
-                invoice_number=f"WHMCS-{invoice_data.get('invoicenum', invoice_data.get('id'))}",
-                date=date_created.date(),
-                due_date=date_due.date(),
-                invoice_type='income',  # Alle WHMCS-facturen zijn inkomsten
-                amount_excl_vat=amount_excl_vat,
-                amount_incl_vat=amount_incl_vat,
-                vat_rate=vat_rate,
-                vat_amount=vat_amount,
-                status=status,
-                notes=invoice_data.get('notes', ''),
-                created_at=datetime.now(),
-                whmcs_invoice_id=int(invoice_data.get('id')),
-                synced_from_whmcs=True,
-                whmcs_last_sync=datetime.now()
+                rows[whmcs_invoice_id] = self._invoice_values(
+                    invoice_data, customers[whmcs_client_id], workspace_id, payload_hash,
+                    existing.get(whmcs_invoice_id)
+                )
+            except Exception as e:
+                stats['failed'] += 1
+                self.logger.error(f"Error syncing WHMCS invoice {whmcs_invoice_id}: {str(e)}")
+        
+        if not rows:
+            return newest
+        
+        try:
+            written, failed = self._upsert_page(
+                Invoice.__table__, 'whmcs_invoice_id', list(rows.values()), INVOICE_UPDATE_COLUMNS
+            )
+            self._replace_invoice_items(
+                {invoice_id: details.get(whmcs_invoice_id) for invoice_id, whmcs_invoice_id in written}
             )
-            
-            # Sla op in database
-            db.session.add(invoice)
             db.session.commit()
-            
-            # Maak factuuritems aan als gedetailleerde factuurgegevens beschikbaar zijn
-            if detailed_invoice and 'items' in detailed_invoice and 'item' in detailed_invoice['items']:
-                self._create_invoice_items_from_whmcs(invoice, detailed_invoice['items']['item'])
-            
-            return invoice
         except Exception as e:
             db.session.rollback()
-            self.logger.error(f"Error creating invoice from WHMCS data: {str(e)}")
-            return None
+            stats['failed'] += len(rows)
+            self.logger.error(f"Error writing WHMCS invoice page: {str(e)}")
+            return newest
+        
+        for row, error in failed:
+            self.logger.error(f"Error syncing WHMCS invoice {row['whmcs_invoice_id']}: {str(error)}")
+        stats['failed'] += len(failed)
+        
+        added = sum(1 for _, whmcs_invoice_id in written if whmcs_invoice_id not in existing)
+        stats['added'] += added
+        stats['updated'] += len(written) - added
+        self.logger.debug(f"Wrote {len(written)} WHMCS invoices ({added} new) for workspace {workspace_id}")
+        
+        return newest
 
-    def _update_invoice_from_whmcs(self, invoice: Invoice, invoice_data: Dict, detailed_invoice: Dict) -> bool:
-        """Update een bestaande factuur met WHMCS-factuurgegevens"""
+    def _invoice_values(self, invoice_data: Dict, customer_id, workspace_id: int, payload_hash: str,
+                        current=None) -> Dict:
+        """
+        Map WHMCS-factuurgegevens naar de kolommen van een factuur
+        
+        Args:
+            invoice_data: Factuur uit GetInvoices
+            customer_id: ID van de klant in de app
+            workspace_id: ID van de werkruimte
+            payload_hash: Hash van de WHMCS-gegevens
+            current: Bestaande factuur (met date en due_date) of None
+        
+        Returns:
+            Dict: Kolomwaarden voor de upsert
+        """
+        # Parse datums
         try:
-            # Parse datums
-            date_created = None
-            date_due = None
-            try:
-                date_created = datetime.strptime(invoice_data.get('date'), '%Y-%m-%d')
-                date_due = datetime.strptime(invoice_data.get('duedate'), '%Y-%m-%d')
-            except (ValueError, TypeError):
-                # Gebruik huidige datums als fallback
-                date_created = invoice.date or datetime.now()
-                date_due = invoice.due_date or datetime.now()
-            
-            # Converteer WHMCS-status naar app-status
-            status = self._map_whmcs_status_to_app(invoice_data.get('status'))
-            
-            # Bereken BTW-bedragen
-            amount_incl_vat = float(invoice_data.get('total', 0))
-            vat_rate = 21.0  # Standaard Belgisch tarief
-            
-            # WHMCS slaat bedragen op inclusief BTW
-            # We berekenen het bedrag exclusief BTW en het BTW-bedrag
-            amount_excl_vat = amount_incl_vat / (1 + (vat_rate / 100))
-            vat_amount = amount_incl_vat - amount_excl_vat
-            
-            # Update factuurgegevens
-            invoice.date = date_created.date()
-            invoice.due_date = date_due.date()
-            invoice.amount_excl_vat = amount_excl_vat
-            invoice.amount_incl_vat = amount_incl_vat
-            invoice.vat_rate = vat_rate
-            invoice.vat_amount = vat_amount
-            invoice.status = status
-            invoice.notes = invoice_data.get('notes', '')
-            invoice.whmcs_last_sync = datetime.now()
-            
-            # Sla op in database
-            db.session.commit()
-            
-            # Update factuuritems als gedetailleerde factuurgegevens beschikbaar zijn
-            if detailed_invoice and 'items' in detailed_invoice and 'item' in detailed_invoice['items']:
-                # Verwijder bestaande items en maak nieuwe aan
-                InvoiceItem.query.filter_by(invoice_id=invoice.id).delete()
-                self._create_invoice_items_from_whmcs(invoice, detailed_invoice['items']['item'])
-            
-            return True
-        except Exception as e:
-            db.session.rollback()
-            self.logger.error(f"Error updating invoice from WHMCS data: {str(e)}")
-            return False
+            date_created = datetime.strptime(invoice_data.get('date'), '%Y-%m-%d').date()
+            date_due = datetime.strptime(invoice_data.get('duedate'), '%Y-%m-%d').date()
+        except (ValueError, TypeError):
+            # Gebruik de huidige datums van de factuur, of vandaag als fallback
+            today = datetime.now().date()
+            date_created = (current.date if current else None) or today
+            date_due = (current.due_date if current else None) or today
+        
+        # Converteer WHMCS-status naar app-status
+        status = self._map_whmcs_status_to_app(invoice_data.get('status'))
+        
+        # Bereken BTW-bedragen
+        amount_incl_vat = float(invoice_data.get('total', 0))
+        vat_rate = 21.0  # Standaard Belgisch tarief
+        
+        # WHMCS slaat bedragen op inclusief BTW
+        # We berekenen het bedrag exclusief BTW en het BTW-bedrag
+        amount_excl_vat = amount_incl_vat / (1 + (vat_rate / 100))
+        vat_amount = amount_incl_vat - amount_excl_vat
+        
+        now = datetime.now()
+        return {
+            'id': uuid.uuid4(),
+            'workspace_id': workspace_id,
+            'customer_id': customer_id,
+            # Het factuurnummer wordt alleen bij het aanmaken gezet (niet in INVOICE_UPDATE_COLUMNS)
+            'invoice_number': f"WHMCS-{invoice_data.get('invoicenum') or invoice_data.get('id')}",
+            'date': date_created,
+            'due_date': date_due,
+            'invoice_type': 'income',  # Alle WHMCS-facturen zijn inkomsten
+            'amount_excl_vat': amount_excl_vat,
+            'amount_incl_vat': amount_incl_vat,
+            'vat_rate': vat_rate,
+            'vat_amount': vat_amount,
+            'status': status,
+            'notes': invoice_data.get('notes', ''),
+            'created_at': now,
+            'whmcs_invoice_id': int(invoice_data.get('id')),
+            'synced_from_whmcs': True,
+            'whmcs_last_sync': now,
+            'whmcs_sync_hash': payload_hash
+        }
 
-    def _create_invoice_items_from_whmcs(self, invoice: Invoice, items_data: List[Dict]) -> None:
-        """Maak factuuritems aan op basis van WHMCS-factuuritemgegevens"""
-        # Normaliseer naar een lijst als het een enkele item is
-        if isinstance(items_data, dict):
-            items_data = [items_data]
+    def _replace_invoice_items(self, details_by_invoice: Dict) -> None:
+        """
+        Vervang de factuuritems van facturen waarvan de WHMCS-items gewijzigd zijn
+        
+        De huidige items worden met één query geladen en vergeleken op
+        omschrijving en bedrag; gewijzigde facturen krijgen één DELETE ... IN en
+        één bulk-INSERT. Er wordt niet gecommit.
         
-        for item_data in items_data:
+        Args:
+            details_by_invoice: Factuur-ID in de app -> GetInvoice-resultaat (of None)
+        """
+        new_items = {}
+        for invoice_id, detailed_invoice in details_by_invoice.items():
+            # Alleen als gedetailleerde factuurgegevens met items beschikbaar zijn
+            items = detailed_invoice.get('items') if detailed_invoice else None
+            if isinstance(items, dict) and 'item' in items:
+                new_items[invoice_id] = self._invoice_item_values(invoice_id, items['item'])
+        
+        if not new_items:
+            return
+        
+        current_items = {}
+        for invoice_id, description, unit_price in db.session.query(
+            InvoiceItem.invoice_id, InvoiceItem.description, InvoiceItem.unit_price
+        ).filter(InvoiceItem.invoice_id.in_(list(new_items))):
+            current_items.setdefault(invoice_id, []).append((description or '', round(unit_price or 0, 2)))
+        
+        changed = [
+            invoice_id for invoice_id, items in new_items.items()
+            if sorted((item['description'], round(item['unit_price'], 2)) for item in items)
+            != sorted(current_items.get(invoice_id, []))
+        ]
+        if not changed:
+            return
+        
+        # Verwijder bestaande items en maak nieuwe aan
+        db.session.execute(InvoiceItem.__table__.delete().where(InvoiceItem.__table__.c.invoice_id.in_(changed)))
+        rows = [item for invoice_id in changed for item in new_items[invoice_id]]
+        if rows:
+            db.session.execute(InvoiceItem.__table__.insert(), rows)
+
+    def _invoice_item_values(self, invoice_id, items_data) -> List[Dict]:
+        """Map WHMCS-factuuritems naar de kolommen van factuuritems"""
+        rows = []
+        for item_data in self._as_list(items_data):
             try:
-                description = item_data.get('description', '')
                 amount = float(item_data.get('amount', 0))
                 
-                # WHMCS houdt geen aparte hoeveelheid bij, we gaan uit van 1
-                quantity = 1.0
-                
-                # WHMCS slaat bedragen op inclusief BTW
-                # We berekenen de eenheidsprijs exclusief BTW
+                # WHMCS slaat bedragen op inclusief BTW en houdt geen aparte
+                # hoeveelheid bij; we gaan uit van 1 en rekenen de eenheidsprijs
+                # exclusief BTW uit
                 vat_rate = 21.0  # Standaard Belgisch tarief
-                unit_price = amount / (1 + (vat_rate / 100))
-                
-                # Maak nieuw factuuritem aan
-                invoice_item = InvoiceItem(
-                    id=uuid.uuid4(),
-                    invoice_id=invoice.id,
-                    description=description,
-                    quantity=quantity,
-                    unit_price=unit_price,
-                    vat_rate=vat_rate,
-                    created_at=datetime.now()
-                )
-                
-                db.session.add(invoice_item)
+                rows.append({
+                    'id': uuid.uuid4(),
+                    'invoice_id': invoice_id,
+                    'description': item_data.get('description', ''),
+                    'quantity': 1.0,
+                    'unit_price': amount / (1 + (vat_rate / 100)),
+                    'vat_rate': vat_rate,
+                    'created_at': datetime.now()
+                })
             except Exception as e:
                 self.logger.error(f"Error creating invoice item from WHMCS data: {str(e)}")
-        
-        db.session.commit()
+        return rows
 
     def _map_whmcs_status_to_app(self, whmcs_status: str) -> str:
         """
@@ -0,0 +1,257 @@
+"""
+Achtergrondsynchronisatie met WHMCS.
+
+Synchronisaties draaien niet in het HTTP-request (een volledige sync kan
+langer duren dan de gunicorn-timeout) maar op één achtergrondthread per proces:
+
+- Handmatige syncs vanaf het WHMCS-dashboard worden in een wachtrij gezet;
+  het dashboard volgt de voortgang via /admin/whmcs/sync/status.
+- Als automatisch synchroniseren aan staat, worden klanten en daarna facturen
+  gesynchroniseerd voor elke werkruimte die al eens gesynchroniseerd is,
+  zodra de vorige sync ouder is dan WHMCS_AUTO_SYNC_INTERVAL seconden.
+- Tijdens een sync wordt een PostgreSQL advisory lock op de werkruimte
+  gehouden, zodat twee gunicorn-workers nooit tegelijk dezelfde werkruimte
+  synchroniseren.
+
+Voortgang en resultaat staan in whmcs_sync_state en zijn daardoor in alle
+workers zichtbaar.
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from database import db
+
+# Logger voor deze module
+logger = logging.getLogger(__name__)
+
+# Minimale tijd tussen twee automatische syncs van een werkruimte (0 = uitgeschakeld)
+WHMCS_AUTO_SYNC_INTERVAL = int(os.environ.get('WHMCS_AUTO_SYNC_INTERVAL', 86400))
+
+# Hoe vaak de achtergrondthread controleert of een automatische sync nodig is
+WHMCS_SYNC_POLL_SECONDS = int(os.environ.get('WHMCS_SYNC_POLL_SECONDS', 300))
+
+# Eerste sleutel van de advisory lock ('WHMC'); de tweede sleutel is het werkruimte-ID
+ADVISORY_LOCK_NAMESPACE = 0x57484D43
+
+# Volgorde van een volledige sync: facturen hebben de klanten nodig
+SYNC_ENTITIES = ('clients', 'invoices')
+
+
+class WhmcsSyncRunner:
+    """Voert WHMCS-syncs uit op een achtergrondthread"""
+
+    def __init__(self, interval=None, poll_seconds=None):
+        """
+        Args:
+            interval: Seconden tussen automatische syncs (standaard WHMCS_AUTO_SYNC_INTERVAL)
+            poll_seconds: Seconden tussen twee controles (standaard WHMCS_SYNC_POLL_SECONDS)
+        """
+        self.interval = interval if interval is not None else WHMCS_AUTO_SYNC_INTERVAL
+        self.poll_seconds = poll_seconds or WHMCS_SYNC_POLL_SECONDS
+        self._app = None
+        self._thread = None
+        self._queue = queue.Queue()
+        self._pending = set()   # Werkruimtes met een sync in de wachtrij of bezig (dit proces)
+        self._lock = threading.Lock()
+
+    def start(self, app):
+        """
+        Start de achtergrondthread (opnieuw, als die na een fork niet meer bestaat)
+
+        Args:
+            app: Flask applicatie
+        """
+        with self._lock:
+            self._app = app
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='whmcs-sync', daemon=True)
+            self._thread.start()
+        logger.info("WHMCS-synchronisatie op de achtergrond gestart")
+
+    def submit(self, workspace_id, entities=SYNC_ENTITIES, status=None, incremental=True):
+        """
+        Zet een sync voor een werkruimte in de wachtrij
+
+        Args:
+            workspace_id: ID van de werkruimte
+            entities: 'clients' en/of 'invoices', in volgorde van uitvoeren
+            status: Filter op factuurstatus (optioneel)
+            incremental: Ongewijzigde records overslaan
+
+        Returns:
+            bool: False als er voor deze werkruimte al een sync wacht of loopt
+        """
+        from flask import current_app
+
+        self.start(current_app._get_current_object())
+        if self.is_locked(workspace_id):
+            return False
+        with self._lock:
+            if workspace_id in self._pending:
+                return False
+            self._pending.add(workspace_id)
+        self._queue.put({
+            'workspace_id': workspace_id,
+            'entities': tuple(entities),
+            'status': status,
+            'incremental': incremental
+        })
+        return True
+
+    def is_locked(self, workspace_id):
+        """Of een proces de advisory lock van deze werkruimte vasthoudt (er loopt een sync)"""
+        return bool(db.session.execute(
+            text("""
+                SELECT EXISTS (
+                    SELECT 1 FROM pg_locks
+                    WHERE locktype = 'advisory' AND classid = :namespace AND objid = :workspace_id
+                      AND objsubid = 2 AND granted
+                )
+            """),
+            {'namespace': ADVISORY_LOCK_NAMESPACE, 'workspace_id': workspace_id}
+        ).scalar())
+
+    def get_status(self, workspace_id):
+        """
+        Geef de voortgang en de laatste resultaten van een werkruimte
+
+        Args:
+            workspace_id: ID van de werkruimte
+
+        Returns:
+            dict: running, queued en per soort ('clients', 'invoices') de syncstatus
+        """
+        from models import WhmcsSyncState
+
+        with self._lock:
+            queued = workspace_id in self._pending
+        states = {}
+        for state in WhmcsSyncState.query.filter_by(workspace_id=workspace_id):
+            data = state.to_dict()
+            # Lokale tijden leesbaar doorgeven (jsonify zou ze als GMT weergeven)
+            for key in ('watermark', 'last_started', 'last_finished'):
+                if data[key]:
+                    data[key] = data[key].strftime('%Y-%m-%d %H:%M:%S')
+            states[state.entity] = data
+        return {
+            'running': self.is_locked(workspace_id),
+            'queued': queued,
+            'entities': {entity: states.get(entity) for entity in SYNC_ENTITIES}
+        }
+
+    def _run(self):
+        next_check = time.monotonic()
+        while True:
+            try:
+                job = self._queue.get(timeout=max(0, next_check - time.monotonic()))
+            except queue.Empty:
+                job = None
+
+            with self._app.app_context():
+                try:
+                    if job:
+                        self._run_job(**job)
+                    else:
+                        next_check = time.monotonic() + self.poll_seconds
+                        self._run_scheduled()
+                except Exception as e:
+                    logger.error(f"Fout in WHMCS-synchronisatie op de achtergrond: {str(e)}")
+                finally:
+                    if job:
+                        with self._lock:
+                            self._pending.discard(job['workspace_id'])
+
+    def _run_scheduled(self):
+        """Start de automatische syncs die aan de beurt zijn"""
+        from models import SystemSettings, WhmcsSyncState
+
+        if not self.interval:
+            return
+        settings = SystemSettings.query.filter_by(key='whmcs_integration').first()
+        if not settings or not settings.whmcs_auto_sync:
+            return
+
+        workspace_ids = [row[0] for row in db.session.query(WhmcsSyncState.workspace_id).distinct()]
+        for workspace_id in workspace_ids:
+            with self._lock:
+                if workspace_id in self._pending:
+                    continue
+            if self._is_due(workspace_id):
+                self._run_job(workspace_id, SYNC_ENTITIES, scheduled=True)
+
+    def _is_due(self, workspace_id):
+        """
+        Of de laatste sync van een werkruimte langer dan het interval geleden gestart is.
+        Een mislukte sync wordt zo ook pas na het interval opnieuw geprobeerd.
+        """
+        from models import WhmcsSyncState
+
+        started = {
+            state.entity: state.last_started
+            for state in WhmcsSyncState.query.filter_by(workspace_id=workspace_id)
+        }
+        threshold = datetime.now() - timedelta(seconds=self.interval)
+        return any(started.get(entity) is None or started[entity] < threshold for entity in SYNC_ENTITIES)
+
+    def _run_job(self, workspace_id, entities, status=None, incremental=True, scheduled=False):
+        """
+        Voer een sync uit onder de advisory lock van de werkruimte
+
+        Returns:
+            bool: Of de sync uitgevoerd is
+        """
+        from whmcs_service import WHMCSService
+        from models import SystemSettings, WhmcsSyncState
+
+        params = {'namespace': ADVISORY_LOCK_NAMESPACE, 'workspace_id': workspace_id}
+        # De lock hoort bij de databaseverbinding; die blijft open zolang de sync loopt
+        with db.engine.connect() as conn:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(:namespace, :workspace_id)"), params).scalar()
+            conn.commit()
+            if not locked:
+                logger.info(f"WHMCS-sync voor werkruimte {workspace_id} overgeslagen: loopt al in een ander proces")
+                return False
+
+            try:
+                # Een andere worker kan net klaar zijn; opnieuw controleren met de lock in handen
+                if scheduled and not self._is_due(workspace_id):
+                    return False
+
+                service = WHMCSService()
+                if not service.is_configured():
+                    logger.warning(f"WHMCS-sync voor werkruimte {workspace_id} overgeslagen: API niet geconfigureerd")
+                    return False
+
+                logger.info(f"WHMCS-sync gestart voor werkruimte {workspace_id}: {', '.join(entities)}"
+                            f"{' (automatisch)' if scheduled else ''}")
+                for entity in entities:
+                    try:
+                        if entity == 'clients':
+                            service.sync_clients_to_app(workspace_id, incremental=incremental)
+                        else:
+                            service.sync_invoices_to_app(workspace_id, status, incremental=incremental)
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"WHMCS-sync van {entity} voor werkruimte {workspace_id} mislukt: {str(e)}")
+                        state = WhmcsSyncState.get_or_create(workspace_id, entity)
+                        state.last_error = str(e)
+                        db.session.commit()
+
+                # Update laatste synchronisatietijd
+                settings = SystemSettings.query.filter_by(key='whmcs_integration').first()
+                if settings:
+                    settings.whmcs_last_sync = datetime.now()
+                    db.session.commit()
+                return True
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:namespace, :workspace_id)"), params)
+                conn.commit()
+
+
+# Singleton instantie
+whmcs_sync_runner = WhmcsSyncRunner()